@@ -1,15 +1,56 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from fastapi.responses import Response
-from typing import List, Optional
+from fastapi.responses import Response, FileResponse, StreamingResponse
+from typing import List, Optional, Dict, Any
 from bson import ObjectId
+import logging
+import os
 
 from app.models.photo import PhotoMetadata
 from app.models.user import User
 from app.api.auth import get_current_user
 from app.config.database import photos_collection
+from app.services.image_compressor import DEFAULT_RENDITION, MEDIA_TYPES, RENDITIONS
+from app.services.blob_store import PHOTO_BLOB_EXCLUSION, blob_reference_query, blob_store_for
+from app.services.embedding_store import (
+    EMBEDDING_FIELDS,
+    EXPORT_IDS_FILE,
+    EXPORT_MATRIX_FILE,
+    embedding_to_list,
+    export_user_embeddings,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 列表类查询不返回嵌入向量和图片数据，避免在每个响应中传输和序列化大字段
+LIST_PROJECTION = {
+    **{f"features.{field}": 0 for field in EMBEDDING_FIELDS},
+    **PHOTO_BLOB_EXCLUSION,
+}
+
+# 嵌入矩阵导出目录
+EMBEDDING_EXPORT_DIR = os.getenv("EMBEDDING_EXPORT_DIR", "/app/data/embeddings")
+
+
+def _serialize_features(features: Optional[Dict[str, Any]], include_embeddings: bool) -> Optional[Dict[str, Any]]:
+    """
+    将存储的特征转换为响应格式
+
+    Args:
+        features: 数据库中的特征字典（嵌入字段为二进制或旧版列表）
+        include_embeddings: 是否解码并返回嵌入向量
+
+    Returns:
+        特征字典
+    """
+    if not features:
+        return features
+    serialized = dict(features)
+    for field in EMBEDDING_FIELDS:
+        serialized[field] = embedding_to_list(features.get(field)) if include_embeddings else None
+    return serialized
+
 
 @router.get("/", response_model=List[PhotoMetadata])
 async def get_images(
@@ -47,7 +88,7 @@ async def get_images(
     
     # 查询记录
     images = []
-    async for image in photos_collection.find(query).sort("created_at", -1).skip(skip).limit(limit):
+    async for image in photos_collection.find(query, LIST_PROJECTION).sort("created_at", -1).skip(skip).limit(limit):
         # 构建图片字典
         image_dict = {
             "id": str(image["_id"]),
@@ -62,7 +103,7 @@ async def get_images(
             "is_screenshot": image.get("is_screenshot", False),
             "is_download": image.get("is_download", False),
             "image_hash": image.get("image_hash"),
-            "features": image.get("features"),
+            "features": _serialize_features(image.get("features"), include_embeddings=False),
             "compressed_info": image.get("compressed_info"),
             "original_size": image.get("original_size", 0),
             "created_at": image.get("created_at"),
@@ -73,6 +114,61 @@ async def get_images(
     return images
 
 
+@router.get("/embeddings/export")
+async def export_embeddings(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    导出当前用户的全部视觉嵌入向量
+
+    Args:
+        current_user: 当前用户
+
+    Returns:
+        .npy嵌入矩阵；行顺序对应的照片ID通过X-Embedding-Version指向的
+        /embeddings/export/{version}/photo_ids获取
+    """
+    version_dir, count = await export_user_embeddings(
+        photos_collection,
+        current_user.id,
+        os.path.join(EMBEDDING_EXPORT_DIR, current_user.id),
+    )
+
+    return FileResponse(
+        path=str(version_dir / EXPORT_MATRIX_FILE),
+        media_type="application/octet-stream",
+        filename=f"{version_dir.name}.npy",
+        headers={"X-Embedding-Count": str(count), "X-Embedding-Version": version_dir.name}
+    )
+
+
+@router.get("/embeddings/export/{version}/photo_ids")
+async def export_embedding_photo_ids(
+    version: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取导出的嵌入矩阵行顺序对应的照片ID
+
+    Args:
+        version: 导出响应中的X-Embedding-Version
+        current_user: 当前用户
+
+    Returns:
+        照片ID列表（JSON）
+    """
+    user_dir = os.path.join(EMBEDDING_EXPORT_DIR, current_user.id)
+    ids_path = os.path.join(user_dir, version, EXPORT_IDS_FILE)
+    if os.path.dirname(os.path.dirname(os.path.abspath(ids_path))) != os.path.abspath(user_dir) \
+            or not os.path.isfile(ids_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="导出版本不存在或已过期"
+        )
+
+    return FileResponse(path=ids_path, media_type="application/json")
+
+
 @router.get("/{image_id}", response_model=PhotoMetadata)
 async def get_image(
     image_id: str,
@@ -89,7 +185,7 @@ async def get_image(
         图片详情
     """
     # 查询图片
-    image = await photos_collection.find_one({"_id": ObjectId(image_id)})
+    image = await photos_collection.find_one({"_id": ObjectId(image_id)}, PHOTO_BLOB_EXCLUSION)
     if not image:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -117,7 +213,7 @@ async def get_image(
         "is_screenshot": image.get("is_screenshot", False),
         "is_download": image.get("is_download", False),
         "image_hash": image.get("image_hash"),
-        "features": image.get("features"),
+        "features": _serialize_features(image.get("features"), include_embeddings=True),
         "compressed_info": image.get("compressed_info"),
         "original_size": image.get("original_size", 0),
         "created_at": image.get("created_at"),
@@ -157,7 +253,7 @@ async def get_images_batch(
     
     # 查询图片
     images = []
-    async for image in photos_collection.find({"_id": {"$in": object_ids}}):
+    async for image in photos_collection.find({"_id": {"$in": object_ids}}, LIST_PROJECTION):
         # 检查权限
         if image["user_id"] != current_user.id:
             continue
@@ -176,7 +272,7 @@ async def get_images_batch(
             "is_screenshot": image.get("is_screenshot", False),
             "is_download": image.get("is_download", False),
             "image_hash": image.get("image_hash"),
-            "features": image.get("features"),
+            "features": _serialize_features(image.get("features"), include_embeddings=False),
             "compressed_info": image.get("compressed_info"),
             "original_size": image.get("original_size", 0),
             "created_at": image.get("created_at"),
@@ -202,8 +298,11 @@ async def delete_image(
     Returns:
         删除结果
     """
-    # 查询图片
-    image = await photos_collection.find_one({"_id": ObjectId(image_id)})
+    # 查询图片（只取衍生图的存储引用，不读取内嵌图片数据）
+    image = await photos_collection.find_one(
+        {"_id": ObjectId(image_id)},
+        {"user_id": 1, **{f"renditions.{name}.blob": 1 for name in RENDITIONS}},
+    )
     if not image:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -219,6 +318,27 @@ async def delete_image(
     
     # 执行删除
     await photos_collection.delete_one({"_id": ObjectId(image_id)})
+
+    # 删除图片存储中的衍生图数据（数据按内容寻址，仍被其他照片引用时保留）
+    renditions = image.get("renditions") or {}
+    blobs = {
+        rendition["blob"]["key"]: rendition["blob"]
+        for rendition in renditions.values()
+        if rendition.get("blob")
+    }
+    for blob in blobs.values():
+        query = blob_reference_query(blob, renditions)
+        store = blob_store_for(blob)
+        try:
+            if await photos_collection.count_documents(query, limit=1):
+                continue
+            data = await store.get(blob)
+            await store.delete(blob)
+            # 删除期间有新照片引用了相同内容（写入方此前看到数据已存在）时恢复数据
+            if await photos_collection.count_documents(query, limit=1):
+                await store.put(data)
+        except Exception as e:
+            logger.warning(f"删除图片数据失败: {e}")
     
     return {"message": "图片删除成功"}
 
@@ -226,6 +346,7 @@ async def delete_image(
 @router.get("/data/{image_id}")
 async def get_image_data(
     image_id: str,
+    size: Optional[str] = Query(None, description="衍生图尺寸，如 thumb / gemini / 1080p，默认1080p"),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -233,13 +354,31 @@ async def get_image_data(
     
     Args:
         image_id: 图片ID
+        size: 衍生图尺寸名称
         current_user: 当前用户
     
     Returns:
         图片二进制数据
     """
-    # 查询图片
-    image = await photos_collection.find_one({"_id": ObjectId(image_id)})
+    rendition_name = size or DEFAULT_RENDITION
+    if rendition_name not in RENDITIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支持的图片尺寸: {rendition_name}"
+        )
+
+    # 查询图片（只读取所需尺寸的数据）
+    image = await photos_collection.find_one(
+        {"_id": ObjectId(image_id)},
+        {
+            "user_id": 1,
+            "filename": 1,
+            "compressed_info.format": 1,
+            f"renditions.{rendition_name}": 1,
+            f"renditions.{DEFAULT_RENDITION}": 1,
+            "compressed_image_data": 1,
+        }
+    )
     if not image:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -253,26 +392,40 @@ async def get_image_data(
             detail="无权访问其他用户的图片"
         )
     
-    # 获取图片数据（只使用压缩后的图片）
-    image_data = image.get("compressed_image_data")
+    # 获取图片数据（所需尺寸缺失时依次回退到默认尺寸、旧版内嵌数据）
+    renditions = image.get("renditions") or {}
+    rendition = renditions.get(rendition_name) or renditions.get(DEFAULT_RENDITION) or {}
+    image_format = rendition.get("format") or (image.get("compressed_info") or {}).get("format")
+    media_type = MEDIA_TYPES.get((image_format or "").lower(), "image/webp")
+    headers = {"Cache-Control": "private, max-age=86400"}
+
+    # 图片存储中的数据流式返回
+    blob = rendition.get("blob")
+    if blob:
+        chunks = blob_store_for(blob).stream(blob)
+        # 先读取第一块，数据缺失时返回404而不是中断的响应
+        try:
+            first_chunk = await chunks.__anext__()
+        except (FileNotFoundError, StopAsyncIteration):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="图片数据不存在"
+            )
+
+        async def body():
+            yield first_chunk
+            async for chunk in chunks:
+                yield chunk
+
+        headers["Content-Length"] = str(blob["size"])
+        return StreamingResponse(body(), media_type=media_type, headers=headers)
+
+    image_data = rendition.get("data") or image.get("compressed_image_data")
     if not image_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="图片数据不存在"
         )
     
-    # 确定MIME类型
-    filename = image.get("filename", "image.jpg")
-    if filename.lower().endswith(".jpg") or filename.lower().endswith(".jpeg"):
-        media_type = "image/jpeg"
-    elif filename.lower().endswith(".png"):
-        media_type = "image/png"
-    elif filename.lower().endswith(".gif"):
-        media_type = "image/gif"
-    elif filename.lower().endswith(".webp"):
-        media_type = "image/webp"
-    else:
-        media_type = "image/jpeg"
-    
     # 返回图片数据
-    return Response(content=image_data, media_type=media_type)
+    return Response(content=bytes(image_data), media_type=media_type, headers=headers)
@@ -1,16 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Body
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Body, Request
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from datetime import datetime
 from bson import ObjectId
+import asyncio
+import json
 
 from app.models.memory import MemoryRecord, MemoryRecordCreate
 from app.models.user import User
 from app.api.auth import get_current_user
 from app.config.database import memory_records_collection, users_collection
 from app.services.memory_analyzer import MemoryAnalyzer
+from app.services.analysis_progress import get_progress, open_progress
 
 router = APIRouter()
 
+# 分析进行中的状态（SSE连接保持到状态离开这些值）
+ACTIVE_STATUSES = {"pending", "processing"}
+# 本进程内没有进度通道时，从记录读取检查点的间隔（秒）
+SSE_POLL_INTERVAL = 2.0
+
 
 @router.get("/records", response_model=List[MemoryRecord])
 async def get_memory_records(
@@ -74,6 +83,11 @@ async def create_memory_record(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="无权为其他用户创建记忆记录"
         )
+    if record_create.phase1_mode not in (None, "realtime", "batch"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="phase1_mode 只能是 realtime 或 batch"
+        )
     
     # 创建记录
     record_data = {
@@ -88,7 +102,8 @@ async def create_memory_record(
         "updated_at": datetime.utcnow(),
         "completed_at": None,
         "image_count": 0,
-        "time_range": None
+        "time_range": None,
+        "phase1_mode": record_create.phase1_mode
     }
     
     # 插入数据库
@@ -141,12 +156,107 @@ async def get_memory_record(
         "image_count": record.get("image_count", 0),
         "time_range": record.get("time_range"),
         "stats": record.get("stats"),
-        "used_photos": record.get("used_photos", [])
+        "used_photos": record.get("used_photos", []),
+        "partial_results": record.get("partial_results")
     }
     
     return MemoryRecord(**record_dict)
 
 
+def _sse(event: str, data: dict) -> str:
+    """编码一条server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@router.get("/records/{record_id}/events")
+async def stream_memory_record_events(
+    record_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    以server-sent events推送分析进度
+
+    先发送snapshot（状态与已有的部分结果），之后推送stage/partial事件，
+    分析结束时发送status事件（最终状态）并关闭连接。分析在其他进程中
+    执行时，按SSE_POLL_INTERVAL从记录读取检查点。
+    """
+    record = await memory_records_collection.find_one(
+        {"_id": ObjectId(record_id)},
+        {"user_id": 1, "status": 1, "partial_results": 1}
+    )
+    if not record:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="记忆记录不存在"
+        )
+
+    # 检查权限
+    if record["user_id"] != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无权访问其他用户的记忆记录"
+        )
+
+    async def events():
+        progress = get_progress(record_id)
+        queue = progress.subscribe() if progress else None
+        try:
+            current_status = record["status"]
+            partial_results = record.get("partial_results") or {}
+            snapshot = progress.snapshot() if progress else {"stage": {}, "partial_results": partial_results}
+            yield _sse("snapshot", {"status": current_status, **snapshot})
+
+            while current_status in ACTIVE_STATUSES:
+                if await request.is_disconnected():
+                    return
+                if queue is not None:
+                    try:
+                        event = await asyncio.wait_for(queue.get(), SSE_POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        yield ": keepalive\n\n"
+                        continue
+                    if event["type"] != "done":
+                        yield _sse(event["type"], event)
+                        continue
+                    progress.unsubscribe(queue)
+                    progress = queue = None
+                else:
+                    await asyncio.sleep(SSE_POLL_INTERVAL)
+
+                latest = await memory_records_collection.find_one(
+                    {"_id": ObjectId(record_id)},
+                    {"status": 1, "partial_results": 1}
+                )
+                if not latest:
+                    return
+                current_status = latest["status"]
+                if current_status not in ACTIVE_STATUSES:
+                    break
+
+                progress = get_progress(record_id)
+                if progress is not None:
+                    # 分析在本进程中开始（如pending -> processing），改为实时推送
+                    queue = progress.subscribe()
+                    yield _sse("snapshot", {"status": current_status, **progress.snapshot()})
+                elif (latest.get("partial_results") or {}) != partial_results:
+                    partial_results = latest.get("partial_results") or {}
+                    yield _sse("snapshot", {
+                        "status": current_status, "stage": {}, "partial_results": partial_results
+                    })
+
+            yield _sse("status", {"status": current_status})
+        finally:
+            if progress is not None and queue is not None:
+                progress.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.put("/records/{record_id}/reanalyze")
 async def reanalyze_memory_record(
     record_id: str,
@@ -451,18 +561,21 @@ async def execute_memory_analysis(record_id: str, user_id: str, prompt_group_id:
         global logger
         logger = logging.getLogger(__name__)
     
+    # 进度通道（SSE推送流式结果，定期写入partial_results）
+    progress = open_progress(record_id)
     try:
         # 将字符串转换为 ObjectId
         from bson import ObjectId
         record_object_id = ObjectId(record_id)
         
-        # 更新状态为处理中
+        # 更新状态为处理中，清除上次分析的部分结果
         await memory_records_collection.update_one(
             {"_id": record_object_id},
             {"$set": {
                 "status": "processing",
                 "updated_at": datetime.utcnow()
-            }}
+            },
+            "$unset": {"partial_results": ""}}
         )
         
         # 获取用户信息
@@ -494,6 +607,12 @@ async def execute_memory_analysis(record_id: str, user_id: str, prompt_group_id:
         
         # 执行分析
         analyzer = MemoryAnalyzer()
+        analyzer.progress = progress
+        # 批处理任务状态保存在记录中，重新分析时继续未完成的任务
+        analyzer.record_id = record_id
+        record = await memory_records_collection.find_one({"_id": record_object_id}, {"phase1_mode": 1})
+        if record and record.get("phase1_mode"):
+            analyzer.phase1_mode = record["phase1_mode"]
         try:
             phase1_results, phase2_result, image_count, time_range, stats, used_photos = await analyzer.analyze(
                 user_id=user_id,
@@ -569,7 +688,8 @@ async def execute_memory_analysis(record_id: str, user_id: str, prompt_group_id:
                 "used_photos": used_photos,
                 "completed_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow()
-            }}
+            },
+            "$unset": {"partial_results": ""}}
         )
         print(f"更新结果 - matched_count: {update_result.matched_count}, modified_count: {update_result.modified_count}")
         
@@ -586,3 +706,5 @@ async def execute_memory_analysis(record_id: str, user_id: str, prompt_group_id:
             }}
         )
         print(f"分析失败: {e}")
+    finally:
+        await progress.close()
@@ -24,6 +24,9 @@ prompts_collection = async_db["prompts"]
 memory_records_collection = async_db["memory_records"]
 photo_metadata_collection = async_db["photo_metadata"]
 photos_collection = async_db["photos"]
+feature_cache_collection = async_db["feature_cache"]
+scene_clusters_collection = async_db["scene_clusters"]
+phase1_cache_collection = async_db["phase1_cache"]
 
 # 索引创建
 async def create_indexes():
@@ -49,3 +52,22 @@ async def create_indexes():
     await photos_collection.create_index("user_id")
     await photos_collection.create_index("image_hash", unique=True)
     await photos_collection.create_index("created_at")
+    await photos_collection.create_index([("user_id", 1), ("scene_cluster", 1)])
+    # 删除照片时检查衍生图数据是否仍被其他照片引用
+    from app.services.image_compressor import RENDITIONS
+    for name in RENDITIONS:
+        await photos_collection.create_index(f"renditions.{name}.blob.key", sparse=True)
+
+    # 特征缓存集合索引
+    await feature_cache_collection.create_index("image_hash", unique=True)
+    await feature_cache_collection.create_index("model_version")
+
+    # 场景聚类集合索引
+    await scene_clusters_collection.create_index("user_id", unique=True)
+
+    # Phase 1 结果缓存索引（按最近使用时间过期）
+    await phase1_cache_collection.create_index("digest", unique=True)
+    await phase1_cache_collection.create_index(
+        "last_used_at",
+        expireAfterSeconds=int(os.getenv("PHASE1_CACHE_TTL_DAYS", "30")) * 86400,
+    )
@@ -20,6 +20,7 @@ class MemoryRecordCreate(MemoryRecordBase):
     phase2_results: Optional[List[Dict[str, Any]]] = None
     error_message: Optional[str] = None
     icloud_password: Optional[str] = None
+    phase1_mode: Optional[str] = None  # realtime 或 batch（Batch API，半价、非实时），默认PHASE1_MODE
 
 class MemoryRecord(MemoryRecordBase):
     """记忆记录完整模型"""
@@ -31,6 +32,7 @@ class MemoryRecord(MemoryRecordBase):
     time_range: Optional[Tuple[str, str]] = None
     stats: Optional[Dict[str, Any]] = None
     used_photos: Optional[List[str]] = None  # 存储使用的图片ID列表
+    partial_results: Optional[Dict[str, Any]] = None  # 分析进行中的流式部分结果
     
     class Config:
         from_attributes = True
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+分析进度推送
+
+Gemini流式返回的部分文本按批次（phase1.<批次ID>）或阶段（phase2）累积：
+- 每段新文本立即推送给当前进程内的订阅者（SSE接口）
+- 每隔PROGRESS_CHECKPOINT_INTERVAL秒把最新文本写入记忆记录的
+  partial_results字段，其他进程的SSE连接或刷新页面时也能看到进度
+
+推送事件:
+    {"type": "stage", "stage": ..., ...}              阶段开始
+    {"type": "partial", "key": ..., "offset": n, "text": ...}
+        文本从offset处截断后追加text（重试时offset为0，整体替换）
+    {"type": "done"}                                  分析结束
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from bson import ObjectId
+
+from app.config.database import memory_records_collection
+
+logger = logging.getLogger(__name__)
+
+# 部分结果写入记录的最小间隔（秒）
+PROGRESS_CHECKPOINT_INTERVAL = float(os.getenv("PROGRESS_CHECKPOINT_INTERVAL", "5"))
+
+
+class AnalysisProgress:
+    """单条记忆记录的分析进度"""
+
+    def __init__(self, record_id: str, collection=None, interval: float = None):
+        """
+        初始化进度
+
+        Args:
+            record_id: 记忆记录ID
+            collection: 记忆记录集合，默认memory_records集合
+            interval: 检查点写入间隔（秒），默认PROGRESS_CHECKPOINT_INTERVAL
+        """
+        self.record_id = record_id
+        self.collection = collection if collection is not None else memory_records_collection
+        self.interval = interval if interval is not None else PROGRESS_CHECKPOINT_INTERVAL
+        self.texts: Dict[str, str] = {}
+        self.stage: Dict[str, Any] = {}
+        self.subscribers: List[asyncio.Queue] = []
+        self.last_saved: Dict[str, float] = {}
+        self.saving: Set[str] = set()
+        self.tasks: Set[asyncio.Task] = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        """订阅进度事件"""
+        queue = asyncio.Queue()
+        self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        if queue in self.subscribers:
+            self.subscribers.remove(queue)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前阶段与各部分文本（供新连接的订阅者）"""
+        partial_results: Dict[str, Any] = {}
+        for key, text in self.texts.items():
+            parent, _, child = key.partition(".")
+            if child:
+                partial_results.setdefault(parent, {})[child] = text
+            else:
+                partial_results[parent] = text
+        return {"stage": self.stage, "partial_results": partial_results}
+
+    def _publish(self, event: Dict[str, Any]) -> None:
+        for queue in self.subscribers:
+            queue.put_nowait(event)
+
+    def set_stage(self, stage: str, **info) -> None:
+        """记录并推送当前阶段"""
+        self.stage = {"stage": stage, **info}
+        self._publish({"type": "stage", **self.stage})
+
+    def update(self, key: str, text: str) -> None:
+        """
+        更新一段流式文本（需在事件循环线程中调用）
+
+        Args:
+            key: phase1.<批次ID> 或 phase2
+            text: 目前为止收到的完整文本
+        """
+        previous = self.texts.get(key, "")
+        offset = len(previous) if text.startswith(previous) else 0
+        self.texts[key] = text
+        self._publish({"type": "partial", "key": key, "offset": offset, "text": text[offset:]})
+
+        if key not in self.saving and time.monotonic() - self.last_saved.get(key, 0.0) >= self.interval:
+            task = asyncio.ensure_future(self._checkpoint(key))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _checkpoint(self, key: str) -> None:
+        self.saving.add(key)
+        try:
+            await self.collection.update_one(
+                {"_id": ObjectId(self.record_id)},
+                {"$set": {
+                    f"partial_results.{key}": self.texts[key],
+                    "updated_at": datetime.utcnow(),
+                }},
+            )
+        except Exception as e:
+            logger.warning(f"写入部分结果失败 {self.record_id}/{key}: {e}")
+        finally:
+            self.last_saved[key] = time.monotonic()
+            self.saving.discard(key)
+
+    async def flush(self, key: str) -> None:
+        """立即写入一段文本的最终内容（批次或阶段完成时）"""
+        if self.tasks:
+            await asyncio.gather(*list(self.tasks), return_exceptions=True)
+        if key in self.texts:
+            await self._checkpoint(key)
+
+    async def close(self) -> None:
+        """分析结束：等待未完成的写入并通知订阅者"""
+        if self.tasks:
+            await asyncio.gather(*list(self.tasks), return_exceptions=True)
+        self._publish({"type": "done"})
+        if _channels.get(self.record_id) is self:
+            del _channels[self.record_id]
+
+
+_channels: Dict[str, AnalysisProgress] = {}
+
+
+def open_progress(record_id: str) -> AnalysisProgress:
+    """为正在执行的分析创建进度通道"""
+    progress = AnalysisProgress(record_id)
+    _channels[record_id] = progress
+    return progress
+
+
+def get_progress(record_id: str) -> Optional[AnalysisProgress]:
+    """获取本进程内正在执行的分析的进度通道"""
+    return _channels.get(record_id)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+批量图片压缩引擎
+
+PIL/OpenCV压缩是同步CPU密集型代码，在事件循环中gather协程没有任何并行度。
+本引擎将压缩任务分发到进程池：
+- 工作进程数可配置（默认CPU核数）
+- 同时在途的任务数不超过工作进程数，在途原始字节总量受预算约束，
+  输入为惰性迭代器时内存占用有上限
+- 结果按完成顺序流式返回
+- 单张图片超时后返回错误结果，并重建进程池释放被卡住的工作进程
+- 工作进程崩溃（段错误、内存不足）时重建进程池，受影响的图片逐张单独重试，
+  只有导致崩溃的图片返回错误结果
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _compress_in_worker(image_data: bytes, options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """工作进程入口：在独立进程中运行完整压缩流程"""
+    from app.services.image_compressor import ImageCompressor
+
+    return ImageCompressor().compress_sync(image_data, options)
+
+
+def _error_result(image_data: bytes, options: Optional[Dict[str, Any]], error: str) -> Dict[str, Any]:
+    return {
+        "compressed_data": None,
+        "original_size": len(image_data),
+        "compressed_size": 0,
+        "width": 0,
+        "height": 0,
+        "format": (options or {}).get("format", "webp"),
+        "error": error,
+    }
+
+
+class BatchCompressionEngine:
+    """基于进程池的批量压缩引擎"""
+
+    def __init__(
+        self,
+        max_workers: int = None,
+        max_inflight_bytes: int = None,
+        timeout: float = None,
+        mp_context=None,
+    ):
+        """
+        初始化压缩引擎
+
+        Args:
+            max_workers: 工作进程数，默认环境变量COMPRESS_WORKERS或CPU核数
+            max_inflight_bytes: 在途原始字节预算，默认环境变量COMPRESS_QUEUE_MB（256MB）
+            timeout: 单张图片超时秒数，默认环境变量COMPRESS_TIMEOUT（60秒）
+            mp_context: 进程池的multiprocessing上下文，默认使用平台默认启动方式
+        """
+        self.max_workers = max_workers or int(os.getenv("COMPRESS_WORKERS", "0")) or os.cpu_count() or 1
+        self.max_inflight_bytes = max_inflight_bytes or int(os.getenv("COMPRESS_QUEUE_MB", "256")) * 1024 * 1024
+        self.timeout = timeout or float(os.getenv("COMPRESS_TIMEOUT", "60"))
+        self.mp_context = mp_context
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.stats = {"completed": 0, "failed": 0, "timeouts": 0, "crashes": 0, "pool_restarts": 0}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self.mp_context)
+        return self._pool
+
+    def _recycle_pool(self) -> None:
+        """终止当前进程池（包括被卡住的工作进程），下次提交时重建"""
+        pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        processes = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        self.stats["pool_restarts"] += 1
+
+    def shutdown(self) -> None:
+        """关闭进程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    async def stream(
+        self,
+        images: Iterable[bytes],
+        options: Dict[str, Any] = None,
+    ) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        并行压缩并按完成顺序返回结果
+
+        Args:
+            images: 图片数据迭代器（可以是惰性生成器，只在有预算时才读取下一张）
+            options: 压缩选项
+
+        Yields:
+            (输入序号, 压缩结果)
+        """
+        loop = asyncio.get_running_loop()
+        source = enumerate(images)
+        next_item = next(source, None)
+        # future -> (序号, 图片数据, 截止时间, 是否单独执行)
+        pending: Dict[asyncio.Future, Tuple[int, bytes, float, bool]] = {}
+        # 工作进程崩溃时在途的图片：无法确定是哪一张导致崩溃，逐张单独重试
+        suspects: List[Tuple[int, bytes]] = []
+        inflight_bytes = 0
+
+        def requeue_pending() -> None:
+            """进程池已损坏：在途任务全部转为待单独重试，重建进程池"""
+            nonlocal inflight_bytes
+            for future, (index, data, _, _) in pending.items():
+                future.cancel()
+                suspects.append((index, data))
+            pending.clear()
+            inflight_bytes = 0
+            suspects.sort(key=lambda item: item[0])
+            self._recycle_pool()
+
+        def submit(index: int, data: bytes, isolated: bool = False) -> None:
+            nonlocal inflight_bytes
+            try:
+                future = loop.run_in_executor(self._get_pool(), _compress_in_worker, data, options)
+            except BrokenProcessPool:
+                requeue_pending()
+                future = loop.run_in_executor(self._get_pool(), _compress_in_worker, data, options)
+            pending[future] = (index, data, loop.time() + self.timeout, isolated)
+            inflight_bytes += len(data)
+
+        while next_item is not None or pending or suspects:
+            if suspects:
+                # 进程崩溃后，受影响的图片在空闲的进程池中逐张执行
+                if not pending:
+                    submit(*suspects.pop(0), isolated=True)
+            else:
+                # 在进程数和字节预算允许时提交新任务（队列为空时总是允许，避免单张超大图片卡死）
+                while next_item is not None and len(pending) < self.max_workers and (
+                    not pending or inflight_bytes + len(next_item[1]) <= self.max_inflight_bytes
+                ):
+                    submit(*next_item)
+                    next_item = next(source, None)
+
+            wait_time = max(0.0, min(deadline for _, _, deadline, _ in pending.values()) - loop.time())
+            done, _ = await asyncio.wait(
+                list(pending), timeout=wait_time, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            crashed = False
+            for future in done:
+                index, data, _, isolated = pending.pop(future)
+                inflight_bytes -= len(data)
+                try:
+                    result = future.result()
+                except BrokenProcessPool as e:
+                    crashed = True
+                    if not isolated:
+                        suspects.append((index, data))
+                        continue
+                    # 单独执行时进程池仍然损坏：就是这张图片导致工作进程崩溃
+                    self.stats["crashes"] += 1
+                    logger.error(f"压缩第 {index} 张图片时工作进程崩溃: {e}")
+                    result = _error_result(data, options, f"工作进程崩溃: {e}")
+                except Exception as e:
+                    logger.error(f"压缩进程执行失败: {e}")
+                    result = _error_result(data, options, str(e))
+                if result.get("error"):
+                    self.stats["failed"] += 1
+                else:
+                    self.stats["completed"] += 1
+                yield index, result
+
+            if crashed:
+                requeue_pending()
+                continue
+
+            now = loop.time()
+            expired = [future for future, (_, _, deadline, _) in pending.items() if deadline <= now]
+            if not expired:
+                continue
+
+            for future in expired:
+                index, data, _, _ = pending.pop(future)
+                inflight_bytes -= len(data)
+                future.cancel()
+                self.stats["timeouts"] += 1
+                logger.warning(f"图片压缩超时（{self.timeout:.0f} 秒），跳过第 {index} 张")
+                yield index, _error_result(data, options, "压缩超时")
+
+            # 超时任务仍占用工作进程，重建进程池并重新提交其余在途任务
+            survivors = [(index, data, isolated) for index, data, _, isolated in pending.values()]
+            for future in pending:
+                future.cancel()
+            pending.clear()
+            inflight_bytes = 0
+            self._recycle_pool()
+            for index, data, isolated in survivors:
+                submit(index, data, isolated)
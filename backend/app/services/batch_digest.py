@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Phase 1 批次内容摘要
+
+摘要由（按发送顺序的图片哈希、每张照片的信息行、提示词全文、主角特征、
+模型名称）计算，用作Phase 1结果缓存与批处理任务请求的key：批次编号或切分
+方式变化时，只要发送给模型的内容相同仍能命中；照片顺序、拍摄时间、GPS等
+任一内容变化都会得到新的摘要。结构化结果按照片序号（index）引用照片，
+顺序不同的批次不能共用结果。
+
+后端缓存与CLI工具共用同一实现，两边的缓存键不会不一致。
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+
+def phase1_digest(
+    image_hashes: Sequence[str],
+    prompt: str,
+    protagonist_features: Optional[Dict[str, Any]],
+    model_name: str,
+    photo_info: Iterable[str] = (),
+) -> str:
+    """
+    计算批次内容摘要
+
+    Args:
+        image_hashes: 批次内照片的内容哈希（MD5，按发送顺序）
+        prompt: Phase 1提示词全文
+        protagonist_features: 主角特征
+        model_name: 模型名称
+        photo_info: 按顺序随请求发送的每张照片信息行（拍摄时间、GPS等）
+
+    Returns:
+        SHA-256十六进制摘要
+    """
+    payload = json.dumps(
+        {
+            "images": list(image_hashes),
+            "photo_info": list(photo_info),
+            "prompt": prompt,
+            "protagonist": protagonist_features,
+            "model": model_name,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Phase 1 批次打包
+
+按token预算而不是自然月切分批次：照片按时间排序后切成连续的段，
+每段的估算token（提示词 + 每张照片的图片与说明文字）不超过预算。
+
+在批次数最少的前提下，切分点优先落在时间间隔最大、场景聚类变化的位置
+（动态规划），让同一次出行、活动或同一类场景尽量留在同一批次里。
+"""
+
+import math
+import os
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# 单批次token预算（提示词 + 全部图片与照片说明），默认约50张1024px图片
+PHASE1_TOKEN_BUDGET = int(os.getenv("PHASE1_TOKEN_BUDGET", "64000"))
+
+# 单张图片的token计费：两边都不超过384px时为258，否则按裁剪单元切块，每块258
+IMAGE_TILE_TOKENS = 258
+SMALL_IMAGE_SIDE = 384
+
+# 相邻照片场景聚类不同时，切分得分额外增加的秒数（相当于多出的时间间隔）
+PHASE1_SCENE_CUT_SECONDS = float(os.getenv("PHASE1_SCENE_CUT_SECONDS", str(6 * 3600)))
+
+
+def image_tokens(width: Optional[int], height: Optional[int], fallback_side: int = 1024) -> int:
+    """
+    估算一张图片的输入token数
+
+    Args:
+        width: 发送给模型的图片宽度，未知时按fallback_side的正方形估算
+        height: 高度
+        fallback_side: 尺寸未知时假定的边长
+
+    Returns:
+        token数
+    """
+    if not width or not height:
+        width = height = fallback_side
+    if width <= SMALL_IMAGE_SIDE and height <= SMALL_IMAGE_SIDE:
+        return IMAGE_TILE_TOKENS
+    crop_unit = max(1, math.floor(min(width, height) / 1.5))
+    return IMAGE_TILE_TOKENS * math.ceil(width / crop_unit) * math.ceil(height / crop_unit)
+
+
+def text_tokens(text: str) -> int:
+    """估算文本token数（中文约1字符1token，偏保守）"""
+    return len(text)
+
+
+def pack_batches(
+    items: Sequence[T],
+    cost: Callable[[T], int],
+    timestamp: Callable[[T], datetime],
+    budget: int = None,
+    overhead: int = 0,
+    scene: Callable[[T], Optional[int]] = None,
+    scene_weight: float = None,
+) -> List[List[T]]:
+    """
+    将照片按时间顺序打包为连续批次
+
+    Args:
+        items: 照片
+        cost: 单张照片的估算token数
+        timestamp: 照片的拍摄时间
+        budget: 单批次token预算，默认PHASE1_TOKEN_BUDGET
+        overhead: 每个批次固定的提示词token数
+        scene: 照片的场景聚类标签（未知时为None），默认不考虑场景
+        scene_weight: 场景变化处的额外切分得分（秒），默认PHASE1_SCENE_CUT_SECONDS
+
+    Returns:
+        批次列表（每个批次内按时间排序）；单张超出预算的照片单独成批
+    """
+    budget = budget or PHASE1_TOKEN_BUDGET
+    scene_weight = PHASE1_SCENE_CUT_SECONDS if scene_weight is None else scene_weight
+    ordered = sorted(items, key=timestamp)
+    n = len(ordered)
+    if n == 0:
+        return []
+    costs = [cost(item) for item in ordered]
+    # gaps[j]：在第j张之前切分的得分，即跨越的时间间隔（秒），场景聚类变化时另加scene_weight
+    gaps = [0.0] + [
+        (timestamp(ordered[j]) - timestamp(ordered[j - 1])).total_seconds() for j in range(1, n)
+    ]
+    if scene is not None:
+        labels = [scene(item) for item in ordered]
+        for j in range(1, n):
+            if labels[j] is not None and labels[j - 1] is not None and labels[j] != labels[j - 1]:
+                gaps[j] += scene_weight
+
+    # best[i] = (批次数, -切分点得分之和, 上一个切分点)，覆盖前i张照片
+    best: List[Tuple[int, float, int]] = [(0, 0.0, 0)] + [(n + 1, 0.0, 0)] * n
+    for i in range(1, n + 1):
+        total = overhead
+        for j in range(i - 1, -1, -1):
+            total += costs[j]
+            if total > budget and j < i - 1:
+                break
+            count, neg_gap, _ = best[j]
+            candidate = (count + 1, neg_gap - (gaps[j] if j > 0 else 0.0), j)
+            if candidate[:2] < best[i][:2]:
+                best[i] = candidate
+
+    batches = []
+    i = n
+    while i > 0:
+        j = best[i][2]
+        batches.append(list(ordered[j:i]))
+        i = j
+    batches.reverse()
+    return batches
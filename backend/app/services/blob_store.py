@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+图片数据存储服务
+
+压缩后的图片数据不再内嵌在photos文档中，文档只保存引用：
+    {"backend": "gridfs" | "filesystem", "key": <sha256>, "size": <字节数>}
+
+两种后端都按内容SHA-256寻址，相同数据只存储一份：
+- GridFSBlobStore：存储在MongoDB GridFS（默认，无需额外存储卷）
+- FilesystemBlobStore：存储在本地目录 <root>/<key[:2]>/<key[2:4]>/<key>
+
+通过环境变量BLOB_STORE选择写入后端，读取时按引用中记录的后端分发，
+切换后端不影响已有数据的读取。
+"""
+
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional
+
+from gridfs.errors import FileExists, NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from pymongo.errors import DuplicateKeyError
+
+from app.config.database import async_db
+from app.services.image_compressor import MEDIA_TYPES, RENDITIONS
+
+logger = logging.getLogger(__name__)
+
+# 流式读取的块大小
+CHUNK_SIZE = 256 * 1024
+
+# 查询照片文档时排除内嵌图片数据（旧版记录）的投影
+PHOTO_BLOB_EXCLUSION = {
+    "compressed_image_data": 0,
+    "compressed_info.compressed_data": 0,
+    **{f"renditions.{name}.data": 0 for name in RENDITIONS},
+}
+
+
+class BlobStore(ABC):
+    """
+    图片数据存储后端基类
+
+    子类须实现put/stream/delete/exists，缺少任一方法时在构造时即报错；
+    get基于stream实现
+    """
+
+    name = ""
+
+    @abstractmethod
+    async def put(self, data: bytes, content_type: Optional[str] = None) -> Dict[str, Any]:
+        """
+        写入数据
+
+        Args:
+            data: 数据
+            content_type: MIME类型
+
+        Returns:
+            数据引用
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def stream(self, ref: Dict[str, Any]) -> AsyncIterator[bytes]:
+        """按块流式读取数据"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, ref: Dict[str, Any]) -> None:
+        """删除数据"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def exists(self, ref: Dict[str, Any]) -> bool:
+        """数据是否存在"""
+        raise NotImplementedError
+
+    async def get(self, ref: Dict[str, Any]) -> bytes:
+        """读取完整数据"""
+        chunks = []
+        async for chunk in self.stream(ref):
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def _ref(self, key: str, size: int) -> Dict[str, Any]:
+        return {"backend": self.name, "key": key, "size": size}
+
+
+class FilesystemBlobStore(BlobStore):
+    """本地目录存储"""
+
+    name = "filesystem"
+
+    def __init__(self, root: str):
+        """
+        初始化存储
+
+        Args:
+            root: 存储根目录
+        """
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key[2:4] / key
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再原子替换，避免并发写入或中断产生不完整文件
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    async def put(self, data: bytes, content_type: Optional[str] = None) -> Dict[str, Any]:
+        key = hashlib.sha256(data).hexdigest()
+        await asyncio.to_thread(self._write, key, data)
+        return self._ref(key, len(data))
+
+    async def stream(self, ref: Dict[str, Any]) -> AsyncIterator[bytes]:
+        path = self._path(ref["key"])
+        f = await asyncio.to_thread(open, path, "rb")
+        try:
+            while True:
+                chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            f.close()
+
+    async def delete(self, ref: Dict[str, Any]) -> None:
+        path = self._path(ref["key"])
+        await asyncio.to_thread(path.unlink, True)
+
+    async def exists(self, ref: Dict[str, Any]) -> bool:
+        return await asyncio.to_thread(self._path(ref["key"]).exists)
+
+
+class GridFSBlobStore(BlobStore):
+    """
+    MongoDB GridFS存储
+
+    文件以内容SHA-256作为_id写入：并发写入相同内容时只有一份成功，
+    另一方遇到重复键即视为已存储，不会产生同名的重复文件。
+    早期版本以ObjectId为_id、SHA-256为filename写入的文件按filename兼容读取和删除。
+    """
+
+    name = "gridfs"
+
+    def __init__(self, db=None, bucket_name: str = "blobs"):
+        """
+        初始化存储
+
+        Args:
+            db: 异步数据库，默认使用应用数据库
+            bucket_name: GridFS桶名称
+        """
+        self.bucket = AsyncIOMotorGridFSBucket(db if db is not None else async_db, bucket_name=bucket_name)
+
+    async def _find_id(self, key: str):
+        async for grid_file in self.bucket.find({"$or": [{"_id": key}, {"filename": key}]}, limit=1):
+            return grid_file._id
+        return None
+
+    async def put(self, data: bytes, content_type: Optional[str] = None) -> Dict[str, Any]:
+        key = hashlib.sha256(data).hexdigest()
+        if await self._find_id(key) is None:
+            try:
+                await self.bucket.upload_from_stream_with_id(
+                    key,
+                    key,
+                    data,
+                    chunk_size_bytes=CHUNK_SIZE,
+                    metadata={"content_type": content_type},
+                )
+            except (FileExists, DuplicateKeyError):
+                # 并发写入相同内容，另一方已写入（内容相同）：
+                # 文件_id重复时GridFS抛出FileExists，块索引冲突时抛出DuplicateKeyError
+                pass
+        return self._ref(key, len(data))
+
+    async def stream(self, ref: Dict[str, Any]) -> AsyncIterator[bytes]:
+        file_id = await self._find_id(ref["key"])
+        if file_id is None:
+            raise FileNotFoundError(ref["key"])
+        grid_out = await self.bucket.open_download_stream(file_id)
+        while True:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                break
+            yield chunk
+
+    async def delete(self, ref: Dict[str, Any]) -> None:
+        key = ref["key"]
+        file_ids = [key]
+        async for grid_file in self.bucket.find({"filename": key, "_id": {"$ne": key}}):
+            file_ids.append(grid_file._id)
+        for file_id in file_ids:
+            try:
+                await self.bucket.delete(file_id)
+            except NoFile:
+                pass
+
+    async def exists(self, ref: Dict[str, Any]) -> bool:
+        return await self._find_id(ref["key"]) is not None
+
+
+_stores: Dict[str, BlobStore] = {}
+
+
+def _get_store(name: str) -> BlobStore:
+    if name not in _stores:
+        if name == FilesystemBlobStore.name:
+            _stores[name] = FilesystemBlobStore(os.getenv("BLOB_STORE_DIR", "/app/data/blobs"))
+        elif name == GridFSBlobStore.name:
+            _stores[name] = GridFSBlobStore()
+        else:
+            raise ValueError(f"不支持的存储后端: {name}")
+    return _stores[name]
+
+
+def get_blob_store() -> BlobStore:
+    """获取用于写入的存储后端（环境变量BLOB_STORE，默认gridfs）"""
+    return _get_store(os.getenv("BLOB_STORE", GridFSBlobStore.name))
+
+
+def blob_store_for(ref: Dict[str, Any]) -> BlobStore:
+    """获取引用所在的存储后端"""
+    return _get_store(ref.get("backend", GridFSBlobStore.name))
+
+
+def blob_reference_query(ref: Dict[str, Any], rendition_names=None) -> Dict[str, Any]:
+    """
+    查询引用某份数据的照片文档
+
+    数据按内容寻址、相同数据只存储一份，删除前需确认没有其他文档引用
+
+    Args:
+        ref: 数据引用
+        rendition_names: 要检查的衍生图名称，默认RENDITIONS
+    """
+    names = set(rendition_names or ()) | set(RENDITIONS)
+    return {"$or": [{f"renditions.{name}.blob.key": ref["key"]} for name in sorted(names)]}
+
+
+async def store_renditions(renditions: Dict[str, Dict[str, Any]], store: BlobStore = None) -> Dict[str, Dict[str, Any]]:
+    """
+    将衍生图数据写入存储，返回只含引用的衍生图信息
+
+    Args:
+        renditions: {名称: {data, format, ...}}
+        store: 存储后端，默认get_blob_store()
+
+    Returns:
+        {名称: {blob, format, ...}}（不含data）
+    """
+    store = store or get_blob_store()
+    stored = {}
+    for name, rendition in renditions.items():
+        entry = {key: value for key, value in rendition.items() if key != "data"}
+        if rendition.get("data"):
+            entry["blob"] = await store.put(
+                bytes(rendition["data"]), MEDIA_TYPES.get(rendition.get("format", ""), None)
+            )
+        stored[name] = entry
+    return stored
+
+
+async def restore_missing(
+    renditions: Dict[str, Dict[str, Any]], stored: Dict[str, Dict[str, Any]]
+) -> int:
+    """
+    写入照片文档后确认引用的数据仍然存在，缺失时重新写入
+
+    删除照片时先确认没有其他文档引用再删除数据；新文档恰好在两者之间写入时，
+    数据可能刚被删除，由写入方在这里补回。
+
+    Args:
+        renditions: 含data的衍生图（store_renditions的输入）
+        stored: store_renditions的返回值
+
+    Returns:
+        重新写入的数量
+    """
+    restored = 0
+    for name, entry in stored.items():
+        ref = entry.get("blob")
+        data = (renditions.get(name) or {}).get("data")
+        if ref and data and not await blob_store_for(ref).exists(ref):
+            await blob_store_for(ref).put(bytes(data), MEDIA_TYPES.get(entry.get("format", ""), None))
+            restored += 1
+    if restored:
+        logger.warning(f"重新写入 {restored} 份并发删除的图片数据")
+    return restored
+
+
+async def load_rendition(rendition: Optional[Dict[str, Any]]) -> Optional[bytes]:
+    """读取衍生图数据，兼容内嵌数据与存储引用"""
+    if not rendition:
+        return None
+    if rendition.get("data"):
+        return bytes(rendition["data"])
+    if rendition.get("blob"):
+        return await blob_store_for(rendition["blob"]).get(rendition["blob"])
+    return None
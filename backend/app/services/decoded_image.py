@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+照片解码句柄
+
+同一张照片在过滤、特征提取、压缩等阶段之间共享一次解码结果：
+- 原始字节与MD5只保存一份
+- 首次需要像素时按下游最大需求（默认1080p）进行缩小解码，JPEG利用DCT缩放
+- 缩略图、224px、512px等尺寸从已有层级逐级缩小并缓存（金字塔）
+- 最后一个使用方调用release()释放像素缓冲
+
+所有句柄的像素缓冲受全局内存预算约束，超出时按最近最少使用释放，
+被释放的句柄再次使用时会重新解码（计入解码计数）。
+
+除Pillow原生格式外，安装pillow-heif后支持HEIC/HEIF；MPO（多图JPEG）取第一帧。
+"""
+
+import hashlib
+import io
+import logging
+import os
+import threading
+import weakref
+from collections import Counter, OrderedDict
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from app.services.exif_extractor import parse_tiff_exif
+
+logger = logging.getLogger(__name__)
+
+# 尝试注册HEIC/HEIF解码器，如果失败则不支持该格式
+try:
+    from pillow_heif import register_heif_opener
+
+    register_heif_opener()
+    heif_available = True
+except Exception as e:
+    logger.warning(f"pillow-heif导入失败: {e}，将不支持HEIC/HEIF格式")
+    heif_available = False
+
+# 可解码的照片扩展名（Gemini不直接支持的格式在压缩时转码为WebP衍生图）
+SUPPORTED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".mpo"}
+if heif_available:
+    SUPPORTED_EXTENSIONS |= {".heic", ".heif"}
+
+# EXIF中体积大且对下游无用的标签：MakerNote、UserComment
+_EXIF_STRIP_TAGS = (0x927C, 0x9286)
+
+# EXIF方向标签，及需要交换宽高的方向值（旋转90°/270°及其镜像）
+_EXIF_ORIENTATION = 0x0112
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+# 全局解码计数，用于验证每张照片的解码次数
+decode_stats: Counter = Counter()
+
+# 常用金字塔层级（最大边长）
+THUMBNAIL_SIZE = 320
+CLIP_SIZE = 224
+SCORING_SIZE = 512
+
+# 基础解码尺寸（压缩输出的最大尺寸）
+DEFAULT_BASE_BOX = (1920, 1080)
+
+
+class _PixelBudget:
+    """所有解码句柄共享的像素内存预算"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._entries: "OrderedDict[int, Tuple[weakref.ref, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def charge(self, handle: "DecodedImage", nbytes: int) -> None:
+        """登记句柄占用的像素内存，超出预算时释放最久未使用的句柄"""
+        evicted = []
+        with self._lock:
+            key = id(handle)
+            if key in self._entries:
+                _, old = self._entries.pop(key)
+                self.used -= old
+            self._entries[key] = (weakref.ref(handle), nbytes)
+            self.used += nbytes
+            while self.used > self.max_bytes and len(self._entries) > 1:
+                _, (ref, size) = self._entries.popitem(last=False)
+                self.used -= size
+                victim = ref()
+                if victim is not None:
+                    evicted.append(victim)
+        for victim in evicted:
+            logger.debug(f"像素内存超出预算，释放解码缓冲: {victim.filename}")
+            victim._drop_pixels()
+
+    def touch(self, handle: "DecodedImage") -> None:
+        with self._lock:
+            key = id(handle)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+
+    def discharge(self, handle: "DecodedImage") -> None:
+        with self._lock:
+            entry = self._entries.pop(id(handle), None)
+            if entry:
+                self.used -= entry[1]
+
+
+_pixel_budget = _PixelBudget(int(os.getenv("DECODED_PIXEL_BUDGET_MB", "512")) * 1024 * 1024)
+
+
+class DecodedImage:
+    """单张照片的共享解码句柄"""
+
+    def __init__(self, data: bytes, filename: str = "", base_box: Tuple[int, int] = DEFAULT_BASE_BOX):
+        """
+        初始化句柄（不解码）
+
+        Args:
+            data: 原始图片字节
+            filename: 文件名，仅用于日志
+            base_box: 基础解码的目标尺寸，应不小于所有下游使用方需要的最大尺寸
+        """
+        self.data = data
+        self.filename = filename
+        self.base_box = base_box
+        self.decode_count = 0
+        self._md5: Optional[str] = None
+        self._header: Optional[Dict] = None
+        self._pyramid: Dict[int, Image.Image] = {}
+        self._base: Optional[Image.Image] = None
+        self._lock = threading.Lock()
+        decode_stats["handles"] += 1
+
+    @classmethod
+    def ensure(cls, source, filename: str = "") -> "DecodedImage":
+        """将字节或已有句柄统一为句柄"""
+        if isinstance(source, DecodedImage):
+            return source
+        return cls(source, filename=filename)
+
+    @property
+    def md5(self) -> str:
+        """原始字节的MD5哈希值"""
+        if self._md5 is None:
+            self._md5 = hashlib.md5(self.data).hexdigest()
+        return self._md5
+
+    def _read_header(self) -> Dict:
+        """只读取文件头获取格式与尺寸，不解码像素"""
+        if self._header is None:
+            with Image.open(io.BytesIO(self.data)) as image:
+                orientation = image.getexif().get(_EXIF_ORIENTATION)
+                exif = self._compact_exif(image)
+                metadata = parse_tiff_exif(exif) if exif else {}
+                if exif:
+                    # 元数据保留原图的方向，写入衍生图的EXIF方向已同步为1
+                    metadata["orientation"] = orientation
+                metadata["width"], metadata["height"] = image.size
+                self._header = {
+                    "format": image.format,
+                    "size": image.size,
+                    "mode": image.mode,
+                    "exif": exif,
+                    "metadata": metadata,
+                }
+        return self._header
+
+    @staticmethod
+    def _compact_exif(image: Image.Image) -> Optional[bytes]:
+        """
+        读取EXIF并去除MakerNote等大字段，用于写入衍生图
+
+        解码时已按方向标签旋转像素，方向标签同步为1，避免查看器重复旋转
+        """
+        try:
+            exif = image.getexif()
+            if not exif:
+                return None
+            exif_ifd = exif.get_ifd(0x8769)
+            for tag in _EXIF_STRIP_TAGS:
+                exif_ifd.pop(tag, None)
+            if exif.get(_EXIF_ORIENTATION, 1) != 1:
+                exif[_EXIF_ORIENTATION] = 1
+            return exif.tobytes()
+        except Exception as e:
+            logger.debug(f"读取EXIF失败: {e}")
+            return None
+
+    @property
+    def format(self) -> Optional[str]:
+        return self._read_header()["format"]
+
+    @property
+    def original_size(self) -> Tuple[int, int]:
+        """原图尺寸（宽, 高）"""
+        return self._read_header()["size"]
+
+    @property
+    def exif(self) -> Optional[bytes]:
+        """精简后的原图EXIF（像素已按方向旋转，方向标签同步为1）"""
+        return self._read_header()["exif"]
+
+    @property
+    def metadata(self) -> Dict:
+        """
+        原图EXIF元数据（与压缩共用同一次文件头读取）
+
+        Returns:
+            {datetime, gps_lat, gps_lon, orientation, make, model, width, height}，
+            没有EXIF时只含width/height
+        """
+        return self._read_header()["metadata"]
+
+    def base(self) -> Image.Image:
+        """
+        获取基础解码图像（整个句柄生命周期内只解码一次）
+
+        按base_box计算目标尺寸后通过draft()让JPEG在解码时直接缩小，
+        其他格式完整解码后缩小到目标尺寸。MPO只解码第一帧（主图）。
+        像素按EXIF方向标签旋转为正向，所有衍生尺寸随之继承；
+        base_box按旋转后的宽高计算。
+
+        Returns:
+            PIL图片（调用方不应原地修改）
+        """
+        with self._lock:
+            if self._base is not None:
+                _pixel_budget.touch(self)
+                return self._base
+
+            image = Image.open(io.BytesIO(self.data))
+            transposed = image.getexif().get(_EXIF_ORIENTATION, 1) in _TRANSPOSED_ORIENTATIONS
+            width, height = image.size[::-1] if transposed else image.size
+            ratio = min(self.base_box[0] / width, self.base_box[1] / height, 1.0)
+            target = (max(1, int(width * ratio)), max(1, int(height * ratio)))
+            image.draft("RGB", target[::-1] if transposed else target)
+            image.load()
+            ImageOps.exif_transpose(image, in_place=True)
+            if image.size[0] > target[0] or image.size[1] > target[1]:
+                image = image.resize(target, Image.LANCZOS, reducing_gap=3.0)
+
+            self._base = image
+            self._pyramid = {max(image.size): image}
+            self.decode_count += 1
+            decode_stats["decodes"] += 1
+            nbytes = self._nbytes()
+
+        # 登记预算可能释放其他句柄（或本句柄）的像素，需在持有锁之外进行
+        _pixel_budget.charge(self, nbytes)
+        return image
+
+    def scaled(self, max_side: int) -> Image.Image:
+        """
+        获取最大边长不超过max_side的RGB图像
+
+        从已缓存的、不小于目标尺寸的最小层级缩小得到，结果缓存复用。
+
+        Args:
+            max_side: 最大边长
+
+        Returns:
+            PIL图片（RGB）
+        """
+        base = self.base()
+        with self._lock:
+            if max_side in self._pyramid:
+                _pixel_budget.touch(self)
+                return self._pyramid[max_side]
+
+            candidates = [size for size in self._pyramid if size >= max_side]
+            source = self._pyramid[min(candidates)] if candidates else base
+            image = source.convert("RGB") if source.mode != "RGB" else source.copy()
+            image.thumbnail((max_side, max_side), Image.BILINEAR)
+            self._pyramid[max_side] = image
+            nbytes = self._nbytes()
+
+        _pixel_budget.charge(self, nbytes)
+        return image
+
+    def thumbnail(self) -> Image.Image:
+        """列表缩略图"""
+        return self.scaled(THUMBNAIL_SIZE)
+
+    def for_clip(self) -> Image.Image:
+        """CLIP输入尺寸"""
+        return self.scaled(CLIP_SIZE)
+
+    def _nbytes(self) -> int:
+        """金字塔占用的像素字节数（调用方须持有self._lock，其他线程可能同时增删层级）"""
+        total = 0
+        for image in self._pyramid.values():
+            total += image.width * image.height * len(image.getbands())
+        return total
+
+    def _drop_pixels(self) -> None:
+        with self._lock:
+            self._base = None
+            self._pyramid = {}
+
+    def release(self) -> None:
+        """释放像素缓冲（原始字节仍保留）"""
+        self._drop_pixels()
+        _pixel_budget.discharge(self)
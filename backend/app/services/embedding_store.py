@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+嵌入向量存储服务
+
+将CLIP嵌入向量以紧凑二进制（BSON Binary）形式存储，替代JSON浮点数列表：
+- 8字节头部：魔数(2) + 格式版本(1) + 数据类型(1) + 维度(4)
+- 数据部分：float16/float32 小端序原始字节
+
+解码时使用numpy.frombuffer直接映射底层字节，不复制数据。
+同时提供按用户批量导出嵌入矩阵（.npy，可内存映射加载）与行顺序对应的照片ID的功能。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import struct
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from bson.binary import Binary
+
+logger = logging.getLogger(__name__)
+
+# 头部格式：魔数、格式版本、数据类型代码、维度
+_HEADER = struct.Struct("<2sBBI")
+_MAGIC = b"EM"
+_FORMAT_VERSION = 1
+
+# 数据类型代码
+_DTYPE_CODES = {"float16": 1, "float32": 2}
+_CODE_DTYPES = {code: np.dtype(name).newbyteorder("<") for name, code in _DTYPE_CODES.items()}
+
+# 需要以二进制形式存储的特征字段及其默认数据类型
+EMBEDDING_FIELDS = {
+    "visual_features": os.getenv("EMBEDDING_DTYPE", "float16"),
+    "semantic_features": "float32",
+}
+
+
+def encode_embedding(vector: Any, dtype: str = "float16") -> Optional[Binary]:
+    """
+    将嵌入向量编码为带头部的二进制数据
+
+    Args:
+        vector: 一维向量（列表、numpy数组或torch张量）
+        dtype: 存储数据类型，float16 或 float32
+
+    Returns:
+        BSON Binary，向量为空时返回None
+    """
+    if vector is None:
+        return None
+    if dtype not in _DTYPE_CODES:
+        raise ValueError(f"不支持的嵌入数据类型: {dtype}")
+
+    array = np.asarray(vector, dtype=np.dtype(dtype).newbyteorder("<")).reshape(-1)
+    header = _HEADER.pack(_MAGIC, _FORMAT_VERSION, _DTYPE_CODES[dtype], array.shape[0])
+    return Binary(header + array.tobytes())
+
+
+def decode_embedding(value: Any) -> Optional[np.ndarray]:
+    """
+    解码嵌入向量
+
+    二进制数据通过numpy.frombuffer零拷贝解码（返回只读视图）；
+    兼容旧版本以浮点数列表存储的数据。
+
+    Args:
+        value: 二进制数据、浮点数列表或numpy数组
+
+    Returns:
+        一维numpy数组，无数据时返回None
+    """
+    if value is None:
+        return None
+    if isinstance(value, np.ndarray):
+        return value
+    if isinstance(value, (list, tuple)):
+        return np.asarray(value, dtype=np.float32)
+
+    buffer = memoryview(value)
+    if buffer.nbytes < _HEADER.size:
+        raise ValueError("嵌入数据长度不足")
+
+    magic, version, dtype_code, dim = _HEADER.unpack_from(buffer)
+    if magic != _MAGIC or version != _FORMAT_VERSION:
+        raise ValueError("无法识别的嵌入数据格式")
+    if dtype_code not in _CODE_DTYPES:
+        raise ValueError(f"未知的嵌入数据类型代码: {dtype_code}")
+
+    return np.frombuffer(buffer, dtype=_CODE_DTYPES[dtype_code], count=dim, offset=_HEADER.size)
+
+
+def encode_features(features: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    编码特征字典中的嵌入字段，用于写入MongoDB
+
+    Args:
+        features: 特征字典
+
+    Returns:
+        嵌入字段已转为二进制的新特征字典
+    """
+    if not features:
+        return features
+
+    encoded = dict(features)
+    for field, dtype in EMBEDDING_FIELDS.items():
+        value = encoded.get(field)
+        if value is not None and not isinstance(value, (bytes, Binary)):
+            encoded[field] = encode_embedding(value, dtype)
+    return encoded
+
+
+def decode_features(features: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    解码从MongoDB读取的特征字典中的嵌入字段
+
+    Args:
+        features: 特征字典
+
+    Returns:
+        嵌入字段为numpy数组的新特征字典
+    """
+    if not features:
+        return features
+
+    decoded = dict(features)
+    for field in EMBEDDING_FIELDS:
+        try:
+            decoded[field] = decode_embedding(decoded.get(field))
+        except Exception as e:
+            logger.warning(f"解码嵌入字段 {field} 失败: {e}")
+            decoded[field] = None
+    return decoded
+
+
+def embedding_to_list(value: Any) -> Optional[List[float]]:
+    """将任意格式的嵌入转为浮点数列表，用于API响应"""
+    array = decode_embedding(value)
+    return array.astype(np.float32).tolist() if array is not None else None
+
+
+# 导出目录中的文件名
+EXPORT_MATRIX_FILE = "embeddings.npy"
+EXPORT_IDS_FILE = "photo_ids.json"
+
+
+def _write_rows(matrix: np.ndarray, start: int, rows: List[np.ndarray]) -> None:
+    matrix[start:start + len(rows)] = rows
+
+
+def _finish_export(
+    output_dir: Path,
+    version_dir: Path,
+    link_name: str,
+    matrix: Optional[np.ndarray],
+    photo_ids: List[str],
+) -> None:
+    """
+    写出行ID并把导出目录原子切换为当前版本
+
+    矩阵与行ID位于同一版本目录，通过替换符号链接一次切换，读取方解析链接后
+    看到的始终是同一次导出的两个文件。切换后保留上一个版本（可能正在被下载），
+    删除更早的版本。
+    """
+    matrix_path = version_dir / EXPORT_MATRIX_FILE
+    if matrix is None:
+        np.save(matrix_path, np.zeros((0, 0), dtype=np.float32))
+    else:
+        matrix.flush()
+        if len(photo_ids) < matrix.shape[0]:
+            # 有跳过的行：只保留实际写入的行（仅此情况需要复制）
+            trimmed = np.lib.format.open_memmap(
+                version_dir / f".{EXPORT_MATRIX_FILE}", mode="w+",
+                dtype=matrix.dtype, shape=(len(photo_ids), matrix.shape[1]),
+            )
+            trimmed[:] = matrix[:len(photo_ids)]
+            trimmed.flush()
+            del trimmed
+            os.replace(version_dir / f".{EXPORT_MATRIX_FILE}", matrix_path)
+    with open(version_dir / EXPORT_IDS_FILE, "w") as f:
+        json.dump(photo_ids, f)
+
+    link_path = output_dir / link_name
+    previous = os.readlink(link_path) if link_path.is_symlink() else None
+    tmp_link = output_dir / f".{link_name}.{version_dir.name}"
+    os.symlink(version_dir.name, tmp_link)
+    os.replace(tmp_link, link_path)
+
+    keep = {version_dir.name, previous}
+    for path in output_dir.glob(f"{link_name}.*"):
+        if path.is_dir() and path.name not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+async def export_user_embeddings(
+    collection,
+    user_id: str,
+    output_dir: Union[str, Path],
+    field: str = "visual_features",
+    chunk_size: int = 1000,
+) -> Tuple[Path, int]:
+    """
+    导出用户的全部嵌入向量
+
+    以分块游标从MongoDB流式读取，逐块写入内存映射的.npy矩阵，内存占用与
+    用户照片数量无关，文件读写在线程中执行，不阻塞事件循环。每次导出写入新的
+    版本目录（embeddings.npy与行顺序对应的photo_ids.json），写完后通过符号链接
+    <user_id>_<field>原子切换，正在下载的旧文件与行ID不会被并发的导出覆盖或错位。
+
+    Args:
+        collection: 照片集合
+        user_id: 用户ID
+        output_dir: 输出目录
+        field: 导出的嵌入字段
+        chunk_size: 游标批大小
+
+    Returns:
+        (本次导出的版本目录, 导出行数)
+    """
+    output_dir = Path(output_dir)
+    link_name = f"{user_id}_{field}"
+
+    query = {"user_id": user_id, f"features.{field}": {"$ne": None}}
+    projection = {f"features.{field}": 1}
+
+    total = await collection.count_documents(query)
+    first = await collection.find_one(query, projection)
+    sample = decode_embedding(first["features"][field]) if total and first is not None else None
+
+    await asyncio.to_thread(output_dir.mkdir, parents=True, exist_ok=True)
+    version_dir = Path(await asyncio.to_thread(tempfile.mkdtemp, dir=output_dir, prefix=f"{link_name}."))
+    try:
+        photo_ids = []
+        matrix = None
+        if sample is not None:
+            matrix = await asyncio.to_thread(
+                np.lib.format.open_memmap, version_dir / EXPORT_MATRIX_FILE,
+                mode="w+", dtype=sample.dtype, shape=(total, sample.shape[0]),
+            )
+            rows = []
+            cursor = collection.find(query, projection).sort("_id", 1).batch_size(chunk_size)
+            async for doc in cursor:
+                if len(photo_ids) >= total:
+                    break
+                try:
+                    vector = decode_embedding(doc["features"][field])
+                except ValueError:
+                    vector = None
+                if vector is None or vector.shape[0] != matrix.shape[1]:
+                    continue
+                rows.append(vector)
+                photo_ids.append(str(doc["_id"]))
+                if len(rows) >= chunk_size:
+                    await asyncio.to_thread(_write_rows, matrix, len(photo_ids) - len(rows), rows)
+                    rows = []
+            if rows:
+                await asyncio.to_thread(_write_rows, matrix, len(photo_ids) - len(rows), rows)
+            if len(photo_ids) < total:
+                logger.info(f"跳过 {total - len(photo_ids)} 条无法解码或维度不一致的嵌入向量")
+
+        await asyncio.to_thread(_finish_export, output_dir, version_dir, link_name, matrix, photo_ids)
+        del matrix
+    except BaseException:
+        await asyncio.to_thread(shutil.rmtree, version_dir, True)
+        raise
+
+    logger.info(f"已导出用户 {user_id} 的 {len(photo_ids)} 条嵌入向量: {version_dir}")
+    return version_dir, len(photo_ids)
+
+
+def load_user_embeddings(export_path: Union[str, Path]) -> Tuple[np.ndarray, List[str]]:
+    """
+    以内存映射方式加载导出的嵌入向量
+
+    Args:
+        export_path: 导出的版本目录，或指向当前版本的符号链接
+
+    Returns:
+        (只读内存映射的嵌入矩阵, 行顺序对应的照片ID列表)
+    """
+    # 先解析符号链接，矩阵与行ID从同一版本目录读取
+    version_dir = Path(os.path.realpath(export_path))
+    matrix = np.load(version_dir / EXPORT_MATRIX_FILE, mmap_mode="r")
+    with open(version_dir / EXPORT_IDS_FILE) as f:
+        return matrix, json.load(f)
@@ -3,18 +3,223 @@
 EXIF提取器服务
 
 基于现有的EXIFExtractor类功能，集成到新架构中
+
+JPEG/MPO只解析文件头部：逐段读取到SOS为止，取APP1(Exif)段和SOF段，
+不解码像素，其余段直接跳过；其他格式（HEIC、PNG、WebP）通过Pillow
+惰性打开读取EXIF。每个文件只打开一次，时间、GPS、方向、相机型号和
+尺寸一次取出。
 """
 
+import io
+import os
+import struct
 from datetime import datetime
-from typing import Tuple, Optional
+from typing import Any, BinaryIO, Dict, Optional, Tuple, Union
 from PIL import Image
 import logging
 
 logger = logging.getLogger(__name__)
 
+# TIFF 标签
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_ORIENTATION = 0x0112
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_PIXEL_X = 0xA002
+TAG_PIXEL_Y = 0xA003
+
+# TIFF 数据类型 -> (字节数, struct格式)
+TIFF_TYPES = {
+    1: (1, "B"), 2: (1, "s"), 3: (2, "H"), 4: (4, "L"),
+    5: (8, "LL"), 7: (1, "s"), 9: (4, "l"), 10: (8, "ll"),
+}
+
+# SOF 标记（C4=DHT、C8=JPG、CC=DAC 除外）
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+EXIF_HEADER = b"Exif\x00\x00"
+
+
+def _empty_metadata() -> Dict[str, Any]:
+    return {
+        "datetime": None,
+        "gps_lat": None,
+        "gps_lon": None,
+        "orientation": None,
+        "make": None,
+        "model": None,
+        "width": None,
+        "height": None,
+    }
+
+
+def _read_ifd(tiff: bytes, offset: int, endian: str, wanted: set) -> Dict[int, Any]:
+    """读取一个IFD中需要的标签"""
+    values = {}
+    if offset <= 0 or offset + 2 > len(tiff):
+        return values
+    count = struct.unpack_from(endian + "H", tiff, offset)[0]
+    for i in range(count):
+        entry = offset + 2 + i * 12
+        if entry + 12 > len(tiff):
+            break
+        tag, type_id, n = struct.unpack_from(endian + "HHL", tiff, entry)
+        if tag not in wanted or type_id not in TIFF_TYPES:
+            continue
+        size, fmt = TIFF_TYPES[type_id]
+        total = size * n
+        data_offset = entry + 8 if total <= 4 else struct.unpack_from(endian + "L", tiff, entry + 8)[0]
+        if data_offset + total > len(tiff):
+            continue
+        if fmt == "s":
+            values[tag] = tiff[data_offset:data_offset + total].split(b"\x00", 1)[0].decode("ascii", "ignore").strip()
+        elif len(fmt) == 2:
+            values[tag] = tuple(
+                num / den if den else 0.0
+                for num, den in (struct.unpack_from(endian + fmt, tiff, data_offset + k * 8) for k in range(n))
+            )
+        else:
+            values[tag] = struct.unpack_from(endian + fmt, tiff, data_offset)[0]
+    return values
+
+
+def parse_tiff_exif(tiff: bytes) -> Dict[str, Any]:
+    """
+    解析TIFF格式的EXIF数据（APP1段去掉"Exif\\0\\0"之后的部分）
+
+    Returns:
+        元数据字典（datetime/gps_lat/gps_lon/orientation/make/model/width/height）
+    """
+    metadata = _empty_metadata()
+    if tiff.startswith(EXIF_HEADER):
+        tiff = tiff[len(EXIF_HEADER):]
+    if len(tiff) < 8 or tiff[:2] not in (b"II", b"MM"):
+        return metadata
+    endian = "<" if tiff[:2] == b"II" else ">"
+    ifd0_offset = struct.unpack_from(endian + "L", tiff, 4)[0]
+
+    ifd0 = _read_ifd(tiff, ifd0_offset, endian, {
+        TAG_MAKE, TAG_MODEL, TAG_ORIENTATION, TAG_DATETIME, TAG_EXIF_IFD, TAG_GPS_IFD,
+    })
+    exif_ifd = _read_ifd(tiff, ifd0.get(TAG_EXIF_IFD, 0), endian, {
+        TAG_DATETIME_ORIGINAL, TAG_PIXEL_X, TAG_PIXEL_Y,
+    })
+    gps_ifd = _read_ifd(tiff, ifd0.get(TAG_GPS_IFD, 0), endian, {1, 2, 3, 4})
+
+    metadata["make"] = ifd0.get(TAG_MAKE) or None
+    metadata["model"] = ifd0.get(TAG_MODEL) or None
+    metadata["orientation"] = ifd0.get(TAG_ORIENTATION)
+    metadata["width"] = exif_ifd.get(TAG_PIXEL_X)
+    metadata["height"] = exif_ifd.get(TAG_PIXEL_Y)
+
+    # DateTimeOriginal (36867)，其次 DateTime (306)，格式: "2023:12:25 14:30:00"
+    date_str = exif_ifd.get(TAG_DATETIME_ORIGINAL) or ifd0.get(TAG_DATETIME)
+    if date_str:
+        try:
+            metadata["datetime"] = datetime.strptime(date_str[:19], "%Y:%m:%d %H:%M:%S")
+        except ValueError:
+            pass
+
+    if 2 in gps_ifd and 1 in gps_ifd:  # GPSLatitude, GPSLatitudeRef
+        metadata["gps_lat"] = EXIFExtractor.get_decimal_from_dms(gps_ifd[2], gps_ifd[1])
+    if 4 in gps_ifd and 3 in gps_ifd:  # GPSLongitude, GPSLongitudeRef
+        metadata["gps_lon"] = EXIFExtractor.get_decimal_from_dms(gps_ifd[4], gps_ifd[3])
+    return metadata
+
+
+def _read_jpeg_header(f: BinaryIO) -> Optional[Dict[str, Any]]:
+    """
+    逐段读取JPEG头部，只读取APP1(Exif)和SOF段的内容
+
+    Returns:
+        元数据字典；不是JPEG时返回None
+    """
+    if f.read(2) != b"\xff\xd8":
+        return None
+    tiff = None
+    size = None
+    while True:
+        byte = f.read(1)
+        if byte != b"\xff":
+            break
+        marker = f.read(1)
+        while marker == b"\xff":  # 填充字节
+            marker = f.read(1)
+        if not marker or marker == b"\xda":  # SOS：头部结束
+            break
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            break
+        length = struct.unpack(">H", length_bytes)[0] - 2
+        if length < 0:  # 段长度包含长度字段本身，小于2说明数据损坏
+            break
+        code = marker[0]
+        if code == 0xE1 and tiff is None:
+            segment = f.read(length)
+            if segment.startswith(EXIF_HEADER):
+                tiff = segment[len(EXIF_HEADER):]
+            continue
+        if code in SOF_MARKERS:
+            segment = f.read(length)
+            if len(segment) >= 5:
+                height, width = struct.unpack(">HH", segment[1:5])
+                size = (width, height)
+            break  # EXIF 位于 SOF 之前
+        f.seek(length, io.SEEK_CUR)
+
+    metadata = parse_tiff_exif(tiff) if tiff else _empty_metadata()
+    if size:
+        metadata["width"], metadata["height"] = size
+    return metadata
+
+
+def _read_with_pillow(f: BinaryIO) -> Dict[str, Any]:
+    """非JPEG格式：Pillow惰性打开（不解码像素）读取EXIF"""
+    with Image.open(f) as img:
+        raw = img.info.get("exif")
+        if not raw:
+            exif = img.getexif()
+            raw = exif.tobytes() if exif else None
+        metadata = parse_tiff_exif(raw) if raw else _empty_metadata()
+        metadata["width"], metadata["height"] = img.size
+    return metadata
+
+
+def read_exif_header(source: Union[str, bytes, BinaryIO]) -> Dict[str, Any]:
+    """
+    一次性读取照片元数据
+
+    Args:
+        source: 文件路径、图片字节或二进制文件对象
+
+    Returns:
+        {datetime, gps_lat, gps_lon, orientation, make, model, width, height}，
+        缺失的字段为None
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        f = io.BytesIO(source)
+    elif isinstance(source, (str, os.PathLike)):
+        f = open(source, "rb")
+    else:
+        f = source
+    try:
+        start = f.tell()
+        metadata = _read_jpeg_header(f)
+        if metadata is None:
+            f.seek(start)
+            metadata = _read_with_pillow(f)
+        return metadata
+    finally:
+        if f is not source:
+            f.close()
+
+
 class EXIFExtractor:
     """从照片中提取EXIF元数据"""
-    
+
     @staticmethod
     def get_decimal_from_dms(dms, ref) -> float:
         """将 GPS DMS 格式转为 Decimal"""
@@ -30,83 +235,53 @@ class EXIFExtractor:
         except Exception as e:
             logger.warning(f"GPS格式转换失败: {e}")
             return None
-    
+
     @staticmethod
-    def extract_datetime(image_path: str) -> datetime:
-        """提取拍摄时间"""
+    def read_metadata(source: Union[str, bytes, BinaryIO]) -> Dict[str, Any]:
+        """读取元数据，失败时返回空字段而不抛出异常"""
         try:
-            with Image.open(image_path) as img:
-                exif = img._getexif()
-                if exif:
-                    # DateTimeOriginal (36867)
-                    date_str = exif.get(36867) or exif.get(306)  # DateTime (306)
-                    if date_str:
-                        # 格式: "2023:12:25 14:30:00"
-                        return datetime.strptime(date_str, "%Y:%m:%d %H:%M:%S")
+            return read_exif_header(source)
         except Exception as e:
-            logger.warning(f"无法提取时间戳 {image_path}: {e}")
+            name = source if isinstance(source, str) else "<bytes>"
+            logger.warning(f"无法读取EXIF {name}: {e}")
+            return _empty_metadata()
 
-        # 备用：使用文件修改时间
+    @staticmethod
+    def _fallback_datetime(image_path: str) -> datetime:
+        """备用：使用文件修改时间"""
         try:
-            import os
             return datetime.fromtimestamp(os.path.getmtime(image_path))
         except Exception as e:
             logger.warning(f"无法获取文件修改时间: {e}")
             return datetime.now()
-    
+
+    @staticmethod
+    def extract_datetime(image_path: str) -> datetime:
+        """提取拍摄时间"""
+        dt = EXIFExtractor.read_metadata(image_path)["datetime"]
+        return dt or EXIFExtractor._fallback_datetime(image_path)
+
     @staticmethod
     def extract_gps(image_path: str) -> Tuple[Optional[float], Optional[float]]:
         """提取 GPS 坐标"""
-        try:
-            with Image.open(image_path) as img:
-                exif = img._getexif()
-                if exif and 34853 in exif:  # GPSInfo
-                    gps_info = exif[34853]
-
-                    lat = None
-                    lon = None
-
-                    # 纬度
-                    if 2 in gps_info and 1 in gps_info:  # GPSLatitude, GPSLatitudeRef
-                        lat = EXIFExtractor.get_decimal_from_dms(
-                            gps_info[2], gps_info[1]
-                        )
-
-                    # 经度
-                    if 4 in gps_info and 3 in gps_info:  # GPSLongitude, GPSLongitudeRef
-                        lon = EXIFExtractor.get_decimal_from_dms(
-                            gps_info[4], gps_info[3]
-                        )
-
-                    return lat, lon
-        except Exception as e:
-            logger.warning(f"无法提取GPS {image_path}: {e}")
+        metadata = EXIFExtractor.read_metadata(image_path)
+        return metadata["gps_lat"], metadata["gps_lon"]
 
-        return None, None
-    
     @classmethod
     def process_photo(cls, photo_path: str) -> dict:
-        """处理单张照片，提取所有元数据"""
-        try:
-            filename = photo_path.split('/')[-1]
-            dt = cls.extract_datetime(photo_path)
-            lat, lon = cls.extract_gps(photo_path)
-
-            return {
-                "path": photo_path,
-                "filename": filename,
-                "datetime": dt,
-                "gps_lat": lat,
-                "gps_lon": lon,
-                "has_gps": lat is not None and lon is not None
-            }
-        except Exception as e:
-            logger.warning(f"处理照片失败 {photo_path}: {e}")
-            return {
-                "path": photo_path,
-                "filename": photo_path.split('/')[-1],
-                "datetime": datetime.now(),
-                "gps_lat": None,
-                "gps_lon": None,
-                "has_gps": False
-            }
+        """处理单张照片，提取所有元数据（只打开一次文件）"""
+        metadata = cls.read_metadata(photo_path)
+        lat, lon = metadata["gps_lat"], metadata["gps_lon"]
+        return {
+            "path": photo_path,
+            "filename": photo_path.split('/')[-1],
+            "datetime": metadata["datetime"] or cls._fallback_datetime(photo_path),
+            "gps_lat": lat,
+            "gps_lon": lon,
+            "has_gps": lat is not None and lon is not None,
+            "orientation": metadata["orientation"],
+            "make": metadata["make"],
+            "model": metadata["model"],
+            "width": metadata["width"],
+            "height": metadata["height"],
+        }
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+图片特征缓存服务
+
+以图片内容MD5为键缓存特征提取结果，跨用户、跨分析任务复用。
+本地LRU作为一级缓存，MongoDB作为持久化二级缓存；
+每条记录带有模型版本号，模型升级后旧特征视为过期并重新计算。
+"""
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from app.config.database import feature_cache_collection
+from app.services.embedding_store import decode_features, encode_features
+from app.services.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class FeatureCache:
+    """基于内容哈希的特征缓存"""
+
+    def __init__(self, model_version: str, max_entries: int = 4096, collection=None):
+        """
+        初始化特征缓存
+
+        Args:
+            model_version: 特征模型版本号，版本不一致的缓存视为过期
+            max_entries: 本地LRU最大条目数
+            collection: MongoDB集合，默认使用feature_cache集合
+        """
+        self.model_version = model_version
+        self.local_cache = LRUCache(max_entries=max_entries)
+        self.collection = collection if collection is not None else feature_cache_collection
+        self.stats = {"local_hits": 0, "db_hits": 0, "misses": 0, "stale": 0}
+
+    async def get(self, image_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存的特征
+
+        Args:
+            image_hash: 图片MD5哈希值
+
+        Returns:
+            特征字典，未命中或版本过期时返回None
+        """
+        if not image_hash:
+            return None
+
+        features = self.local_cache.get(image_hash)
+        if features is not None:
+            self.stats["local_hits"] += 1
+            return features
+
+        try:
+            doc = await self.collection.find_one({"image_hash": image_hash})
+        except Exception as e:
+            logger.warning(f"查询特征缓存失败: {e}")
+            doc = None
+
+        if not doc:
+            self.stats["misses"] += 1
+            return None
+
+        if doc.get("model_version") != self.model_version:
+            logger.info(
+                f"特征缓存版本过期: {image_hash} ({doc.get('model_version')} -> {self.model_version})"
+            )
+            self.stats["stale"] += 1
+            return None
+
+        features = decode_features(doc.get("features"))
+        if features is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.local_cache.set(image_hash, features)
+        self.stats["db_hits"] += 1
+        return features
+
+    async def set(self, image_hash: str, features: Dict[str, Any]) -> None:
+        """
+        写入特征缓存，提取失败的结果不缓存
+
+        Args:
+            image_hash: 图片MD5哈希值
+            features: 特征字典
+        """
+        if not image_hash or not features or features.get("error"):
+            return
+
+        self.local_cache.set(image_hash, features)
+        try:
+            await self.collection.update_one(
+                {"image_hash": image_hash},
+                {"$set": {
+                    "image_hash": image_hash,
+                    "model_version": self.model_version,
+                    "features": encode_features(features),
+                    "updated_at": datetime.now(),
+                }},
+                upsert=True,
+            )
+        except Exception as e:
+            logger.warning(f"写入特征缓存失败: {e}")
+
+    async def get_or_extract(self, image_hash: str, extractor, image_data: bytes) -> Dict[str, Any]:
+        """
+        命中缓存直接返回，否则调用提取器计算并写回缓存
+
+        Args:
+            image_hash: 图片MD5哈希值
+            extractor: ImageFeaturesExtractor实例
+            image_data: 图片数据
+
+        Returns:
+            特征字典
+        """
+        features = await self.get(image_hash)
+        if features is not None:
+            return features
+
+        features = await extractor.extract_features(image_data)
+        await self.set(image_hash, features)
+        return features
+
+
+_shared_cache: Optional[FeatureCache] = None
+
+
+def get_feature_cache() -> FeatureCache:
+    """获取进程内共享的特征缓存实例，使本地LRU在多次分析之间保持有效"""
+    global _shared_cache
+    if _shared_cache is None:
+        from app.services.image_features import ImageFeaturesExtractor
+
+        _shared_cache = FeatureCache(model_version=ImageFeaturesExtractor.MODEL_VERSION)
+    return _shared_cache
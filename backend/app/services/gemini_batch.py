@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Gemini批处理（Batch API）
+
+离线分析不需要实时结果时，Phase 1的全部请求写成一个JSONL任务提交，
+按批处理价格（约为实时调用的一半）计费：
+1. 每个请求一行 {"key": ..., "request": {"contents": [...]}}，经Files API上传
+2. models/<模型>:batchGenerateContent 创建任务
+3. 轮询任务状态直至结束，下载结果文件，按key映射回各批次
+
+任务状态（任务名、上传的文件、包含的key）每次变化时交给调用方保存，
+进程重启后用保存的状态继续轮询同一任务，不会重复提交。
+
+只使用标准库（REST接口），后端与CLI工具共用；GEMINI_API_BASE指向
+本地模拟服务即可测试。
+"""
+
+import asyncio
+import base64
+import http.client
+import io
+import json
+import logging
+import os
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+# 轮询间隔（秒）与最长等待时间（秒，Batch API目标周转时间为24小时）
+BATCH_POLL_INTERVAL = float(os.getenv("GEMINI_BATCH_POLL_INTERVAL", "30"))
+BATCH_TIMEOUT = float(os.getenv("GEMINI_BATCH_TIMEOUT", str(24 * 3600)))
+
+SUCCEEDED = "BATCH_STATE_SUCCEEDED"
+TERMINAL_STATES = {SUCCEEDED, "BATCH_STATE_FAILED", "BATCH_STATE_CANCELLED", "BATCH_STATE_EXPIRED"}
+
+
+class GeminiBatchError(Exception):
+    """批处理任务失败；code为HTTP状态码（任务本身失败时为None）"""
+
+    def __init__(self, message: str, code: int = None):
+        super().__init__(message)
+        self.code = code
+
+
+class GeminiBatchTimeout(GeminiBatchError):
+    """等待超时，任务可能仍在运行（保留任务状态，下次继续）"""
+
+
+def can_resume(state: Optional[Dict[str, Any]], model_name: str, keys) -> bool:
+    """
+    保存的任务状态能否继续：包含全部key、模型相同且任务未失败
+
+    可以继续时调用方无需构建请求内容（上传图片等），run_batch_job只使用请求的key
+    """
+    return bool(
+        state
+        and state.get("batch_name")
+        and state.get("model") == model_name
+        and set(keys) <= set(state.get("keys", []))
+        and state.get("state") not in TERMINAL_STATES - {SUCCEEDED}
+    )
+
+
+def to_request_part(part: Any) -> Dict[str, Any]:
+    """
+    将generate_content的内容部分转换为REST格式
+
+    Args:
+        part: 文本，{"mime_type", "data"}图片（data为字节或base64字符串），
+            或{"file_data": {"mime_type", "file_uri"}}已上传文件的引用
+
+    Returns:
+        {"text": ...}、{"inline_data": {"mime_type", "data"}} 或 {"file_data": ...}
+    """
+    if isinstance(part, str):
+        return {"text": part}
+    if "file_data" in part:
+        return {"file_data": dict(part["file_data"])}
+    data = part["data"]
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = base64.b64encode(bytes(data)).decode("ascii")
+    return {"inline_data": {"mime_type": part["mime_type"], "data": data}}
+
+
+def build_request(content: List[Any], generation_config: Dict[str, Any] = None) -> Dict[str, Any]:
+    """generate_content的内容列表（与生成配置） -> GenerateContentRequest"""
+    request = {"contents": [{"role": "user", "parts": [to_request_part(part) for part in content]}]}
+    if generation_config:
+        request["generation_config"] = generation_config
+    return request
+
+
+def parse_response(line: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    解析结果文件中的一行
+
+    Returns:
+        {"text", "usage", "error"}；usage为total/prompt/candidates/cached四项token数
+    """
+    if "error" in line:
+        return {"text": "", "usage": None, "error": line["error"].get("message") or str(line["error"])}
+    response = line.get("response") or {}
+    candidates = response.get("candidates") or []
+    parts = (candidates[0].get("content") or {}).get("parts", []) if candidates else []
+    text = "".join(part.get("text", "") for part in parts)
+    usage = response.get("usageMetadata") or {}
+    return {
+        "text": text,
+        "usage": {
+            "total": usage.get("totalTokenCount", 0),
+            "prompt": usage.get("promptTokenCount", 0),
+            "candidates": usage.get("candidatesTokenCount", 0),
+            "cached": usage.get("cachedContentTokenCount", 0),
+        },
+        "error": None if text else f"响应不包含文本（{(candidates[0].get('finishReason') if candidates else '无候选结果')}）",
+    }
+
+
+class GeminiBatchClient:
+    """Batch API与Files API的REST客户端（同步）"""
+
+    def __init__(self, api_key: str = None, base_url: str = None, timeout: float = 300):
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY", "")
+        self.base_url = (base_url or GEMINI_API_BASE).rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, method: str, url: str, body: bytes = None, headers: Dict[str, str] = None):
+        request = urllib.request.Request(url, data=body, method=method, headers={
+            "x-goog-api-key": self.api_key, **(headers or {}),
+        })
+        # 网络错误、超时、响应不完整统一转为GeminiBatchError（code为None），调用方按可重试处理或退回实时分析
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            raise GeminiBatchError(f"{method} {url} 失败: {e.code} {e.read().decode('utf-8', 'ignore')}", e.code)
+        except (OSError, http.client.HTTPException) as e:
+            raise GeminiBatchError(f"{method} {url} 失败: {e}")
+
+    @staticmethod
+    def _parse(data: bytes, description: str) -> Dict[str, Any]:
+        try:
+            parsed = json.loads(data or b"{}")
+        except ValueError as e:
+            raise GeminiBatchError(f"{description}返回的不是有效JSON: {e}")
+        if not isinstance(parsed, dict):
+            raise GeminiBatchError(f"{description}返回格式错误")
+        return parsed
+
+    @staticmethod
+    def _field(payload: Dict[str, Any], key: str, description: str) -> Any:
+        if not payload.get(key):
+            raise GeminiBatchError(f"{description}的响应缺少{key}")
+        return payload[key]
+
+    def _json(self, method: str, path: str, payload: Dict[str, Any] = None) -> Dict[str, Any]:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        _, data = self._request(method, f"{self.base_url}/v1beta/{path}", body, {"Content-Type": "application/json"})
+        return self._parse(data, f"{method} {path} ")
+
+    def upload_file(self, data: bytes, mime_type: str, display_name: str) -> Dict[str, Any]:
+        """经Files API（可续传上传协议）上传，返回文件资源（name、uri、mimeType、expirationTime等）"""
+        headers, _ = self._request("POST", f"{self.base_url}/upload/v1beta/files", json.dumps({
+            "file": {"display_name": display_name},
+        }).encode("utf-8"), {
+            "X-Goog-Upload-Protocol": "resumable",
+            "X-Goog-Upload-Command": "start",
+            "X-Goog-Upload-Header-Content-Length": str(len(data)),
+            "X-Goog-Upload-Header-Content-Type": mime_type,
+            "Content-Type": "application/json",
+        })
+        upload_url = headers.get("X-Goog-Upload-URL")
+        if not upload_url:
+            raise GeminiBatchError("上传未返回X-Goog-Upload-URL")
+        _, body = self._request("POST", upload_url, data, {
+            "X-Goog-Upload-Offset": "0",
+            "X-Goog-Upload-Command": "upload, finalize",
+            "Content-Length": str(len(data)),
+        })
+        return self._field(self._parse(body, "上传文件"), "file", "上传文件")
+
+    def upload_jsonl(self, data: bytes, display_name: str) -> str:
+        """上传批处理任务的JSONL，返回文件名 files/..."""
+        return self.upload_file(data, "application/jsonl", display_name)["name"]
+
+    def get_file(self, file_name: str) -> Dict[str, Any]:
+        """文件资源（state为PROCESSING时尚不可引用）"""
+        return self._json("GET", file_name)
+
+    def create_batch(self, model_name: str, file_name: str, display_name: str) -> str:
+        """创建批处理任务，返回任务名 batches/..."""
+        operation = self._json("POST", f"{model_name}:batchGenerateContent", {
+            "batch": {"display_name": display_name, "input_config": {"file_name": file_name}},
+        })
+        return self._field(operation, "name", "创建批处理任务")
+
+    def get_batch(self, batch_name: str) -> Dict[str, Any]:
+        """任务状态（REST Operation：metadata.state，结束后response.responsesFile）"""
+        return self._json("GET", batch_name)
+
+    def download(self, file_name: str) -> bytes:
+        _, data = self._request("GET", f"{self.base_url}/download/v1beta/{file_name}:download?alt=media")
+        return data
+
+
+def _batch_state(operation: Dict[str, Any]) -> Optional[str]:
+    return (operation.get("metadata") or {}).get("state") or operation.get("state")
+
+
+def _responses_file(operation: Dict[str, Any]) -> Optional[str]:
+    for source in (operation.get("response"), (operation.get("metadata") or {}).get("output"), operation):
+        if source and source.get("responsesFile"):
+            return source["responsesFile"]
+    return None
+
+
+async def run_batch_job(
+    client: GeminiBatchClient,
+    model_name: str,
+    requests: Dict[str, Dict[str, Any]],
+    state: Optional[Dict[str, Any]],
+    save_state: Callable[[Dict[str, Any]], Awaitable[None]],
+    display_name: str = "phase1",
+    poll_interval: float = None,
+    timeout: float = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    提交（或继续）批处理任务并等待结果
+
+    Args:
+        client: Batch API客户端
+        model_name: 模型名称
+        requests: key -> GenerateContentRequest；继续已保存的任务时（见can_resume）只使用key，值可以为None
+        state: 上次保存的任务状态；包含全部key、模型相同且未失败时继续该任务
+        save_state: 保存任务状态的回调（提交后、状态变化时调用）
+        display_name: 任务显示名称
+        poll_interval: 轮询间隔（秒），默认GEMINI_BATCH_POLL_INTERVAL
+        timeout: 最长等待时间（秒），默认GEMINI_BATCH_TIMEOUT
+
+    Returns:
+        key -> {"text", "usage", "error"}；结果文件中缺失的key不在返回值中
+
+    Raises:
+        GeminiBatchTimeout: 等待超时（任务状态已保存，可继续）
+        GeminiBatchError: 任务失败或无法查询
+    """
+    poll_interval = poll_interval or BATCH_POLL_INTERVAL
+    timeout = timeout or BATCH_TIMEOUT
+
+    if can_resume(state, model_name, requests):
+        logger.info(f"继续批处理任务 {state['batch_name']}（{len(requests)} 个请求）")
+    else:
+        buffer = io.BytesIO()
+        for key, request in requests.items():
+            buffer.write(json.dumps({"key": key, "request": request}, ensure_ascii=False).encode("utf-8"))
+            buffer.write(b"\n")
+        data = buffer.getvalue()
+        file_name = await asyncio.to_thread(client.upload_jsonl, data, f"{display_name}.jsonl")
+        batch_name = await asyncio.to_thread(client.create_batch, model_name, file_name, display_name)
+        state = {
+            "batch_name": batch_name,
+            "file_name": file_name,
+            "model": model_name,
+            "keys": list(requests),
+            "state": "BATCH_STATE_PENDING",
+            "submitted_at": datetime.utcnow().isoformat(),
+        }
+        await save_state(state)
+        logger.info(f"已提交批处理任务 {batch_name}：{len(requests)} 个请求，JSONL {len(data) / 1e6:.1f} MB")
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            operation = await asyncio.to_thread(client.get_batch, state["batch_name"])
+        except GeminiBatchError as e:
+            # 网络错误、限流、服务端错误不影响任务本身，下次轮询再查
+            if e.code is not None and e.code != 429 and e.code < 500:
+                raise
+            logger.warning(f"查询批处理任务状态失败，稍后重试: {e}")
+            if time.monotonic() > deadline:
+                raise GeminiBatchTimeout(f"批处理任务 {state['batch_name']} 等待超时: {e}", e.code) from e
+            await asyncio.sleep(poll_interval)
+            continue
+        batch_state = _batch_state(operation)
+        if batch_state != state.get("state"):
+            state = {**state, "state": batch_state}
+            await save_state(state)
+            logger.info(f"批处理任务 {state['batch_name']} 状态: {batch_state}")
+        if batch_state in TERMINAL_STATES:
+            break
+        if time.monotonic() > deadline:
+            raise GeminiBatchTimeout(f"批处理任务 {state['batch_name']} 等待超时（{timeout:g} 秒）")
+        await asyncio.sleep(poll_interval)
+
+    if batch_state != SUCCEEDED:
+        raise GeminiBatchError(f"批处理任务 {state['batch_name']} 结束状态为 {batch_state}")
+    responses_file = _responses_file(operation)
+    if not responses_file:
+        raise GeminiBatchError(f"批处理任务 {state['batch_name']} 未返回结果文件")
+
+    data = await asyncio.to_thread(client.download, responses_file)
+    results = {}
+    for raw in data.decode("utf-8", "replace").splitlines():
+        if not raw.strip():
+            continue
+        try:
+            line = json.loads(raw)
+            if line.get("key") in requests:
+                results[line["key"]] = parse_response(line)
+        except (ValueError, AttributeError, IndexError, TypeError) as e:
+            # 无法解析的行按缺失处理，对应批次由调用方重新实时分析
+            logger.warning(f"批处理结果行解析失败: {e}")
+    return results
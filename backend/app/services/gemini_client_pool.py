@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Gemini客户端池
+
+按（模型、配置）复用长期存在的GenerativeModel对象，不再每个批次、每次调用
+都重新构建；SDK底层的HTTP/gRPC客户端由进程共享，模型对象复用后每次
+调用不再有额外的初始化开销。
+
+generate经对应模型的共享调度器（限流、重试）发出，并为每次请求设置超时；
+generate_stream流式接收，每收到一段文本即回调，重试时从头重新回调。
+模型工厂可注入，测试时替换为本地模拟客户端。
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, Optional
+
+import google.generativeai as genai
+
+from app.services.gemini_scheduler import estimate_tokens, get_gemini_scheduler
+
+logger = logging.getLogger(__name__)
+
+# 单次请求超时（秒），超时按504由调度器重试
+GEMINI_REQUEST_TIMEOUT = float(os.getenv("GEMINI_REQUEST_TIMEOUT", "600"))
+
+
+class GeminiClientPool:
+    """按模型和配置复用GenerativeModel"""
+
+    def __init__(
+        self,
+        model_factory: Callable[..., Any] = None,
+        timeout: float = None,
+    ):
+        """
+        初始化客户端池
+
+        Args:
+            model_factory: 构建模型的调用 (model_name, **config)，默认genai.GenerativeModel
+            timeout: 默认请求超时（秒），默认GEMINI_REQUEST_TIMEOUT
+        """
+        self.model_factory = model_factory or genai.GenerativeModel
+        self.timeout = timeout or GEMINI_REQUEST_TIMEOUT
+        self.models: Dict[str, Any] = {}
+        self.stats = {"models_created": 0, "requests": 0}
+
+    def get_model(self, model_name: str, **config) -> Any:
+        """
+        获取模型对象（首次使用时构建）
+
+        Args:
+            model_name: 模型名称
+            **config: generation_config、system_instruction等构建参数
+
+        Returns:
+            GenerativeModel
+        """
+        key = model_name
+        if config:
+            key += "\n" + json.dumps(config, ensure_ascii=False, sort_keys=True, default=str)
+        model = self.models.get(key)
+        if model is None:
+            model = self.model_factory(model_name, **config)
+            self.models[key] = model
+            self.stats["models_created"] += 1
+            logger.info(f"已创建Gemini模型客户端 {model_name}")
+        return model
+
+    async def generate(
+        self,
+        model_name: str,
+        content: Any,
+        model: Any = None,
+        timeout: float = None,
+        estimated_tokens: int = None,
+        generation_config: Dict[str, Any] = None,
+        **config,
+    ) -> Any:
+        """
+        生成内容（经调度器限流与重试）
+
+        Args:
+            model_name: 模型名称（决定使用的调度器）
+            content: 请求内容
+            model: 使用指定的模型对象（如引用上下文缓存的模型），默认从池中获取
+            timeout: 请求超时（秒），默认使用池的超时
+            estimated_tokens: 调度器预扣的token数，默认按内容估算
+            generation_config: 本次请求的生成配置（如response_schema），对引用上下文缓存的模型同样有效
+            **config: 模型构建参数
+
+        Returns:
+            SDK的响应对象
+        """
+        if model is None:
+            model = self.get_model(model_name, **config)
+        self.stats["requests"] += 1
+        options = {"request_options": {"timeout": timeout or self.timeout}}
+        if generation_config:
+            options["generation_config"] = generation_config
+        return await get_gemini_scheduler(model_name).call(
+            model.generate_content,
+            content,
+            estimated_tokens=estimated_tokens,
+            **options,
+        )
+
+    async def generate_stream(
+        self,
+        model_name: str,
+        content: Any,
+        on_text: Callable[[str], None],
+        model: Any = None,
+        timeout: float = None,
+        estimated_tokens: int = None,
+        generation_config: Dict[str, Any] = None,
+        **config,
+    ) -> Any:
+        """
+        流式生成内容（经调度器限流与重试）
+
+        Args:
+            model_name: 模型名称（决定使用的调度器）
+            content: 请求内容
+            on_text: 收到新文本时在事件循环线程中回调，参数为目前为止的完整文本
+            model: 使用指定的模型对象，默认从池中获取
+            timeout: 请求超时（秒），默认使用池的超时
+            estimated_tokens: 调度器预扣的token数，默认按内容估算
+            generation_config: 本次请求的生成配置
+            **config: 模型构建参数
+
+        Returns:
+            接收完毕的响应对象（text、usage_metadata与非流式一致）
+        """
+        if model is None:
+            model = self.get_model(model_name, **config)
+        if estimated_tokens is None:
+            estimated_tokens = estimate_tokens(content)
+        loop = asyncio.get_running_loop()
+        options = {"request_options": {"timeout": timeout or self.timeout}}
+        if generation_config:
+            options["generation_config"] = generation_config
+
+        def receive():
+            response = model.generate_content(content, stream=True, **options)
+            text = ""
+            for chunk in response:
+                try:
+                    piece = chunk.text
+                except ValueError:
+                    # 不含文本的分块（如只有安全评级）
+                    piece = ""
+                if piece:
+                    text += piece
+                    loop.call_soon_threadsafe(on_text, text)
+            return response
+
+        self.stats["requests"] += 1
+        return await get_gemini_scheduler(model_name).call(receive, estimated_tokens=estimated_tokens)
+
+
+_shared_pool: Optional[GeminiClientPool] = None
+
+
+def get_gemini_client_pool() -> GeminiClientPool:
+    """获取进程内共享的Gemini客户端池"""
+    global _shared_pool
+    if _shared_pool is None:
+        _shared_pool = GeminiClientPool()
+    return _shared_pool
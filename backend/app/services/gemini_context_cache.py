@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Gemini上下文缓存
+
+Phase 1各批次共用同一段提示词前缀（分析指令 + 主角特征），每次调用都重复
+发送会反复计费。这里将前缀创建为显式的CachedContent（带TTL），各批次
+引用缓存名称调用，只发送本批次的图片和照片信息。
+
+- 按（模型、前缀）摘要复用缓存，同一前缀并发请求时只创建一次
+- 剩余有效期不足时延长TTL，过期后重新创建
+- 前缀低于模型的最小缓存token数、SDK不支持或创建失败时返回None，
+  调用方退回发送完整提示词；创建失败的前缀在一个TTL内不再重试
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+# 上下文缓存（可选，google-generativeai >= 0.7）
+try:
+    from google.generativeai import caching
+    CONTEXT_CACHE_AVAILABLE = True
+except ImportError:
+    caching = None
+    CONTEXT_CACHE_AVAILABLE = False
+    logger.warning("google-generativeai 版本不支持上下文缓存，Phase 1 将发送完整提示词")
+
+# 缓存有效期（秒），需覆盖一次Phase 1的耗时
+CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+# 剩余有效期低于该比例时延长TTL
+REFRESH_FRACTION = 0.25
+
+# 各模型允许缓存的最小token数
+MIN_CACHE_TOKENS = {
+    "models/gemini-2.5-flash": 1024,
+    "models/gemini-2.5-pro": 4096,
+}
+DEFAULT_MIN_CACHE_TOKENS = 4096
+
+
+def _prefix_key(model_name: str, prefix: str) -> str:
+    return hashlib.sha256(f"{model_name}\n{prefix}".encode("utf-8")).hexdigest()
+
+
+class ContextCacheManager:
+    """管理共享提示词前缀的Gemini上下文缓存"""
+
+    def __init__(
+        self,
+        ttl: int = None,
+        create_cache: Callable[..., Any] = None,
+        model_from_cache: Callable[[Any], Any] = None,
+    ):
+        """
+        初始化缓存管理器
+
+        Args:
+            ttl: 缓存有效期（秒），默认GEMINI_CONTEXT_CACHE_TTL
+            create_cache: 创建缓存的同步调用，默认caching.CachedContent.create
+            model_from_cache: 由缓存构建模型的调用，默认GenerativeModel.from_cached_content
+        """
+        self.ttl = ttl or CONTEXT_CACHE_TTL
+        if create_cache is None and CONTEXT_CACHE_AVAILABLE:
+            create_cache = caching.CachedContent.create
+            model_from_cache = model_from_cache or genai.GenerativeModel.from_cached_content
+        self.create_cache = create_cache
+        self.model_from_cache = model_from_cache
+        # 摘要 -> (缓存对象, 过期时间)；创建失败时缓存对象为None
+        self.entries: Dict[str, Tuple[Any, float]] = {}
+        # 缓存名称 -> 引用该缓存的模型（复用，不为每个批次重新构建）
+        self.models: Dict[str, Any] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self.stats = {"created": 0, "reused": 0, "refreshed": 0, "failed": 0}
+
+    async def get_model(
+        self, model_name: str, prefix: str, prefix_tokens: int = None
+    ) -> Optional[Any]:
+        """
+        获取引用前缀缓存的模型
+
+        Args:
+            model_name: 模型名称
+            prefix: 各请求共用的提示词前缀
+            prefix_tokens: 前缀的估算token数，默认按字符数估算
+
+        Returns:
+            引用缓存的GenerativeModel；无法使用缓存时返回None
+        """
+        if self.create_cache is None:
+            return None
+        if prefix_tokens is None:
+            prefix_tokens = len(prefix)
+        if prefix_tokens < MIN_CACHE_TOKENS.get(model_name, DEFAULT_MIN_CACHE_TOKENS):
+            return None
+
+        key = _prefix_key(model_name, prefix)
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            cache, expires_at = self.entries.get(key, (None, 0.0))
+            now = time.time()
+            if cache is None and expires_at > now:
+                return None
+            if cache is not None and expires_at - now > self.ttl * REFRESH_FRACTION:
+                self.stats["reused"] += 1
+                return self._model_for(cache)
+
+            try:
+                if cache is not None and expires_at > now:
+                    await asyncio.to_thread(cache.update, ttl=timedelta(seconds=self.ttl))
+                    self.stats["refreshed"] += 1
+                else:
+                    cache = await asyncio.to_thread(
+                        self.create_cache,
+                        model=model_name,
+                        contents=[{"role": "user", "parts": [prefix]}],
+                        ttl=timedelta(seconds=self.ttl),
+                    )
+                    self.stats["created"] += 1
+                    logger.info(f"已创建上下文缓存 {cache.name}（{model_name}，TTL {self.ttl} 秒）")
+            except Exception as e:
+                # 前缀过短、模型不支持等错误立即重试也不会改变，一个TTL后再尝试
+                logger.warning(f"创建上下文缓存失败，退回发送完整提示词: {e}")
+                self.entries[key] = (None, time.time() + self.ttl)
+                self.stats["failed"] += 1
+                return None
+
+            self.entries[key] = (cache, time.time() + self.ttl)
+            return self._model_for(cache)
+
+    def _model_for(self, cache: Any) -> Any:
+        model = self.models.get(cache.name)
+        if model is None:
+            model = self.model_from_cache(cache)
+            self.models[cache.name] = model
+        return model
+
+
+_shared_manager: Optional[ContextCacheManager] = None
+
+
+def get_context_cache() -> ContextCacheManager:
+    """获取进程内共享的上下文缓存管理器"""
+    global _shared_manager
+    if _shared_manager is None:
+        _shared_manager = ContextCacheManager()
+    return _shared_manager
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Gemini图片上传（Files API）
+
+Phase 1请求内联的图片数据会使请求体达到数MB，并在每次重试时重复发送。
+这里把每张Gemini衍生图经Files API上传一次，按内容哈希缓存返回的文件
+引用直至过期（Files API保留48小时），请求中只发送
+{"file_data": {"mime_type", "file_uri"}}，请求体缩小到KB级。
+
+- 同一内容并发请求时只上传一次；上传失败时退回内联数据
+- Batch API任务可能排队24小时才执行，只复用剩余时间超过任务最长等待时间的文件，否则重新上传
+- MIME类型按图片字节的文件头判断，不再假设为JPEG
+- 可选持久化到JSON文件（CLI工具跨次运行复用）
+
+只使用标准库（经GeminiBatchClient调用REST接口），后端与CLI工具共用。
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from app.services.gemini_batch import BATCH_TIMEOUT, GeminiBatchClient, GeminiBatchError
+
+logger = logging.getLogger(__name__)
+
+# 批次图片总字节数不超过该值时仍内联发送（上传往返不划算）
+GEMINI_INLINE_MAX_BYTES = int(os.getenv("GEMINI_INLINE_MAX_BYTES", str(1024 * 1024)))
+# 同时进行的上传数
+GEMINI_UPLOAD_CONCURRENCY = max(1, int(os.getenv("GEMINI_UPLOAD_CONCURRENCY", "8")))
+# 文件过期前预留的时间（秒），避免引用在请求排队或重试期间过期
+EXPIRY_MARGIN = 3600
+# Batch API任务最长排队BATCH_TIMEOUT后才执行，其引用的文件须至少保留这么久
+BATCH_MIN_TTL = BATCH_TIMEOUT + EXPIRY_MARGIN
+# 服务端未返回过期时间时按48小时计
+DEFAULT_FILE_TTL = 48 * 3600
+# 等待文件处理完成（PROCESSING -> ACTIVE）的最长时间（秒）
+PROCESSING_TIMEOUT = 30
+
+
+def detect_mime(data: Union[bytes, bytearray, memoryview]) -> str:
+    """按文件头判断图片MIME类型，无法识别时返回image/jpeg"""
+    head = bytes(data[:16])
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"heic", b"heix", b"heim", b"heis"):
+            return "image/heic"
+        if brand in (b"mif1", b"msf1", b"heif"):
+            return "image/heif"
+        if brand in (b"avif", b"avis"):
+            return "image/avif"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "image/jpeg"
+
+
+def _expires_at(resource: Dict[str, Any]) -> float:
+    expiration = resource.get("expirationTime")
+    if expiration:
+        try:
+            return datetime.fromisoformat(expiration.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    return time.time() + DEFAULT_FILE_TTL
+
+
+class GeminiFileStore:
+    """按内容哈希复用已上传的Gemini文件"""
+
+    def __init__(
+        self,
+        client: GeminiBatchClient = None,
+        path: Union[str, Path] = None,
+        inline_max_bytes: int = None,
+        concurrency: int = None,
+    ):
+        """
+        初始化文件缓存
+
+        Args:
+            client: Files API客户端，默认GeminiBatchClient()
+            path: 持久化文件路径，默认只保存在内存中
+            inline_max_bytes: 图片总字节数不超过该值时内联发送，默认GEMINI_INLINE_MAX_BYTES
+            concurrency: 同时进行的上传数，默认GEMINI_UPLOAD_CONCURRENCY
+        """
+        self.client = client or GeminiBatchClient()
+        self.path = Path(path) if path else None
+        self.inline_max_bytes = GEMINI_INLINE_MAX_BYTES if inline_max_bytes is None else inline_max_bytes
+        self.concurrency = concurrency or GEMINI_UPLOAD_CONCURRENCY
+        # 在事件循环中首次上传时创建（CLI在asyncio.run之前构建本对象）
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        # 内容哈希 -> {"name", "uri", "mime_type", "expires_at"}
+        self.entries: Dict[str, Dict[str, Any]] = self._load()
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self.stats = {"uploaded": 0, "reused": 0, "inline": 0, "failed": 0, "uploaded_bytes": 0}
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not self.path or not self.path.exists():
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取Gemini文件缓存失败: {e}")
+            return {}
+        now = time.time()
+        return {key: entry for key, entry in entries.items() if entry.get("expires_at", 0) - EXPIRY_MARGIN > now}
+
+    def save(self) -> None:
+        """写入持久化文件（未设置路径时忽略）"""
+        if not self.path:
+            return
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    async def get_part(self, data: bytes, mime_type: str = None, min_ttl: float = None) -> Dict[str, Any]:
+        """
+        获取图片的文件引用（首次使用或已有文件剩余时间不足min_ttl时上传）
+
+        Args:
+            data: 图片数据
+            mime_type: MIME类型，默认按文件头判断
+            min_ttl: 文件至少还需保留的秒数，默认EXPIRY_MARGIN；Batch API任务使用BATCH_MIN_TTL
+
+        Returns:
+            {"file_data": {"mime_type", "file_uri"}}；上传失败时返回内联数据 {"mime_type", "data"}
+        """
+        data = bytes(data)
+        mime_type = mime_type or detect_mime(data)
+        min_ttl = EXPIRY_MARGIN if min_ttl is None else min_ttl
+        key = hashlib.sha256(data).hexdigest()
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry["expires_at"] - min_ttl > time.time():
+                self.stats["reused"] += 1
+                return {"file_data": {"mime_type": entry["mime_type"], "file_uri": entry["uri"]}}
+
+            if self.semaphore is None:
+                self.semaphore = asyncio.Semaphore(self.concurrency)
+            try:
+                async with self.semaphore:
+                    resource = await asyncio.to_thread(self.client.upload_file, data, mime_type, key[:40])
+                    resource = await self._wait_active(resource)
+            except (GeminiBatchError, KeyError, ValueError) as e:
+                logger.warning(f"上传图片失败，改为内联发送: {e}")
+                self.stats["failed"] += 1
+                return {"mime_type": mime_type, "data": data}
+
+            entry = {
+                "name": resource["name"],
+                "uri": resource["uri"],
+                "mime_type": resource.get("mimeType") or mime_type,
+                "expires_at": _expires_at(resource),
+            }
+            self.entries[key] = entry
+            self.stats["uploaded"] += 1
+            self.stats["uploaded_bytes"] += len(data)
+            return {"file_data": {"mime_type": entry["mime_type"], "file_uri": entry["uri"]}}
+
+    def forget(self, parts: List[Any]) -> None:
+        """
+        丢弃请求内容中引用的文件（请求失败时调用，文件可能已被删除或过期，下次重新上传）
+        """
+        uris = {
+            part["file_data"]["file_uri"] for part in parts
+            if isinstance(part, dict) and "file_data" in part
+        }
+        if uris:
+            self.entries = {key: entry for key, entry in self.entries.items() if entry["uri"] not in uris}
+
+    async def _wait_active(self, resource: Dict[str, Any]) -> Dict[str, Any]:
+        """等待文件处理完成（图片通常上传后即为ACTIVE）"""
+        deadline = time.monotonic() + PROCESSING_TIMEOUT
+        while resource.get("state") == "PROCESSING":
+            if time.monotonic() > deadline:
+                raise GeminiBatchError(f"文件 {resource['name']} 处理超时")
+            await asyncio.sleep(1)
+            resource = await asyncio.to_thread(self.client.get_file, resource["name"])
+        if resource.get("state") == "FAILED":
+            raise GeminiBatchError(f"文件 {resource['name']} 处理失败")
+        return resource
+
+    async def image_parts(self, images: List[bytes], min_ttl: float = None) -> List[Dict[str, Any]]:
+        """
+        批次内图片的请求内容
+
+        总字节数不超过inline_max_bytes时内联发送（MIME类型按文件头判断），
+        否则上传并引用文件。
+
+        Args:
+            images: 图片数据列表
+            min_ttl: 引用的文件至少还需保留的秒数，见get_part
+
+        Returns:
+            与images顺序一致的内容部分
+        """
+        if sum(len(data) for data in images) <= self.inline_max_bytes:
+            self.stats["inline"] += len(images)
+            return [{"mime_type": detect_mime(data), "data": bytes(data)} for data in images]
+        return list(await asyncio.gather(*[self.get_part(data, min_ttl=min_ttl) for data in images]))
+
+
+_shared_store: Optional[GeminiFileStore] = None
+
+
+def get_gemini_file_store() -> GeminiFileStore:
+    """获取进程内共享的Gemini文件缓存"""
+    global _shared_store
+    if _shared_store is None:
+        _shared_store = GeminiFileStore()
+    return _shared_store
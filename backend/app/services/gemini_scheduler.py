@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Gemini调用调度器
+
+所有Gemini调用经同一个按模型区分的调度器发出：
+- 令牌桶限制每分钟请求数（RPM）和每分钟token数（TPM），调用前按估算token
+  预扣，返回后按usage_metadata中的实际值多退少补
+- AIMD并发控制：成功时并发上限缓慢增加，遇到429/503时减半
+- 429/500/503/504带抖动指数退避重试，重试次数受重试预算约束
+  （每次成功积累一部分预算），避免服务过载时重试放大流量
+- 记录排队耗时与调用耗时
+
+限额通过环境变量GEMINI_RATE_LIMITS（JSON，{模型: {"rpm": ..., "tpm": ...}}）
+覆盖默认值。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from google.api_core import exceptions as api_exceptions
+
+logger = logging.getLogger(__name__)
+
+# 各模型默认限额（按付费层级估计，实际以API控制台为准）
+DEFAULT_RATE_LIMITS = {
+    "models/gemini-2.5-flash": {"rpm": 1000, "tpm": 1000000},
+    "models/gemini-2.5-pro": {"rpm": 150, "tpm": 2000000},
+}
+FALLBACK_RATE_LIMIT = {"rpm": 60, "tpm": 1000000}
+
+# 每张图片的估算token数（实际值在调用后校正）
+IMAGE_TOKENS = 1290
+# 未指定时预留的输出token数
+DEFAULT_OUTPUT_TOKENS = 2000
+
+# 可重试的HTTP状态码，其中THROTTLE_CODES表示服务端过载，需要降低并发
+RETRYABLE_CODES = {429, 500, 503, 504}
+THROTTLE_CODES = {429, 503}
+# SDK异常类型对应的状态码（gRPC传输的异常code不是HTTP状态码）
+_STATUS_BY_TYPE = (
+    (api_exceptions.ResourceExhausted, 429),
+    (api_exceptions.TooManyRequests, 429),
+    (api_exceptions.InternalServerError, 500),
+    (api_exceptions.ServiceUnavailable, 503),
+    (api_exceptions.DeadlineExceeded, 504),
+    (api_exceptions.GatewayTimeout, 504),
+)
+
+
+def _load_rate_limits() -> Dict[str, Dict[str, int]]:
+    limits = {name: dict(value) for name, value in DEFAULT_RATE_LIMITS.items()}
+    raw = os.getenv("GEMINI_RATE_LIMITS")
+    if raw:
+        try:
+            for name, value in json.loads(raw).items():
+                limits.setdefault(name, dict(FALLBACK_RATE_LIMIT)).update(value)
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"GEMINI_RATE_LIMITS格式错误，使用默认限额: {e}")
+    return limits
+
+
+RATE_LIMITS = _load_rate_limits()
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """
+    识别异常对应的HTTP状态码，无法识别时返回None（按不可重试处理）
+
+    只按异常类型和状态码属性识别：SDK异常按类型，REST调用的异常（GeminiBatchError、
+    urllib的HTTPError）按code，httpx/requests的异常按response.status_code；
+    不解析异常消息，避免消息中的数字（如图片尺寸、token数）被误判为状态码
+    """
+    for cls, status in _STATUS_BY_TYPE:
+        if isinstance(error, cls):
+            return status
+    response = getattr(error, "response", None)
+    for value in (getattr(error, "code", None), getattr(error, "status_code", None),
+                  getattr(response, "status_code", None)):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+    return None
+
+
+def estimate_tokens(content: Any, output_tokens: int = DEFAULT_OUTPUT_TOKENS) -> int:
+    """
+    估算请求消耗的token数（输入 + 预留输出）
+
+    文本按字符数估算（中文约1字符1token，偏保守），图片按固定值估算
+    """
+    parts = content if isinstance(content, (list, tuple)) else [content]
+    tokens = output_tokens
+    for part in parts:
+        if isinstance(part, str):
+            tokens += len(part)
+        else:
+            tokens += IMAGE_TOKENS
+    return tokens
+
+
+class TokenBucket:
+    """
+    令牌桶，限额按每分钟计
+
+    桶容量为限额的burst_fraction，补充速率为剩余部分均摊到一分钟，
+    任意60秒窗口内取出的总量不超过per_minute（与服务端滑动窗口配额一致）
+    """
+
+    def __init__(self, per_minute: float, burst_fraction: float = 0.1):
+        self.capacity = max(1.0, per_minute * burst_fraction)
+        self.rate = max(per_minute - self.capacity, 1.0) / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1) -> float:
+        """
+        取出令牌，不足时等待
+
+        超过桶容量的请求在桶满时放行并记为欠额，避免永远等待
+
+        Returns:
+            等待秒数
+        """
+        waited = 0.0
+        while True:
+            self._refill()
+            needed = min(amount, self.capacity)
+            if self.tokens >= needed:
+                self.tokens -= amount
+                return waited
+            delay = (needed - self.tokens) / self.rate
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def adjust(self, amount: float) -> None:
+        """按实际消耗校正（正数为补扣，负数为退还）"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class AIMDLimiter:
+    """
+    加性增、乘性减的并发上限
+
+    acquire()返回请求序号。过载时只有在上次减半之后发出的请求失败才会再次减半，
+    同一波在途请求集中失败只算一次（类似TCP每个窗口只减一次）
+    """
+
+    def __init__(self, max_limit: int, initial: int = None, min_limit: int = 1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(initial or max_limit)
+        self.inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._sequence = 0
+        self._decreased_at = 0
+
+    async def acquire(self) -> int:
+        while self.inflight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # 已被唤醒却取消时，把空出的名额让给下一个等待者
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                self._wake()
+                raise
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.inflight += 1
+        self._sequence += 1
+        return self._sequence
+
+    def release(self, sequence: int = 0, throttled: bool = False) -> None:
+        self.inflight -= 1
+        if throttled:
+            if sequence > self._decreased_at:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self._decreased_at = self._sequence
+                logger.info(f"Gemini并发上限降至 {int(self.limit)}")
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        self._wake()
+
+    def _wake(self) -> None:
+        slots = int(self.limit) - self.inflight
+        for waiter in list(self._waiters):
+            if slots <= 0:
+                break
+            if not waiter.done():
+                waiter.set_result(None)
+                slots -= 1
+
+
+class RetryBudget:
+    """
+    重试预算：每次成功积累ratio次重试额度，另外每秒补充min_per_second次
+    （保证低流量时也能重试），余额上限为burst
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, burst: float = 20):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.burst = burst
+        self.balance = burst
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.balance = min(self.burst, self.balance + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self) -> None:
+        self._refill()
+        self.balance = min(self.burst, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self.balance >= 1:
+            self.balance -= 1
+            return True
+        return False
+
+
+class GeminiScheduler:
+    """单个模型的调用调度器"""
+
+    def __init__(
+        self,
+        model_name: str,
+        rpm: int = None,
+        tpm: int = None,
+        max_concurrency: int = None,
+        max_retries: int = None,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        """
+        初始化调度器
+
+        Args:
+            model_name: 模型名称
+            rpm: 每分钟请求数，默认取RATE_LIMITS
+            tpm: 每分钟token数，默认取RATE_LIMITS
+            max_concurrency: 并发上限，默认环境变量GEMINI_MAX_CONCURRENCY（8）
+            max_retries: 单次调用最大重试次数，默认环境变量GEMINI_MAX_RETRIES（5）
+            base_delay: 退避基础秒数
+            max_delay: 退避上限秒数
+        """
+        limits = RATE_LIMITS.get(model_name, FALLBACK_RATE_LIMIT)
+        self.model_name = model_name
+        self.requests = TokenBucket(rpm or limits["rpm"])
+        self.tokens = TokenBucket(tpm or limits["tpm"])
+        self.limiter = AIMDLimiter(max_concurrency or int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")))
+        self.retry_budget = RetryBudget()
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("GEMINI_MAX_RETRIES", "5"))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = {
+            "requests": 0,
+            "calls": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "retries": 0,
+            "throttled": 0,
+            "queued_time": 0.0,
+            "call_time": 0.0,
+            "max_queued_time": 0.0,
+        }
+
+    def _backoff(self, attempt: int) -> float:
+        """全抖动指数退避"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def call(self, func: Callable, *args, estimated_tokens: int = None, **kwargs) -> Any:
+        """
+        经调度执行一次同步SDK调用（在线程中运行，不阻塞事件循环）
+
+        Args:
+            func: 同步调用，如model.generate_content
+            estimated_tokens: 预扣token数，默认按第一个参数估算
+            *args, **kwargs: 传给func的参数
+
+        Returns:
+            func的返回值；重试耗尽或不可重试时抛出最后一次异常
+        """
+        if estimated_tokens is None:
+            estimated_tokens = estimate_tokens(args[0]) if args else DEFAULT_OUTPUT_TOKENS
+        self.stats["requests"] += 1
+        attempt = 0
+
+        while True:
+            queued_start = time.monotonic()
+            sequence = await self.limiter.acquire()
+            try:
+                await self.requests.acquire(1)
+                await self.tokens.acquire(estimated_tokens)
+            except BaseException:
+                self.limiter.release(sequence)
+                raise
+            queued = time.monotonic() - queued_start
+            self.stats["queued_time"] += queued
+            self.stats["max_queued_time"] = max(self.stats["max_queued_time"], queued)
+
+            call_start = time.monotonic()
+            self.stats["calls"] += 1
+            try:
+                response = await asyncio.to_thread(func, *args, **kwargs)
+            except Exception as e:
+                self.stats["call_time"] += time.monotonic() - call_start
+                status = error_status(e)
+                throttled = status in THROTTLE_CODES
+                self.limiter.release(sequence, throttled=throttled)
+                if throttled:
+                    self.stats["throttled"] += 1
+
+                if status not in RETRYABLE_CODES or attempt >= self.max_retries or not self.retry_budget.withdraw():
+                    self.stats["failed"] += 1
+                    raise
+
+                delay = self._backoff(attempt)
+                attempt += 1
+                self.stats["retries"] += 1
+                logger.warning(
+                    f"{self.model_name} 调用失败（{status}），{delay:.1f} 秒后第 {attempt} 次重试: {e}"
+                )
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # 取消（客户端断开、gather撤销、超时）时同样归还并发名额
+                self.stats["call_time"] += time.monotonic() - call_start
+                self.limiter.release(sequence)
+                raise
+
+            self.stats["call_time"] += time.monotonic() - call_start
+            self.limiter.release(sequence)
+            self.retry_budget.deposit()
+            self.stats["succeeded"] += 1
+
+            usage = getattr(response, "usage_metadata", None)
+            actual = getattr(usage, "total_token_count", None) if usage is not None else None
+            if actual:
+                self.tokens.adjust(actual - estimated_tokens)
+            return response
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前指标（平均排队/调用耗时、并发上限等）"""
+        stats = dict(self.stats)
+        calls = max(1, stats["calls"])
+        stats["avg_queued_time"] = stats["queued_time"] / calls
+        stats["avg_call_time"] = stats["call_time"] / calls
+        stats["concurrency_limit"] = int(self.limiter.limit)
+        return stats
+
+
+_schedulers: Dict[str, GeminiScheduler] = {}
+
+
+def get_gemini_scheduler(model_name: str) -> GeminiScheduler:
+    """获取模型对应的共享调度器"""
+    if model_name not in _schedulers:
+        _schedulers[model_name] = GeminiScheduler(model_name)
+    return _schedulers[model_name]
@@ -6,12 +6,19 @@
 """
 
 import io
+import json
 import logging
-from typing import Dict, Any, List
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
 import numpy as np
 from PIL import Image
 import PIL.ImageOps
 
+from app.services.batch_compressor import BatchCompressionEngine
+from app.services.decoded_image import DecodedImage
+from app.services.lru_cache import LRUCache
+
 # 尝试导入OpenCV，如果失败则使用后备方案
 try:
     import cv2
@@ -25,45 +32,151 @@ except Exception as e:
 
 logger = logging.getLogger(__name__)
 
+# 目标大小/质量模式下，按内容哈希缓存选定的编码质量
+_quality_cache = LRUCache(max_entries=8192)
+
+# 质量搜索使用的缩小探针最大边长
+PROBE_MAX_SIZE = 512
+
+LOSSY_FORMATS = ("webp", "jpg", "jpeg")
+
+# 自动裁剪：代理图最大边长、均匀行列的标准差阈值、与边框颜色的最大差值
+AUTO_CROP_PROXY_SIZE = 256
+AUTO_CROP_UNIFORM_STD = 4.0
+AUTO_CROP_COLOR_TOLERANCE = 12.0
+
+# 默认衍生尺寸：列表缩略图、Phase 1输入、详情页
+# 衍生图经/api/images/data对外提供并发送给Gemini，不写入EXIF（GPS坐标等已保存在文档字段中）
+DEFAULT_RENDITIONS = {
+    "thumb": {"max_width": 320, "max_height": 320, "quality": 75, "keep_exif": False},
+    "gemini": {"max_width": 1024, "max_height": 1024, "quality": 80, "keep_exif": False},
+    "1080p": {"max_width": 1920, "max_height": 1080, "quality": 85, "keep_exif": False},
+}
+
+# 未指定尺寸时返回的衍生图
+DEFAULT_RENDITION = "1080p"
+
+RENDITIONS = json.loads(os.getenv("IMAGE_RENDITIONS", "null")) or DEFAULT_RENDITIONS
+
+MEDIA_TYPES = {"webp": "image/webp", "jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png"}
+
+
+def rendition_summary(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    由compress_renditions的结果生成压缩信息（不含图片数据）
+
+    顶层字段对应默认衍生图，与单尺寸压缩的compressed_info格式一致。
+
+    Args:
+        result: compress_renditions的返回值
+
+    Returns:
+        压缩信息字典
+    """
+    renditions = result.get("renditions", {})
+    primary = renditions.get(DEFAULT_RENDITION) or next(iter(renditions.values()), {})
+    return {
+        "compressed_size": primary.get("size", 0),
+        "width": primary.get("width", 0),
+        "height": primary.get("height", 0),
+        "format": primary.get("format", "webp"),
+        "quality": primary.get("quality"),
+        "encode_time": result.get("encode_time", 0.0),
+        "error": result.get("error"),
+        "renditions": {
+            name: {key: value for key, value in rendition.items() if key != "data"}
+            for name, rendition in renditions.items()
+        },
+    }
+
+
+def _ssim(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """计算两幅灰度图的平均SSIM（11x11高斯窗口，sigma=1.5）"""
+    x = reference.astype(np.float64)
+    y = candidate.astype(np.float64)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+
+    if not opencv_available:
+        # 后备方案：全局统计量
+        mu_x, mu_y = x.mean(), y.mean()
+        cov = ((x - mu_x) * (y - mu_y)).mean()
+        return float(
+            ((2 * mu_x * mu_y + c1) * (2 * cov + c2))
+            / ((mu_x ** 2 + mu_y ** 2 + c1) * (x.var() + y.var() + c2))
+        )
+
+    def blur(a):
+        return cv2.GaussianBlur(a, (11, 11), 1.5)
+
+    mu_x, mu_y = blur(x), blur(y)
+    sigma_x = blur(x * x) - mu_x ** 2
+    sigma_y = blur(y * y) - mu_y ** 2
+    sigma_xy = blur(x * y) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * sigma_xy + c2)) / (
+        (mu_x ** 2 + mu_y ** 2 + c1) * (sigma_x + sigma_y + c2)
+    )
+    return float(ssim_map.mean())
+
 
 class ImageCompressor:
     """图片压缩器"""
 
     def __init__(self):
         """初始化压缩器"""
-        pass
+        self.stats = {"encodes": 0, "encode_time": 0.0, "compressed_bytes": 0, "quality_cache_hits": 0}
 
-    async def compress(self, image_data: bytes, options: Dict[str, Any] = None) -> Dict[str, Any]:
+    def _default_options(self) -> Dict[str, Any]:
+        """默认压缩选项"""
+        return {
+            "max_width": 1920,
+            "max_height": 1080,
+            "min_width": 320,
+            "min_height": 240,
+            "quality": 85,
+            "format": "webp",
+            "auto_crop": True,
+            "preserve_aspect_ratio": True,
+            # 目标字节数或目标SSIM，设置后在min_quality~quality之间搜索编码质量
+            "target_bytes": int(os.getenv("COMPRESS_TARGET_BYTES", "0")) or None,
+            "target_ssim": float(os.getenv("COMPRESS_TARGET_SSIM", "0")) or None,
+            "min_quality": 40,
+            # 是否将原图EXIF（去除MakerNote）写入输出
+            "keep_exif": True,
+        }
+
+    async def compress(self, image_data: Union[bytes, DecodedImage], options: Dict[str, Any] = None) -> Dict[str, Any]:
         """
         压缩图片
 
         Args:
-            image_data: 原始图片数据
+            image_data: 原始图片数据或共享解码句柄（复用已解码的像素）
             options: 压缩选项
 
         Returns:
             压缩结果
         """
-        # 默认选项
-        default_options = {
-            "max_width": 1920,
-            "max_height": 1080,
-            "min_width": 320,
-            "min_height": 240,
-            "quality": 85,
-            "format": "webp",
-            "auto_crop": True,
-            "preserve_aspect_ratio": True
-        }
+        return self.compress_sync(image_data, options)
 
+    def compress_sync(self, image_data: Union[bytes, DecodedImage], options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        压缩图片（同步，CPU密集，可直接提交到线程池或进程池执行）
+
+        Args:
+            image_data: 原始图片数据或共享解码句柄（复用已解码的像素）
+            options: 压缩选项
+
+        Returns:
+            压缩结果
+        """
         # 合并选项
         if options is None:
             options = {}
-        final_options = {**default_options, **options}
+        final_options = {**self._default_options(), **options}
 
+        handle = DecodedImage.ensure(image_data)
         result = {
             "compressed_data": None,
-            "original_size": len(image_data),
+            "original_size": len(handle.data),
             "compressed_size": 0,
             "width": 0,
             "height": 0,
@@ -72,10 +185,9 @@ class ImageCompressor:
         }
 
         try:
-            # 打开图片
-            image = Image.open(io.BytesIO(image_data))
-            result["width"] = image.width
-            result["height"] = image.height
+            # 获取解码图像（与特征提取共享同一次解码）
+            result["width"], result["height"] = handle.original_size
+            image = handle.base()
 
             # 转换为RGB模式（处理透明通道）
             if image.mode in ("RGBA", "P"):
@@ -83,10 +195,10 @@ class ImageCompressor:
 
             # 自动裁剪无意义的边框
             if final_options["auto_crop"]:
-                image = await self._auto_crop(image)
+                image = self._auto_crop(image)
 
             # 智能缩放
-            image = await self._intelligent_resize(
+            image = self._intelligent_resize(
                 image,
                 final_options["max_width"],
                 final_options["max_height"],
@@ -95,17 +207,33 @@ class ImageCompressor:
                 final_options["preserve_aspect_ratio"]
             )
 
+            # 选择编码质量（目标模式下在缩小探针上搜索），然后只完整编码一次
+            encode_start = time.perf_counter()
+            quality = final_options["quality"]
+            if final_options["format"].lower() in LOSSY_FORMATS and (
+                final_options["target_bytes"] or final_options["target_ssim"]
+            ):
+                quality = self._select_quality(image, handle.md5, final_options)
+
             # 转换格式并压缩
-            compressed_data = await self._convert_format(
+            compressed_data = self._convert_format(
                 image,
                 final_options["format"],
-                final_options["quality"]
+                quality,
+                exif=handle.exif if final_options["keep_exif"] else None
             )
+            encode_time = time.perf_counter() - encode_start
 
             result["compressed_data"] = compressed_data
             result["compressed_size"] = len(compressed_data)
             result["width"] = image.width
             result["height"] = image.height
+            result["quality"] = quality
+            result["encode_time"] = encode_time
+
+            self.stats["encodes"] += 1
+            self.stats["encode_time"] += encode_time
+            self.stats["compressed_bytes"] += len(compressed_data)
 
         except Exception as e:
             logger.error(f"压缩图片失败: {e}")
@@ -113,6 +241,170 @@ class ImageCompressor:
 
         return result
 
+    def _select_quality(self, image: Image.Image, image_hash: str, options: Dict[str, Any]) -> int:
+        """
+        在缩小探针上二分搜索编码质量
+
+        目标SSIM取达到目标的最低质量，在探针上直接比较；目标字节数按每像素比特数
+        换算到探针尺寸，取不超出预算的最高质量。两者冲突时以字节预算为准。
+        结果按内容哈希缓存。
+
+        Args:
+            image: 待编码的图片（已裁剪、缩放）
+            image_hash: 原图内容哈希
+            options: 压缩选项
+
+        Returns:
+            编码质量
+        """
+        fmt = options["format"].lower()
+        target_bytes = options["target_bytes"]
+        target_ssim = options["target_ssim"]
+        low, high = options["min_quality"], options["quality"]
+
+        cache_key = (image_hash, fmt, image.size, target_bytes, target_ssim, low, high)
+        cached = _quality_cache.get(cache_key)
+        if cached is not None:
+            self.stats["quality_cache_hits"] += 1
+            return cached
+
+        probe = image.convert("RGB") if image.mode != "RGB" else image.copy()
+        probe.thumbnail((PROBE_MAX_SIZE, PROBE_MAX_SIZE), Image.BILINEAR)
+        probe_gray = np.asarray(probe.convert("L"))
+        probe_budget = None
+        if target_bytes:
+            bits_per_pixel = target_bytes * 8 / (image.width * image.height)
+            probe_budget = bits_per_pixel * probe.width * probe.height / 8
+
+        # 编码大小与SSIM都随质量单调增加
+        if target_ssim:
+            best = high
+            while low <= high:
+                mid = (low + high) // 2
+                encoded = self._convert_format(probe, fmt, mid)
+                decoded = np.asarray(Image.open(io.BytesIO(encoded)).convert("L"))
+                if _ssim(probe_gray, decoded) >= target_ssim:
+                    best, high = mid, mid - 1
+                else:
+                    low = mid + 1
+            if probe_budget is not None:
+                # SSIM所需质量超出字节预算时，以字节预算为准
+                encoded = self._convert_format(probe, fmt, best)
+                if len(encoded) > probe_budget:
+                    best = self._search_bytes(probe, fmt, options["min_quality"], best, probe_budget)
+        else:
+            best = self._search_bytes(probe, fmt, low, high, probe_budget)
+
+        _quality_cache.set(cache_key, best)
+        return best
+
+    def _search_bytes(self, probe: Image.Image, fmt: str, low: int, high: int, budget: float) -> int:
+        """二分搜索探针编码大小不超过预算的最高质量，预算过小时返回low"""
+        best = low
+        while low <= high:
+            mid = (low + high) // 2
+            encoded = self._convert_format(probe, fmt, mid)
+            if len(encoded) <= budget:
+                best, low = mid, mid + 1
+            else:
+                high = mid - 1
+        return best
+
+    async def compress_renditions(
+        self,
+        image_data: Union[bytes, DecodedImage],
+        renditions: Dict[str, Dict[str, Any]] = None,
+        options: Dict[str, Any] = None,
+    ) -> Dict[str, Any]:
+        """一次解码生成多个衍生尺寸，参数与返回值见compress_renditions_sync"""
+        return self.compress_renditions_sync(image_data, renditions, options)
+
+    def compress_renditions_sync(
+        self,
+        image_data: Union[bytes, DecodedImage],
+        renditions: Dict[str, Dict[str, Any]] = None,
+        options: Dict[str, Any] = None,
+    ) -> Dict[str, Any]:
+        """
+        一次解码生成多个衍生尺寸（同步，CPU密集，可直接提交到线程池执行）
+
+        透明通道处理和自动裁剪只做一次，然后从大到小级联缩放，
+        每个尺寸按各自的质量参数单独编码。
+
+        Args:
+            image_data: 原始图片数据或共享解码句柄
+            renditions: 衍生尺寸配置 {名称: {max_width, max_height, quality, ...}}，默认RENDITIONS
+            options: 所有尺寸共用的压缩选项
+
+        Returns:
+            {"renditions": {名称: {data, size, width, height, format, quality}}, 原图尺寸, 编码耗时, 错误}
+        """
+        renditions = renditions or RENDITIONS
+        base_options = {**self._default_options(), **(options or {})}
+
+        handle = DecodedImage.ensure(image_data)
+        result = {
+            "renditions": {},
+            "original_size": len(handle.data),
+            "width": 0,
+            "height": 0,
+            "encode_time": 0.0,
+            "error": None,
+        }
+
+        try:
+            result["width"], result["height"] = handle.original_size
+            image = handle.base()
+
+            # 转换为RGB模式（处理透明通道）
+            if image.mode in ("RGBA", "P"):
+                image = self._handle_transparency(image)
+
+            # 自动裁剪无意义的边框
+            if base_options["auto_crop"]:
+                image = self._auto_crop(image)
+
+            names = list(renditions)
+            boxes = [
+                (renditions[name].get("max_width", base_options["max_width"]),
+                 renditions[name].get("max_height", base_options["max_height"]))
+                for name in names
+            ]
+            images = self.resize_to_boxes(image, boxes)
+
+            for name, rendition_image in zip(names, images):
+                rendition_options = {**base_options, **renditions[name]}
+                fmt = rendition_options["format"]
+
+                encode_start = time.perf_counter()
+                quality = rendition_options["quality"]
+                if fmt.lower() in LOSSY_FORMATS and (
+                    rendition_options["target_bytes"] or rendition_options["target_ssim"]
+                ):
+                    quality = self._select_quality(rendition_image, handle.md5, rendition_options)
+                exif = handle.exif if rendition_options["keep_exif"] else None
+                data = self._convert_format(rendition_image, fmt, quality, exif=exif)
+                encode_time = time.perf_counter() - encode_start
+
+                result["renditions"][name] = {
+                    "data": data,
+                    "size": len(data),
+                    "width": rendition_image.width,
+                    "height": rendition_image.height,
+                    "format": fmt,
+                    "quality": quality,
+                }
+                result["encode_time"] += encode_time
+                self.stats["encodes"] += 1
+                self.stats["encode_time"] += encode_time
+                self.stats["compressed_bytes"] += len(data)
+
+        except Exception as e:
+            logger.error(f"生成衍生图失败: {e}")
+            result["error"] = str(e)
+
+        return result
+
     def _handle_transparency(self, image: Image.Image) -> Image.Image:
         """
         处理透明通道
@@ -138,7 +430,7 @@ class ImageCompressor:
             logger.error(f"处理透明通道失败: {e}")
             return image
 
-    async def _auto_crop(self, image: Image.Image) -> Image.Image:
+    def _auto_crop(self, image: Image.Image) -> Image.Image:
         """
         自动裁剪无意义的边框
 
@@ -149,46 +441,100 @@ class ImageCompressor:
             裁剪后的图片
         """
         try:
-            if not opencv_available:
-                # OpenCV不可用，跳过自动裁剪
+            box = self._detect_borders(image)
+            if box is None:
                 return image
-                
-            # 转换为numpy数组
-            img_array = np.array(image)
-            
-            # 转换为灰度图
-            if len(img_array.shape) == 3:
-                gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-            else:
-                gray = img_array
-
-            # 阈值化，找到非边框区域
-            _, thresh = cv2.threshold(gray, 240, 255, cv2.THRESH_BINARY_INV)
-
-            # 找到轮廓
-            contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-            if contours:
-                # 找到最大的轮廓
-                largest_contour = max(contours, key=cv2.contourArea)
-                
-                # 计算边界框
-                x, y, w, h = cv2.boundingRect(largest_contour)
-                
-                # 确保裁剪区域合理
-                if w > image.width * 0.1 and h > image.height * 0.1:
-                    # 裁剪图片
-                    image = image.crop((x, y, x + w, y + h))
-
-            return image
+            return image.crop(box)
         except Exception as e:
             logger.error(f"自动裁剪失败: {e}")
             return image
 
-    async def _intelligent_resize(self, image: Image.Image, max_width: int, max_height: int, 
+    def _detect_borders(self, image: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+        """
+        基于行/列投影检测纯色边框
+
+        在缩小的灰度代理图上计算每行、每列的均值和标准差，从四边向内
+        跳过与边框颜色一致且近似均匀的行列，再将裁剪框映射回原图尺寸。
+        没有一对相对边缘呈现相同的均匀颜色时（绝大多数照片）只读取最外一圈像素即返回。
+
+        Args:
+            image: 原始图片
+
+        Returns:
+            裁剪框 (left, top, right, bottom)，无需裁剪时返回None
+        """
+        if image.width < 8 or image.height < 8:
+            return None
+
+        def strip(box: Tuple[int, int, int, int]) -> np.ndarray:
+            return np.asarray(image.crop(box).convert("L"), dtype=np.float32).reshape(-1)
+
+        # 边框可能性：只读取原图最外一圈像素判断。至少一对相对的边缘近似均匀且颜色一致
+        # （上下黑边、左右黑边或相框）才继续；单侧均匀（如天空、纯色背景）不视为边框
+        w, h = image.size
+        edges = {
+            "top": strip((0, 0, w, 1)),
+            "bottom": strip((0, h - 1, w, h)),
+            "left": strip((0, 0, 1, h)),
+            "right": strip((w - 1, 0, w, h)),
+        }
+        uniform = {name: edge for name, edge in edges.items() if edge.std() < AUTO_CROP_UNIFORM_STD}
+        pairs = [
+            (a, b) for a, b in (("top", "bottom"), ("left", "right"))
+            if a in uniform and b in uniform
+            and abs(float(uniform[a].mean()) - float(uniform[b].mean())) < AUTO_CROP_COLOR_TOLERANCE
+        ]
+        if not pairs:
+            return None
+        border_value = float(np.median(np.concatenate([uniform[name] for pair in pairs for name in pair])))
+
+        factor = max(1, max(image.size) // AUTO_CROP_PROXY_SIZE)
+        proxy = image.reduce(factor) if factor > 1 else image
+        gray = np.asarray(proxy.convert("L"), dtype=np.float32)
+        height, width = gray.shape
+
+        def is_border(values: np.ndarray) -> np.ndarray:
+            # values: (n, k)，按行判断
+            return (values.std(axis=1) < AUTO_CROP_UNIFORM_STD) & (
+                np.abs(values.mean(axis=1) - border_value) < AUTO_CROP_COLOR_TOLERANCE
+            )
+
+        row_border = is_border(gray)
+        col_border = is_border(gray.T)
+
+        def leading(flags: np.ndarray) -> int:
+            # 从起始端连续为边框的行列数
+            non_border = np.flatnonzero(~flags)
+            return int(non_border[0]) if non_border.size else flags.size
+
+        top = leading(row_border)
+        bottom = height - leading(row_border[::-1])
+        left = leading(col_border)
+        right = width - leading(col_border[::-1])
+
+        if top == 0 and left == 0 and bottom == height and right == width:
+            return None
+        # 确保裁剪区域合理
+        if right - left <= width * 0.1 or bottom - top <= height * 0.1:
+            return None
+
+        # 映射回原图尺寸；代理图中边框与内容交界的一行/列是混合像素，向内多收一格
+        scale_x = image.width / width
+        scale_y = image.height / height
+        return (
+            int(np.ceil((left + (left > 0)) * scale_x)),
+            int(np.ceil((top + (top > 0)) * scale_y)),
+            int(np.floor((right - (right < width)) * scale_x)),
+            int(np.floor((bottom - (bottom < height)) * scale_y)),
+        )
+
+    def _intelligent_resize(self, image: Image.Image, max_width: int, max_height: int, 
                                 min_width: int, min_height: int, preserve_aspect_ratio: bool) -> Image.Image:
         """
-        智能缩放图片
+        智能缩放图片（只缩小，不放大）
+
+        已在目标范围内的图片直接返回；最小尺寸只用于限制缩小程度，
+        保持宽高比时按同一比例缩放，不会拉伸。
 
         Args:
             image: 原始图片
@@ -204,30 +550,64 @@ class ImageCompressor:
         try:
             if preserve_aspect_ratio:
                 # 计算缩放比例
-                width_ratio = max_width / image.width
-                height_ratio = max_height / image.height
-                ratio = min(width_ratio, height_ratio)
-
-                # 计算新尺寸
-                new_width = int(image.width * ratio)
-                new_height = int(image.height * ratio)
-
-                # 确保不小于最小尺寸
-                new_width = max(new_width, min_width)
-                new_height = max(new_height, min_height)
+                ratio = min(max_width / image.width, max_height / image.height)
+                if ratio >= 1.0:
+                    return image
+
+                # 缩小后不低于最小尺寸（同一比例，不放大）
+                ratio = min(max(ratio, min(min_width / image.width, min_height / image.height)), 1.0)
+                new_width = max(1, round(image.width * ratio))
+                new_height = max(1, round(image.height * ratio))
             else:
-                # 直接缩放到最大尺寸
-                new_width = max_width
-                new_height = max_height
+                # 直接缩放到最大尺寸（不超过原图尺寸）
+                new_width = min(max_width, image.width)
+                new_height = min(max_height, image.height)
+
+            if (new_width, new_height) == image.size:
+                return image
 
             # 缩放图片
-            image = image.resize((new_width, new_height), Image.LANCZOS)
-            return image
+            return image.resize((new_width, new_height), Image.LANCZOS, reducing_gap=3.0)
         except Exception as e:
             logger.error(f"智能缩放失败: {e}")
             return image
 
-    async def _convert_format(self, image: Image.Image, format: str, quality: int) -> bytes:
+    def resize_to_boxes(self, image: Image.Image, boxes: List[Tuple[int, int]]) -> List[Image.Image]:
+        """
+        一次性生成多个尺寸（只缩小）
+
+        按从大到小的顺序生成，每个尺寸从已生成的、两个方向都不小于目标尺寸的
+        最小图片缩小得到，没有时从原图缩小。
+
+        Args:
+            image: 原始图片
+            boxes: 目标尺寸框列表 [(最大宽度, 最大高度), ...]
+
+        Returns:
+            与boxes顺序一致的图片列表（不需要缩小时为原图）
+        """
+        order = sorted(range(len(boxes)), key=lambda i: boxes[i][0] * boxes[i][1], reverse=True)
+        results: List[Optional[Image.Image]] = [None] * len(boxes)
+        generated: List[Image.Image] = []
+        for index in order:
+            max_width, max_height = boxes[index]
+            ratio = min(max_width / image.width, max_height / image.height)
+            if ratio >= 1.0:
+                results[index] = image
+                continue
+            size = (max(1, round(image.width * ratio)), max(1, round(image.height * ratio)))
+            covering = [
+                candidate for candidate in generated
+                if candidate.width >= size[0] and candidate.height >= size[1]
+            ]
+            source = min(covering, key=lambda c: c.width * c.height) if covering else image
+            if source.size != size:
+                source = source.resize(size, Image.LANCZOS, reducing_gap=3.0)
+                generated.append(source)
+            results[index] = source
+        return results
+
+    def _convert_format(self, image: Image.Image, format: str, quality: int, exif: bytes = None) -> bytes:
         """
         转换图片格式并压缩
 
@@ -235,6 +615,7 @@ class ImageCompressor:
             image: 原始图片
             format: 目标格式
             quality: 压缩质量
+            exif: 写入输出的EXIF数据
 
         Returns:
             压缩后的图片数据
@@ -247,14 +628,15 @@ class ImageCompressor:
 
             # 创建缓冲区
             buffer = io.BytesIO()
+            extra = {"exif": exif} if exif else {}
 
             # 保存图片
             if format == "jpg" or format == "jpeg":
-                image.save(buffer, format="JPEG", quality=quality, optimize=True)
+                image.save(buffer, format="JPEG", quality=quality, optimize=True, **extra)
             elif format == "png":
-                image.save(buffer, format="PNG", optimize=True, compress_level=6)
+                image.save(buffer, format="PNG", optimize=True, compress_level=6, **extra)
             else:  # webp
-                image.save(buffer, format="WEBP", quality=quality, lossless=False)
+                image.save(buffer, format="WEBP", quality=quality, lossless=False, **extra)
 
             buffer.seek(0)
             return buffer.read()
@@ -262,21 +644,55 @@ class ImageCompressor:
             logger.error(f"转换格式失败: {e}")
             raise
 
-    async def batch_compress(self, images_data: List[bytes], options: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    async def batch_compress(
+        self,
+        images_data: Iterable[Union[bytes, DecodedImage]],
+        options: Dict[str, Any] = None,
+        max_workers: int = None,
+    ) -> List[Dict[str, Any]]:
         """
-        批量压缩图片
+        批量压缩图片（进程池并行）
 
         Args:
             images_data: 图片数据列表
             options: 压缩选项
+            max_workers: 工作进程数，默认CPU核数
 
         Returns:
-            压缩结果列表
+            压缩结果列表（与输入顺序一致）
         """
-        import asyncio
-        tasks = [self.compress(image_data, options) for image_data in images_data]
-        results = await asyncio.gather(*tasks)
-        return results
+        results: Dict[int, Dict[str, Any]] = {}
+        async for index, result in self.iter_compress(images_data, options, max_workers):
+            results[index] = result
+        return [results[index] for index in sorted(results)]
+
+    async def iter_compress(
+        self,
+        images_data: Iterable[Union[bytes, DecodedImage]],
+        options: Dict[str, Any] = None,
+        max_workers: int = None,
+    ) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        批量压缩图片，按完成顺序流式返回
+
+        Args:
+            images_data: 图片数据迭代器
+            options: 压缩选项
+            max_workers: 工作进程数，默认CPU核数
+
+        Yields:
+            (输入序号, 压缩结果)
+        """
+        engine = BatchCompressionEngine(max_workers=max_workers)
+        images = (
+            item.data if isinstance(item, DecodedImage) else item
+            for item in images_data
+        )
+        try:
+            async for index, result in engine.stream(images, options):
+                yield index, result
+        finally:
+            engine.shutdown()
 
     def calculate_compression_ratio(self, original_size: int, compressed_size: int) -> float:
         """
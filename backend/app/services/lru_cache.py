@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+进程内LRU缓存
+
+供特征缓存等服务作为本地一级缓存使用，位于MongoDB之前
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """线程安全的最近最少使用缓存"""
+
+    def __init__(self, max_entries: int = 1024):
+        """
+        初始化缓存
+
+        Args:
+            max_entries: 最大缓存条目数
+        """
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        获取缓存值，命中时将其移动到最近使用位置
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存值，未命中时返回None
+        """
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        写入缓存，超出容量时淘汰最久未使用的条目
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+        """
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """移除并返回缓存值"""
+        with self._lock:
+            return self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        """返回命中统计"""
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses}
@@ -11,6 +11,7 @@ import os
 import base64
 import time
 import traceback
+import numpy as np
 from pathlib import Path
 from datetime import datetime
 from typing import List, Dict, Any, Tuple, Optional
@@ -19,6 +20,7 @@ from dotenv import load_dotenv
 from concurrent.futures import ThreadPoolExecutor
 from pyicloud import PyiCloudService
 import logging
+from bson import ObjectId
 
 # 可选依赖
 try:
@@ -26,12 +28,44 @@ try:
 except ImportError:
     psutil = None
 
-from app.config.database import prompts_collection, photos_collection
-from app.services.exif_extractor import EXIFExtractor
+from app.config.database import prompts_collection, photos_collection, memory_records_collection
 from app.services.icloud_client import iCloudClient
 from app.services.photo_filter import PhotoFilter
 from app.services.image_features import ImageFeaturesExtractor
-from app.services.image_compressor import ImageCompressor
+from app.services.image_compressor import ImageCompressor, rendition_summary
+from app.services.feature_cache import get_feature_cache
+from app.services.embedding_store import decode_features, encode_features
+from app.services.decoded_image import DecodedImage
+from app.services.scene_clustering import SceneClusteringService
+from app.services.gemini_client_pool import get_gemini_client_pool
+from app.services.analysis_progress import AnalysisProgress
+from app.services.gemini_context_cache import get_context_cache
+from app.services.batch_digest import phase1_digest
+from app.services.phase1_cache import get_phase1_cache
+from app.services.phase1_schema import (
+    PHASE1_GENERATION_CONFIG,
+    PHASE1_JSON_INSTRUCTION,
+    compact_phase1,
+    parse_phase1_output,
+    phase1_overview,
+)
+from app.services.gemini_batch import (
+    GeminiBatchClient,
+    GeminiBatchError,
+    GeminiBatchTimeout,
+    build_request,
+    can_resume,
+    run_batch_job,
+)
+from app.services.gemini_files import BATCH_MIN_TTL, get_gemini_file_store
+from app.services.batch_packer import PHASE1_TOKEN_BUDGET, image_tokens, pack_batches, text_tokens
+from app.services.blob_store import (
+    PHOTO_BLOB_EXCLUSION,
+    get_blob_store,
+    load_rendition,
+    restore_missing,
+    store_renditions,
+)
 
 load_dotenv()
 
@@ -46,18 +80,47 @@ logger = logging.getLogger(__name__)
 # 配置Gemini API
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
+PHASE1_MODEL = "models/gemini-2.5-flash"
+PHASE2_MODEL = "models/gemini-2.5-flash"
+
+# Phase 1 默认执行方式：realtime（实时并发调用）或 batch（Batch API，半价、非实时）
+PHASE1_MODE = os.getenv("PHASE1_MODE", "realtime")
+
 
 class MemoryAnalyzer:
     """记忆分析器"""
 
+    # Phase 1 并发调用Gemini的批次数
+    PHASE1_CONCURRENCY = max(1, int(os.getenv("PHASE1_CONCURRENCY", "3")))
+    # 并行处理（特征提取、压缩）的照片数，同时也是线程池大小
+    IMAGE_PROCESS_CONCURRENCY = max(1, int(os.getenv("IMAGE_PROCESS_CONCURRENCY", "4")))
+
     def __init__(self):
         """初始化分析器"""
-        self.executor = ThreadPoolExecutor(max_workers=4)
-        self.exif_extractor = EXIFExtractor()
+        self.executor = ThreadPoolExecutor(max_workers=self.IMAGE_PROCESS_CONCURRENCY)
         self.icloud_client = iCloudClient()
         self.photo_filter = PhotoFilter()
         self.features_extractor = ImageFeaturesExtractor()
         self.image_compressor = ImageCompressor()
+        self.feature_cache = get_feature_cache()
+        self.blob_store = get_blob_store()
+        self.scene_clustering = SceneClusteringService(
+            features_version=ImageFeaturesExtractor.MODEL_VERSION
+        )
+        self.process_stats = {}
+        self.phase1_cache = get_phase1_cache()
+        self.context_cache = get_context_cache()
+        self.gemini_pool = get_gemini_client_pool()
+        # 分析进度（由调用方设置，流式文本推送并定期写入记录）
+        self.progress: Optional[AnalysisProgress] = None
+        # 记忆记录ID（由调用方设置，批处理任务状态保存在记录中以便重启后继续）
+        self.record_id: Optional[str] = None
+        self.phase1_mode = PHASE1_MODE
+        self.batch_client = GeminiBatchClient()
+        self.batch_job_state: Optional[Dict[str, Any]] = None
+        # 图片经Files API上传一次，请求中引用文件
+        self.file_store = get_gemini_file_store()
+        self.phase1_stats = {}
 
     async def analyze(
         self,
@@ -342,9 +405,10 @@ class MemoryAnalyzer:
                 photo_data = {
                     "id": photo_id,
                     "filename": photo_filename,
-                    "datetime": getattr(photo, "created", datetime.now()),
-                    "gps_lat": None,  # 需要从照片元数据中提取
-                    "gps_lon": None,  # 需要从照片元数据中提取
+                    # 拍摄时间和GPS在下载后从EXIF中提取（见_apply_exif）
+                    "datetime": self._naive_datetime(getattr(photo, "created", None)),
+                    "gps_lat": None,
+                    "gps_lon": None,
                     "has_gps": False,
                 }
                 photos.append(photo_data)
@@ -374,6 +438,7 @@ class MemoryAnalyzer:
 
             # 4. 提取EXIF信息
             local_logger.info("提取照片EXIF信息")
+            self._report_stage("download", photos=len(filtered_photos))
             photo_metadata, download_time = await self._extract_metadata(
                 filtered_photos,
                 icloud_email=icloud_email,
@@ -386,21 +451,32 @@ class MemoryAnalyzer:
 
             # 5. 处理图片（特征提取、压缩、存储）
             local_logger.info("处理图片")
+            self._report_stage("process", photos=len(photo_metadata))
             processed_photos, process_time = await self._process_images(
                 photo_metadata, user_id
             )
             stats["process_time"] = process_time
+            stats.update(self.process_stats)
 
-            # 6. 按时间分组
-            local_logger.info("按时间分组")
-            batches = self._group_by_time(processed_photos)
+            # 场景聚类（增量更新），为照片标注场景
+            local_logger.info("更新场景聚类")
+            stats.update(await self._assign_scene_clusters(processed_photos, user_id))
 
-            # 6. 获取提示词
+            # 6. 获取提示词（批次打包需要提示词长度）
             local_logger.info("获取分析提示词")
             prompts = await self._get_prompts(prompt_group_id)
 
+            # 7. 按时间顺序、token预算打包批次
+            local_logger.info("按token预算打包批次")
+            batches = self._group_by_time(
+                processed_photos,
+                self._build_phase1_prompt(prompts, protagonist_features),
+            )
+            stats["phase1_batches"] = len(batches)
+
             # 7. 执行Phase 1分析
             local_logger.info("执行Phase 1分析")
+            self._report_stage("phase1", batches=len(batches))
             (
                 phase1_results,
                 phase1_time,
@@ -417,9 +493,11 @@ class MemoryAnalyzer:
             stats["phase1_tokens"] = phase1_tokens
             stats["phase1_prompt_tokens"] = phase1_prompt_tokens
             stats["phase1_candidates_tokens"] = phase1_candidates_tokens
+            stats.update(self.phase1_stats)
 
             # 8. 执行Phase 2分析
             local_logger.info("执行Phase 2分析")
+            self._report_stage("phase2")
             (
                 phase2_result,
                 phase2_time,
@@ -464,6 +542,50 @@ class MemoryAnalyzer:
             local_logger.error(f"分析失败: {e}")
             raise
 
+    def _report_stage(self, stage: str, **info) -> None:
+        """推送当前阶段（未设置进度时忽略）"""
+        if self.progress is not None:
+            self.progress.set_stage(stage, **info)
+
+    def _stream_callback(self, key: str):
+        """流式文本回调（未设置进度时不推送）"""
+        if self.progress is None:
+            return lambda text: None
+        return lambda text: self.progress.update(key, text)
+
+    @staticmethod
+    def _naive_datetime(value: Optional[datetime]) -> datetime:
+        """
+        统一为不带时区的时间，避免与EXIF时间混合排序时报错
+
+        iCloud返回的created带UTC时区，EXIF拍摄时间为不带时区的本地时间
+        """
+        if value is None:
+            return datetime.now()
+        if value.tzinfo is not None:
+            return value.astimezone().replace(tzinfo=None)
+        return value
+
+    @staticmethod
+    def _apply_exif(metadata: Dict[str, Any], handle: DecodedImage) -> None:
+        """
+        用原图EXIF中的拍摄时间和GPS覆盖iCloud资产信息
+
+        EXIF在压缩读取文件头时一并解析（DecodedImage.metadata），不额外打开文件
+        """
+        try:
+            exif = handle.metadata
+        except Exception as e:
+            logger.warning(f"读取EXIF失败 {metadata.get('filename')}: {e}")
+            return
+        if exif.get("datetime"):
+            metadata["datetime"] = exif["datetime"]
+        lat, lon = exif.get("gps_lat"), exif.get("gps_lon")
+        if lat is not None and lon is not None:
+            metadata["gps_lat"] = lat
+            metadata["gps_lon"] = lon
+            metadata["has_gps"] = True
+
     async def _extract_metadata(
         self,
         photos: List[Dict[str, Any]],
@@ -552,6 +674,14 @@ class MemoryAnalyzer:
                     "base64_image": None,
                 }
 
+                # 过滤阶段已下载的照片直接复用解码句柄，避免重复下载
+                handle = photo.get("decoded_image")
+                if handle is not None:
+                    metadata["decoded_image"] = handle
+                    metadata["base64_image"] = base64.b64encode(handle.data).decode("utf-8")
+                    self._apply_exif(metadata, handle)
+                    return metadata
+
                 # 下载 iCloud 照片并转换为 Base64
                 icloud_photo_id = photo.get("id") or photo.get("filename")
                 if icloud_photo_id:
@@ -570,6 +700,10 @@ class MemoryAnalyzer:
                         )
 
                         if photo_bytes:
+                            metadata["decoded_image"] = DecodedImage(
+                                photo_bytes, filename=metadata["filename"]
+                            )
+                            self._apply_exif(metadata, metadata["decoded_image"])
                             # 转换为 Base64
                             base64_image = base64.b64encode(photo_bytes).decode("utf-8")
                             metadata["base64_image"] = base64_image
@@ -597,37 +731,96 @@ class MemoryAnalyzer:
         )
         return metadata_list, download_time
 
-    def _group_by_time(self, photos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """按时间分组"""
-        # 按月份分组
-        batches = []
-        photo_dict = {}
+    async def _assign_scene_clusters(
+        self, photos: List[Dict[str, Any]], user_id: str
+    ) -> Dict[str, Any]:
+        """
+        增量更新用户场景聚类，并为本次处理的照片标注场景
 
+        Args:
+            photos: 处理后的照片列表
+            user_id: 用户ID
+
+        Returns:
+            聚类统计信息
+        """
+        try:
+            cluster_stats = await self.scene_clustering.update_user_clusters(user_id)
+        except Exception as e:
+            logger.warning(f"场景聚类失败: {e}")
+            return {}
+
+        vectors, indexed = [], []
         for photo in photos:
-            month_key = photo["datetime"].strftime("%Y-%m")
-            if month_key not in photo_dict:
-                photo_dict[month_key] = []
-            photo_dict[month_key].append(photo)
+            visual = (photo.get("features") or {}).get("visual_features")
+            if visual is not None:
+                vectors.append(visual)
+                indexed.append(photo)
+        if vectors:
+            labels = await asyncio.to_thread(
+                self.scene_clustering.predict, np.asarray(vectors, dtype=np.float32)
+            )
+            for photo, label in zip(indexed, labels):
+                if label >= 0:
+                    photo["scene_cluster"] = int(label)
+        return cluster_stats
+
+    def _group_by_time(
+        self, photos: List[Dict[str, Any]], phase1_prompt: str = ""
+    ) -> List[Dict[str, Any]]:
+        """
+        按时间顺序将照片打包为批次
 
-        # 转换为批次
-        for month_key, month_photos in photo_dict.items():
+        每批次的估算token（提示词 + 每张照片的Phase 1衍生图与说明文字）
+        不超过PHASE1_TOKEN_BUDGET，批次内照片时间连续，批次数最少；
+        切分点优先落在时间间隔大、场景聚类（scene_cluster）变化的位置。
+        """
+        batches = []
+        packed = pack_batches(
+            photos,
+            cost=self._photo_tokens,
+            timestamp=lambda photo: photo["datetime"],
+            overhead=text_tokens(phase1_prompt),
+            scene=lambda photo: photo.get("scene_cluster"),
+        )
+        for index, group_photos in enumerate(packed, 1):
             # 计算时间范围
-            min_time = min(photo["datetime"] for photo in month_photos)
-            max_time = max(photo["datetime"] for photo in month_photos)
-
-            batch = {
-                "batch_id": month_key,
-                "photos": month_photos,
+            min_time = group_photos[0]["datetime"]
+            max_time = group_photos[-1]["datetime"]
+            batches.append({
+                "batch_id": f"{min_time.strftime('%Y-%m-%d')}_B{index:03d}",
+                "photos": group_photos,
                 "time_range": (min_time, max_time),
-                "image_count": len(month_photos),
-            }
-            batches.append(batch)
-
-        # 按时间排序
-        batches.sort(key=lambda x: x["time_range"][0])
+                "image_count": len(group_photos),
+            })
 
+        logger.info(
+            f"{len(photos)} 张照片打包为 {len(batches)} 个批次（token预算 {PHASE1_TOKEN_BUDGET}）"
+        )
         return batches
 
+    @staticmethod
+    def _photo_info_line(photo: Dict[str, Any]) -> str:
+        """批次照片信息中的一行"""
+        location = (
+            f", GPS: {photo['gps_lat']:.5f}, {photo['gps_lon']:.5f}"
+            if photo.get("has_gps") else ""
+        )
+        return f"- {photo['filename']} (拍摄时间: {photo['datetime'].isoformat()}{location})"
+
+    def _photo_tokens(self, photo: Dict[str, Any]) -> int:
+        """估算单张照片在Phase 1请求中的token数（图片按实际发送的衍生图尺寸）"""
+        tokens = text_tokens(self._photo_info_line(photo))
+        gemini_image = photo.get("gemini_image")
+        if gemini_image and gemini_image.get("data"):
+            tokens += image_tokens(gemini_image.get("width"), gemini_image.get("height"))
+        elif photo.get("base64_image"):
+            # 未生成衍生图时发送原图，服务端会缩放，按原图尺寸估算
+            handle = photo.get("decoded_image")
+            size = handle.original_size if handle is not None else (None, None)
+            tokens += image_tokens(*size)
+        return tokens
+
     async def _get_prompts(self, prompt_group_id: str) -> Dict[str, str]:
         """获取提示词"""
         prompts = {}
@@ -680,9 +873,19 @@ class MemoryAnalyzer:
         prompts: Dict[str, str],
         protagonist_features: Optional[Dict[str, Any]] = None,
     ) -> Tuple[List[Dict[str, Any]], float, int, int, int]:
-        """执行Phase 1分析"""
-        phase1_results = []
+        """
+        执行Phase 1分析
+
+        各批次并发调用Gemini（并发数PHASE1_CONCURRENCY），阻塞的
+        generate_content在线程中执行，不阻塞事件循环；结果按批次顺序返回，
+        每个结果记录该批次的调用耗时latency。
 
+        各批次共用的提示词（含主角特征）放入Gemini上下文缓存，批次请求
+        只发送图片和照片信息；返回的输入token不含命中上下文缓存的部分。
+
+        phase1_mode为batch时，未命中缓存的批次作为一个Batch API任务提交，
+        见_execute_phase1_batch_job。
+        """
         # 确保logger已定义
         if "logger" not in globals():
             global logger
@@ -693,132 +896,419 @@ class MemoryAnalyzer:
 
         # 记录开始时间
         start_time = time.time()
-        total_tokens = 0
-        prompt_tokens = 0
-        candidates_tokens = 0
 
-        for batch in batches:
-            local_logger.info(
-                f"分析批次: {batch['batch_id']} ({batch['image_count']}张照片)"
+        # 构建提示词
+        phase1_prompt = self._build_phase1_prompt(prompts, protagonist_features)
+        local_logger.info(
+            f"执行Phase 1分析 - 使用的提示词长度: {len(phase1_prompt)} 字符"
+        )
+        local_logger.info(f"Phase 1提示词内容: {phase1_prompt}")
+
+        local_logger.info(
+            f"Phase 1 共 {len(batches)} 个批次，并发数: {self.PHASE1_CONCURRENCY}"
+        )
+        semaphore = asyncio.Semaphore(self.PHASE1_CONCURRENCY)
+        self.phase1_stats = {}
+        context_cache_created = self.context_cache.stats["created"]
+        context_cache_reused = self.context_cache.stats["reused"]
+        file_stats = dict(self.file_store.stats)
+
+        async def analyze_realtime(batch):
+            async with semaphore:
+                cached_model = await self.context_cache.get_model(PHASE1_MODEL, phase1_prompt)
+                return await self._analyze_phase1_batch(batch, phase1_prompt, cached_model)
+
+        async def analyze_with_semaphore(batch):
+            # 批次内容摘要（图片哈希、提示词、主角特征、模型），内容未变的批次直接复用缓存结果
+            digest = self._phase1_digest(batch, phase1_prompt, protagonist_features)
+            cached = await self._phase1_cache_get(batch, digest)
+            if cached is not None:
+                return self._cached_phase1_result(batch, cached), (0, 0, 0, 0)
+            result, usage = await analyze_realtime(batch)
+            await self._phase1_cache_set(batch, digest, result)
+            return result, usage
+
+        if self.phase1_mode == "batch":
+            outcomes = await self._execute_phase1_batch_job(
+                batches, phase1_prompt, protagonist_features, analyze_realtime
+            )
+        else:
+            outcomes = await asyncio.gather(
+                *[analyze_with_semaphore(batch) for batch in batches]
             )
 
-            # 构建提示词
-            phase1_prompt = prompts.get("phase1", self._get_default_phase1_prompt())
+        phase1_results = [result for result, _ in outcomes]
+        cache_hits = sum(1 for result in phase1_results if result.get("cached"))
+        structured_results = [result["structured"] for result in phase1_results if result.get("structured")]
+        self.phase1_stats.update({
+            "phase1_cache_hits": cache_hits,
+            "phase1_cache_misses": len(phase1_results) - cache_hits,
+            "phase1_cache_hit_rate": cache_hits / len(phase1_results) if phase1_results else 0.0,
+            "phase1_structured_batches": len(structured_results),
+            "phase1_overview": phase1_overview(structured_results),
+        })
+        local_logger.info(
+            f"Phase 1 缓存命中 {cache_hits}/{len(phase1_results)} 个批次"
+        )
+        total_tokens = sum(usage[0] for _, usage in outcomes)
+        prompt_tokens = sum(usage[1] for _, usage in outcomes)
+        candidates_tokens = sum(usage[2] for _, usage in outcomes)
+        cached_tokens = sum(usage[3] for _, usage in outcomes)
+        self.phase1_stats["phase1_cached_tokens"] = cached_tokens
+        self.phase1_stats["phase1_context_cache_created"] = (
+            self.context_cache.stats["created"] - context_cache_created
+        )
+        self.phase1_stats["phase1_context_cache_reused"] = (
+            self.context_cache.stats["reused"] - context_cache_reused
+        )
+        for key in ("uploaded", "reused", "inline", "uploaded_bytes"):
+            self.phase1_stats[f"phase1_files_{key}"] = self.file_store.stats[key] - file_stats[key]
+
+        # 计算耗时和总token消耗
+        phase1_time = time.time() - start_time
+        latencies = [result["latency"] for result in phase1_results]
+        if latencies:
             local_logger.info(
-                f"执行Phase 1分析 - 使用的提示词长度: {len(phase1_prompt)} 字符"
+                f"Phase 1 批次耗时: 最长 {max(latencies):.2f} 秒, 平均 {sum(latencies) / len(latencies):.2f} 秒"
             )
-            local_logger.info(f"Phase 1提示词内容: {phase1_prompt}")
+        local_logger.info(
+            f"Phase 1 分析完成，总耗时: {phase1_time:.2f} 秒, 总Token消耗: {total_tokens}, 输入Token消耗: {prompt_tokens}, 输出Token消耗: {candidates_tokens}, 上下文缓存Token: {cached_tokens}"
+        )
 
-            # 如果有主角特征，添加到提示词中
-            if protagonist_features:
-                phase1_prompt += f"\n\n**主角特征**:\n{json.dumps(protagonist_features, ensure_ascii=False)}"
+        return (
+            phase1_results,
+            phase1_time,
+            total_tokens,
+            prompt_tokens,
+            candidates_tokens,
+        )
 
-            # 准备分析内容
-            content = [phase1_prompt]
+    @staticmethod
+    def _phase1_digest(
+        batch: Dict[str, Any], phase1_prompt: str, protagonist_features: Optional[Dict[str, Any]]
+    ) -> str:
+        """
+        批次内容摘要（Phase 1缓存与批处理任务请求的key）
 
-            # 添加照片信息和图片数据
-            photo_info = []
-            image_count = 0
+        按批次内照片顺序计入内容哈希与照片信息行，结构化结果中的照片序号
+        只会应用到顺序与信息相同的批次
 
-            for photo in batch["photos"][:10]:  # 限制数量，避免提示词过长
-                photo_info.append(
-                    f"- {photo['filename']} (拍摄时间: {photo['datetime'].isoformat()})"
-                )
+        缺少内容哈希的照片以文件名代替，只用于区分同一任务内的批次；
+        这样的摘要不代表内容，不用于跨用户共享的缓存，见_phase1_cacheable
+        """
+        return phase1_digest(
+            [photo.get("image_hash") or photo["filename"] for photo in batch["photos"]],
+            phase1_prompt,
+            protagonist_features,
+            PHASE1_MODEL,
+            [MemoryAnalyzer._photo_info_line(photo) for photo in batch["photos"]],
+        )
 
-                # 添加 Base64 编码的图片（只添加有效的图片数据）
-                if (
-                    photo.get("base64_image")
-                    and photo["base64_image"] != "c2ltdWxhdGVkIGltYWdlIGRhdGE="
-                ):  # 排除模拟数据
-                    local_logger.info(f"添加图片到分析: {photo['filename']}")
-                    # 构建图片 Blob
-                    # 注意：实际项目中，需要根据图片的实际格式设置正确的 mime_type
-                    image_blob = {
-                        "mime_type": "image/jpeg",  # 假设是 JPEG 格式
-                        "data": photo["base64_image"],
-                    }
-                    content.append(image_blob)
-                    image_count += 1
-
-            # 记录处理的图片数量
-            local_logger.info(f"批次 {batch['batch_id']} 包含 {image_count} 张有效图片")
-
-            if len(batch["photos"]) > 10:
-                photo_info.append(f"... 等 {len(batch['photos']) - 10} 张照片")
-
-            # 添加照片信息文本
-            content.append("\n**批次照片信息**:\n" + "\n".join(photo_info))
+    @staticmethod
+    def _phase1_cacheable(batch: Dict[str, Any]) -> bool:
+        """
+        批次结果是否可以写入或读取Phase 1缓存
 
+        缓存跨用户共享，只有全部照片都有内容哈希时摘要才由内容决定；
+        以文件名（如IMG_0001.jpg）代替的摘要可能与其他用户的批次相同
+        """
+        return all(photo.get("image_hash") for photo in batch["photos"])
+
+    async def _phase1_cache_get(self, batch: Dict[str, Any], digest: str) -> Optional[Dict[str, Any]]:
+        """读取批次的缓存结果，不可缓存的批次返回None"""
+        if not self._phase1_cacheable(batch):
+            return None
+        return await self.phase1_cache.get(digest)
+
+    async def _phase1_cache_set(self, batch: Dict[str, Any], digest: str, result: Dict[str, Any]) -> None:
+        """写入批次的缓存结果，不可缓存的批次跳过"""
+        if self._phase1_cacheable(batch):
+            await self.phase1_cache.set(digest, result, PHASE1_MODEL)
+
+    async def _execute_phase1_batch_job(
+        self,
+        batches: List[Dict[str, Any]],
+        phase1_prompt: str,
+        protagonist_features: Optional[Dict[str, Any]],
+        analyze_realtime,
+    ) -> List[Tuple[Dict[str, Any], Tuple[int, int, int, int]]]:
+        """
+        以Batch API任务执行Phase 1
+
+        未命中Phase 1缓存的批次写成一个JSONL任务（key为批次内容摘要）提交并
+        轮询，任务状态保存在记忆记录的phase1_batch_job字段，进程重启后重新
+        分析时继续同一任务（不再重新构建请求、上传图片）。任务失败或缺少结果的
+        批次改为实时分析；等待超时时任务可能仍在运行，保留任务状态供下次继续。
+
+        Returns:
+            按批次顺序的(批次结果, token消耗)
+        """
+        digests = [self._phase1_digest(batch, phase1_prompt, protagonist_features) for batch in batches]
+        hits = await asyncio.gather(
+            *[self._phase1_cache_get(batch, digest) for batch, digest in zip(batches, digests)]
+        )
+
+        outcomes: List[Optional[Tuple[Dict[str, Any], Tuple[int, int, int, int]]]] = [
+            (self._cached_phase1_result(batch, hit), (0, 0, 0, 0)) if hit is not None else None
+            for batch, hit in zip(batches, hits)
+        ]
+        uncached = [index for index, outcome in enumerate(outcomes) if outcome is None]
+
+        # 继续已提交的任务时不再构建请求内容（上传图片、编码请求体）
+        state = await self._load_batch_job_state() if uncached else None
+        if can_resume(state, PHASE1_MODEL, [digests[index] for index in uncached]):
+            requests = {digests[index]: None for index in uncached}
+        else:
+            requests = {}
+            for index in uncached:
+                requests[digests[index]] = build_request(
+                    await self._build_phase1_content(batches[index], phase1_prompt, BATCH_MIN_TTL),
+                    PHASE1_GENERATION_CONFIG,
+                )
+
+        responses = {}
+        job_latency = 0.0
+        job_pending = False
+        if requests:
+            self._report_stage("phase1_batch_job", requests=len(requests))
+            job_start = time.time()
             try:
-                # 生成分析结果
-                model = genai.GenerativeModel("models/gemini-2.5-flash")
-                response = model.generate_content(content)
-                raw_output = response.text.strip()
+                responses = await run_batch_job(
+                    self.batch_client,
+                    PHASE1_MODEL,
+                    requests,
+                    state,
+                    self._save_batch_job_state,
+                    display_name=f"phase1-{self.record_id or 'adhoc'}",
+                )
+            except GeminiBatchTimeout as e:
+                # 任务可能仍在运行，保留任务状态，下次分析时继续该任务
+                job_pending = True
+                logger.error(f"Phase 1批处理任务等待超时，本次改为实时分析: {e}")
+            except GeminiBatchError as e:
+                logger.error(f"Phase 1批处理任务失败，改为实时分析: {e}")
+            job_latency = round(time.time() - job_start, 3)
+            self.phase1_stats["phase1_batch_job_requests"] = len(requests)
+            self.phase1_stats["phase1_batch_job_time"] = job_latency
+
+        fallback = []
+        for index, (batch, digest) in enumerate(zip(batches, digests)):
+            if outcomes[index] is not None:
+                continue
+            response = responses.get(digest)
+            if response is None or response["error"]:
+                if response is not None:
+                    logger.warning(f"批次 {batch['batch_id']} 批处理结果无效: {response['error']}")
+                fallback.append(index)
+                continue
+            result = self._phase1_result(batch, response["text"].strip(), job_latency, False)
+            usage = response["usage"]
+            outcomes[index] = (
+                result,
+                (usage["total"], usage["prompt"] - usage["cached"], usage["candidates"], usage["cached"]),
+            )
+            await self._phase1_cache_set(batch, digest, result)
+
+        if fallback:
+            logger.info(f"{len(fallback)} 个批次改为实时分析")
+            realtime = await asyncio.gather(*[analyze_realtime(batches[index]) for index in fallback])
+            for index, outcome in zip(fallback, realtime):
+                outcomes[index] = outcome
+                await self._phase1_cache_set(batches[index], digests[index], outcome[0])
+
+        if requests and not job_pending:
+            await self._save_batch_job_state(None)
+        return outcomes
+
+    async def _load_batch_job_state(self) -> Optional[Dict[str, Any]]:
+        """读取记忆记录中保存的批处理任务状态"""
+        if self.batch_job_state is None and self.record_id:
+            record = await memory_records_collection.find_one(
+                {"_id": ObjectId(self.record_id)}, {"phase1_batch_job": 1}
+            )
+            self.batch_job_state = (record or {}).get("phase1_batch_job")
+        return self.batch_job_state
+
+    async def _save_batch_job_state(self, state: Optional[Dict[str, Any]]) -> None:
+        """保存批处理任务状态到记忆记录（None表示任务结果已取回，清除状态）"""
+        self.batch_job_state = state
+        if not self.record_id:
+            return
+        update = {"$set": {"phase1_batch_job": state}} if state else {"$unset": {"phase1_batch_job": ""}}
+        await memory_records_collection.update_one({"_id": ObjectId(self.record_id)}, update)
+
+    def _build_phase1_prompt(
+        self, prompts: Dict[str, str], protagonist_features: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Phase 1提示词（如果有主角特征，添加到提示词中）"""
+        phase1_prompt = prompts.get("phase1", self._get_default_phase1_prompt())
+        if protagonist_features:
+            phase1_prompt += f"\n\n**主角特征**:\n{json.dumps(protagonist_features, ensure_ascii=False)}"
+        return phase1_prompt + PHASE1_JSON_INSTRUCTION
+
+    async def _build_phase1_content(
+        self, batch: Dict[str, Any], phase1_prompt: str, min_file_ttl: float = None
+    ) -> List[Any]:
+        """
+        构建单个批次的Phase 1请求内容（提示词 + 图片 + 照片信息）
 
-                # 统计token消耗
-                try:
-                    if hasattr(response, "usage_metadata"):
-                        usage = response.usage_metadata
-                        if hasattr(usage, "total_token_count"):
-                            total = usage.total_token_count
-                            prompt = getattr(usage, "prompt_token_count", 0)
-                            candidates = getattr(usage, "candidates_token_count", 0)
-                            total_tokens += total
-                            prompt_tokens += prompt
-                            candidates_tokens += candidates
-                            local_logger.info(
-                                f"批次 {batch['batch_id']} Token消耗: 总={total}, 输入={prompt}, 输出={candidates}"
-                            )
-                except Exception as e:
-                    local_logger.warning(f"统计Token消耗失败: {e}")
-
-                # 构建结果
-                result = {
-                    "batch_id": batch["batch_id"],
-                    "processed_at": datetime.now().isoformat(),
-                    "image_count": batch["image_count"],
-                    "time_range": (
-                        batch["time_range"][0].isoformat(),
-                        batch["time_range"][1].isoformat(),
-                    ),
-                    "raw_vlm_output": raw_output,
-                    "analysis_summary": self._extract_summary(raw_output),
-                }
+        图片较大的批次经Files API上传（按内容哈希复用），请求中只引用文件；
+        MIME类型按图片字节判断。min_file_ttl为引用的文件至少还需保留的秒数
+        （Batch API任务使用BATCH_MIN_TTL）。
+        """
+        # 添加照片信息和图片数据
+        photo_info = []
+        images = []
+
+        # 批次大小已按token预算打包，全部照片都发送
+        for photo in batch["photos"]:
+            photo_info.append(self._photo_info_line(photo))
+
+            # 优先使用为Phase 1生成的衍生图
+            gemini_image = photo.get("gemini_image")
+            if gemini_image and gemini_image.get("data"):
+                logger.info(f"添加图片到分析: {photo['filename']}")
+                images.append(bytes(gemini_image["data"]))
+            # 添加 Base64 编码的图片（只添加有效的图片数据）
+            elif (
+                photo.get("base64_image")
+                and photo["base64_image"] != "c2ltdWxhdGVkIGltYWdlIGRhdGE="
+            ):  # 排除模拟数据
+                logger.info(f"添加图片到分析: {photo['filename']}")
+                images.append(base64.b64decode(photo["base64_image"]))
+
+        # 记录处理的图片数量
+        logger.info(f"批次 {batch['batch_id']} 包含 {len(images)} 张有效图片")
+
+        content = [phase1_prompt]
+        content.extend(await self.file_store.image_parts(images, min_ttl=min_file_ttl))
+        # 添加照片信息文本
+        content.append("\n**批次照片信息**:\n" + "\n".join(photo_info))
+        return content
+
+    @staticmethod
+    def _cached_phase1_result(
+        batch: Dict[str, Any], cached: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """用缓存的分析结果构建当前批次的结果"""
+        logger.info(f"批次 {batch['batch_id']} 命中Phase 1缓存")
+        result = dict(cached)
+        result.update(
+            batch_id=batch["batch_id"],
+            processed_at=datetime.now().isoformat(),
+            image_count=batch["image_count"],
+            time_range=(
+                batch["time_range"][0].isoformat(),
+                batch["time_range"][1].isoformat(),
+            ),
+            latency=0.0,
+            cached=True,
+        )
+        return result
+
+    async def _analyze_phase1_batch(
+        self, batch: Dict[str, Any], phase1_prompt: str, cached_model: Any = None
+    ) -> Tuple[Dict[str, Any], Tuple[int, int, int, int]]:
+        """
+        分析单个批次
+
+        Args:
+            batch: 批次
+            phase1_prompt: Phase 1提示词
+            cached_model: 引用提示词上下文缓存的模型，为None时随请求发送提示词
+
+        Returns:
+            (批次结果, (总token, 输入token, 输出token, 上下文缓存token))，
+            输入token不含上下文缓存部分
+        """
+        logger.info(
+            f"分析批次: {batch['batch_id']} ({batch['image_count']}张照片)"
+        )
+        content = await self._build_phase1_content(batch, phase1_prompt)
+        if cached_model is not None:
+            # 提示词已在上下文缓存中
+            content = content[1:]
+        usage_counts = (0, 0, 0, 0)
+        failed = False
+        batch_start = time.time()
 
-                local_logger.info(f"批次 {batch['batch_id']} 分析完成")
+        try:
+            # 流式生成分析结果（复用客户端池中的模型，经共享调度器限流、重试）
+            progress_key = f"phase1.{batch['batch_id']}"
+            response = await self.gemini_pool.generate_stream(
+                PHASE1_MODEL,
+                content,
+                on_text=self._stream_callback(progress_key),
+                model=cached_model,
+                generation_config=PHASE1_GENERATION_CONFIG,
+            )
+            raw_output = response.text.strip()
+            if self.progress is not None:
+                await self.progress.flush(progress_key)
 
+            # 统计token消耗（prompt_token_count包含命中上下文缓存的部分）
+            try:
+                if hasattr(response, "usage_metadata"):
+                    usage = response.usage_metadata
+                    if hasattr(usage, "total_token_count"):
+                        total = usage.total_token_count
+                        cached = getattr(usage, "cached_content_token_count", 0) or 0
+                        prompt = getattr(usage, "prompt_token_count", 0) - cached
+                        candidates = getattr(usage, "candidates_token_count", 0)
+                        usage_counts = (total, prompt, candidates, cached)
+                        logger.info(
+                            f"批次 {batch['batch_id']} Token消耗: 总={total}, 输入={prompt}, 输出={candidates}, 上下文缓存={cached}"
+                        )
             except Exception as e:
-                local_logger.error(f"批次 {batch['batch_id']} 分析失败: {e}")
-                traceback.print_exc()
-
-                # 构建错误结果
-                result = {
-                    "batch_id": batch["batch_id"],
-                    "processed_at": datetime.now().isoformat(),
-                    "image_count": batch["image_count"],
-                    "time_range": (
-                        batch["time_range"][0].isoformat(),
-                        batch["time_range"][1].isoformat(),
-                    ),
-                    "raw_vlm_output": f"分析失败: {str(e)}",
-                    "analysis_summary": "分析失败",
-                }
+                logger.warning(f"统计Token消耗失败: {e}")
 
-            phase1_results.append(result)
+            logger.info(
+                f"批次 {batch['batch_id']} 分析完成，耗时: {time.time() - batch_start:.2f} 秒"
+            )
 
-        # 计算耗时和总token消耗
-        phase1_time = time.time() - start_time
-        local_logger.info(
-            f"Phase 1 分析完成，总耗时: {phase1_time:.2f} 秒, 总Token消耗: {total_tokens}, 输入Token消耗: {prompt_tokens}, 输出Token消耗: {candidates_tokens}"
-        )
+        except Exception as e:
+            logger.error(f"批次 {batch['batch_id']} 分析失败: {e}")
+            traceback.print_exc()
+            self.file_store.forget(content)
+            raw_output = f"分析失败: {str(e)}"
+            failed = True
 
-        return (
-            phase1_results,
-            phase1_time,
-            total_tokens,
-            prompt_tokens,
-            candidates_tokens,
+        result = self._phase1_result(
+            batch, raw_output, round(time.time() - batch_start, 3), failed
         )
+        return result, usage_counts
+
+    def _phase1_result(
+        self, batch: Dict[str, Any], raw_output: str, latency: float, failed: bool
+    ) -> Dict[str, Any]:
+        """
+        构建批次结果
+
+        输出按约定结构解析为structured字段；无法解析时（如输出被截断）
+        structured为None，摘要退回取原始输出的前几行。
+        """
+        structured = None if failed else parse_phase1_output(raw_output)
+        if failed:
+            analysis_summary = "分析失败"
+        elif structured is not None:
+            analysis_summary = structured.get("batch_summary") or self._extract_summary(raw_output)
+        else:
+            logger.warning(f"批次 {batch['batch_id']} 输出不是有效的JSON，保留原始文本")
+            analysis_summary = self._extract_summary(raw_output)
+        return {
+            "batch_id": batch["batch_id"],
+            "processed_at": datetime.now().isoformat(),
+            "image_count": batch["image_count"],
+            "time_range": (
+                batch["time_range"][0].isoformat(),
+                batch["time_range"][1].isoformat(),
+            ),
+            "raw_vlm_output": raw_output,
+            "analysis_summary": analysis_summary,
+            "structured": structured,
+            "latency": latency,
+            "failed": failed,
+        }
 
     async def _execute_phase2(
         self, phase1_results: List[Dict[str, Any]], prompts: Dict[str, str]
@@ -842,13 +1332,24 @@ class MemoryAnalyzer:
         )
         local_logger.info(f"Phase 2提示词内容: {phase2_prompt}")
 
-        # 准备phase1结果摘要
+        # 重试后仍失败的批次不进入Phase 2，避免把错误信息当作分析结果
+        failed_batches = [r["batch_id"] for r in phase1_results if r.get("failed")]
+        if failed_batches:
+            local_logger.warning(f"Phase 2 跳过 {len(failed_batches)} 个失败批次: {failed_batches}")
+        phase1_results = [r for r in phase1_results if not r.get("failed")]
+
+        # 准备phase1结果摘要（结构化结果按维度合并为紧凑文本，旧记录只有文本摘要）
         phase1_summary = "\n".join(
             [
                 f"**批次 {result['batch_id']}**:\n"
                 f"- 照片数量: {result['image_count']}\n"
                 f"- 时间范围: {result['time_range'][0]} 至 {result['time_range'][1]}\n"
-                f"- 分析摘要: {result.get('analysis_summary', '无')}\n"
+                + (
+                    compact_phase1(result["structured"])
+                    if result.get("structured")
+                    else f"- 分析摘要: {result.get('analysis_summary', '无')}"
+                )
+                + "\n"
                 for result in phase1_results
             ]
         )
@@ -858,14 +1359,17 @@ class MemoryAnalyzer:
 
         try:
             # 生成分析结果
-            model = genai.GenerativeModel("models/gemini-2.5-flash")
-            response = model.generate_content(content)
+            response = await self.gemini_pool.generate_stream(
+                PHASE2_MODEL, content, on_text=self._stream_callback("phase2")
+            )
 
             # 检查响应是否包含有效的 Part
             if not response.candidates or not response.candidates[0].content.parts:
                 raise ValueError("响应不包含有效的内容")
 
             raw_output = response.text.strip()
+            if self.progress is not None:
+                await self.progress.flush("phase2")
 
             # 统计token消耗
             try:
@@ -1003,84 +1507,223 @@ class MemoryAnalyzer:
         Returns:
             (处理后的照片列表, 处理耗时)
         """
-        processed_photos = []
         start_time = time.time()
         local_logger = logger
 
-        for photo in photos:
-            try:
-                # 获取图片数据
-                base64_image = photo.get("base64_image")
-                if not base64_image:
-                    local_logger.warning(f"跳过无图片数据的照片: {photo.get('filename', 'unknown')}")
-                    processed_photos.append(photo)
-                    continue
-
-                # 转换base64为字节
-                image_data = base64.b64decode(base64_image)
-
-                # 计算MD5哈希值
-                image_hash = await self.features_extractor.get_image_hash(image_data)
-                photo["image_hash"] = image_hash
-
-                # 提取特征
-                local_logger.info(f"提取特征: {photo.get('filename', 'unknown')}")
-                features = await self.features_extractor.extract_features(image_data)
-                photo["features"] = features
+        counters = {
+            "feature_hits": 0,
+            "feature_extractions": 0,
+            "compressions": 0,
+            "compressed_bytes": 0,
+            "encode_time": 0.0,
+        }
+        handles: List[DecodedImage] = []
+
+        # 多张照片并行处理，并发数与线程池大小一致
+        semaphore = asyncio.Semaphore(self.IMAGE_PROCESS_CONCURRENCY)
+        hash_locks: Dict[str, asyncio.Lock] = {}
+
+        async def process_photo(photo: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._process_image(photo, user_id, counters, handles, hash_locks)
+
+        processed_photos = list(await asyncio.gather(*[process_photo(photo) for photo in photos]))
+        feature_hits = counters["feature_hits"]
+        feature_extractions = counters["feature_extractions"]
+        compressions = counters["compressions"]
+        compressed_bytes = counters["compressed_bytes"]
+        encode_time = counters["encode_time"]
+
+        # 压缩是解码图像的最后一个使用方，处理完成后释放像素缓冲
+        image_decodes = 0
+        for handle in handles:
+            image_decodes += handle.decode_count
+            handle.release()
+
+        self.process_stats = {
+            "feature_cache_hits": feature_hits,
+            "feature_extractions": feature_extractions,
+            "compressions": compressions,
+            "image_decodes": image_decodes,
+            "decodes_per_photo": image_decodes / len(handles) if handles else 0,
+            "avg_compressed_bytes": compressed_bytes / compressions if compressions else 0,
+            "encode_time": encode_time,
+        }
+        local_logger.info(
+            f"特征缓存命中 {feature_hits} 张, 重新提取 {feature_extractions} 张, 压缩 {compressions} 张, "
+            f"解码 {image_decodes} 次, 平均压缩大小 {self.process_stats['avg_compressed_bytes'] / 1024:.1f} KB, "
+            f"编码耗时 {encode_time:.2f} 秒"
+        )
+
+        process_time = time.time() - start_time
+        local_logger.info(f"图片处理完成，共处理 {len(processed_photos)} 张照片, 耗时: {process_time:.2f} 秒")
+        return processed_photos, process_time
+
+    async def _process_image(
+        self,
+        photo: Dict[str, Any],
+        user_id: str,
+        counters: Dict[str, Any],
+        handles: List[DecodedImage],
+        hash_locks: Dict[str, asyncio.Lock],
+    ) -> Dict[str, Any]:
+        """
+        处理单张图片：特征提取、生成衍生图并存储
+
+        特征提取与压缩是CPU密集型操作，在线程池中执行，不阻塞事件循环
 
-                # 压缩图片
-                local_logger.info(f"压缩图片: {photo.get('filename', 'unknown')}")
-                compression_result = await self.image_compressor.compress(image_data)
-                photo["compressed_info"] = compression_result
+        Args:
+            photo: 照片
+            user_id: 用户ID
+            counters: 处理统计（累加）
+            handles: 收集解码句柄，全部处理完成后统一释放
+            hash_locks: 按图片哈希的锁
 
+        Returns:
+            处理后的照片；失败时返回原始照片
+        """
+        model_version = self.features_extractor.MODEL_VERSION
+        try:
+            # 获取图片数据
+            base64_image = photo.get("base64_image")
+            if not base64_image:
+                logger.warning(f"跳过无图片数据的照片: {photo.get('filename', 'unknown')}")
+                return photo
+
+            # 复用前序阶段的解码句柄，没有时从base64构建
+            handle = photo.pop("decoded_image", None) or DecodedImage(
+                base64.b64decode(base64_image), filename=photo.get("filename", "")
+            )
+            image_data = handle.data
+            handles.append(handle)
+
+            # 先计算MD5哈希值，命中缓存时跳过特征提取和压缩
+            image_hash = handle.md5
+            photo["image_hash"] = image_hash
+
+            # 相同内容的照片依次处理，后到的复用先到的存储记录
+            async with hash_locks.setdefault(image_hash, asyncio.Lock()):
                 # 检查是否已经存储过
-                existing_photo = await photos_collection.find_one({"image_hash": image_hash})
+                existing_photo = await photos_collection.find_one(
+                    {"image_hash": image_hash}, PHOTO_BLOB_EXCLUSION
+                )
+
+                # 查询特征缓存，已存储且版本一致的特征同样视为命中
+                features = await self.feature_cache.get(image_hash)
+                if (
+                    features is None
+                    and existing_photo
+                    and existing_photo.get("features")
+                    and existing_photo.get("features_version") == model_version
+                ):
+                    features = decode_features(existing_photo["features"])
+                    await self.feature_cache.set(image_hash, features)
+
+                if features is None:
+                    logger.info(f"提取特征: {photo.get('filename', 'unknown')}")
+                    features = await self._run_cpu_bound(self.features_extractor.extract_features_sync, handle)
+                    await self.feature_cache.set(image_hash, features)
+                    counters["feature_extractions"] += 1
+                else:
+                    counters["feature_hits"] += 1
+                photo["features"] = features
+
                 if existing_photo:
-                    local_logger.info(f"照片已存在，使用现有记录: {photo.get('filename', 'unknown')}")
-                    
-                    # 检查是否缺少压缩图片数据
-                    has_compressed_image_data = "compressed_image_data" in existing_photo
-                    
-                    if not has_compressed_image_data:
-                        local_logger.info(f"更新缺失的压缩图片数据: {photo.get('filename', 'unknown')}")
-                        # 只更新压缩图片数据
-                        await photos_collection.update_one(
-                            {"image_hash": image_hash},
-                            {"$set": {"compressed_image_data": compression_result.get("compressed_data")}}
+                    logger.info(f"照片已存在，使用现有记录: {photo.get('filename', 'unknown')}")
+                    updates = {}
+
+                    # 特征版本过期时更新存储的特征
+                    if existing_photo.get("features_version") != model_version:
+                        updates["features"] = encode_features(features)
+                        updates["features_version"] = model_version
+
+                    # 检查是否缺少衍生图
+                    compressed_info = existing_photo.get("compressed_info")
+                    renditions = existing_photo.get("renditions")
+                    gemini_data = None
+                    unset = {}
+                    # 旧记录（内嵌图片数据或无衍生图）重新生成并写入图片存储
+                    if not renditions or not all(r.get("blob") for r in renditions.values()):
+                        logger.info(f"生成缺失的衍生图: {photo.get('filename', 'unknown')}")
+                        rendition_result = await self._run_cpu_bound(
+                            self.image_compressor.compress_renditions_sync, handle
                         )
-                    
+                        counters["compressions"] += 1
+                        compressed_info = rendition_summary(rendition_result)
+                        counters["compressed_bytes"] += sum(r["size"] for r in rendition_result["renditions"].values())
+                        counters["encode_time"] += rendition_result["encode_time"]
+                        gemini_data = (rendition_result["renditions"].get("gemini") or {}).get("data")
+                        renditions = await store_renditions(rendition_result["renditions"], self.blob_store)
+                        updates["renditions"] = renditions
+                        updates["compressed_info"] = compressed_info
+                        unset = {"compressed_image_data": ""}
+                    else:
+                        gemini_data = await load_rendition(renditions.get("gemini"))
+
+                    if updates:
+                        update = {"$set": updates}
+                        if unset:
+                            update["$unset"] = unset
+                        await photos_collection.update_one({"image_hash": image_hash}, update)
+                        if "renditions" in updates:
+                            await restore_missing(rendition_result["renditions"], renditions)
+
                     # 更新关联信息
                     photo["photo_id"] = str(existing_photo["_id"])
-                    photo["features"] = existing_photo.get("features")
-                    photo["compressed_info"] = existing_photo.get("compressed_info")
-                    processed_photos.append(photo)
-                    continue
-
-                # 存储到MongoDB（只存储压缩后的图片数据）
+                    photo["compressed_info"] = compressed_info
+                    if gemini_data:
+                        photo["gemini_image"] = {**renditions["gemini"], "data": gemini_data}
+                    return photo
+
+                # 一次解码生成全部衍生图
+                logger.info(f"压缩图片: {photo.get('filename', 'unknown')}")
+                rendition_result = await self._run_cpu_bound(self.image_compressor.compress_renditions_sync, handle)
+                counters["compressions"] += 1
+                compressed_info = rendition_summary(rendition_result)
+                counters["compressed_bytes"] += sum(r["size"] for r in rendition_result["renditions"].values())
+                counters["encode_time"] += rendition_result["encode_time"]
+                photo["compressed_info"] = compressed_info
+                photo["gemini_image"] = rendition_result["renditions"].get("gemini")
+
+                # 图片数据写入图片存储，文档只保存引用
+                renditions = await store_renditions(rendition_result["renditions"], self.blob_store)
+
+                # 存储到MongoDB（只存储压缩后的衍生图引用）
                 photo_doc = {
                     "user_id": user_id,
                     "image_hash": image_hash,
                     "filename": photo.get("filename"),
                     "datetime": photo.get("datetime"),
-                    "features": features,
-                    "compressed_info": compression_result,
+                    "gps_lat": photo.get("gps_lat"),
+                    "gps_lon": photo.get("gps_lon"),
+                    "features": encode_features(features),
+                    "features_version": model_version,
+                    "compressed_info": compressed_info,
                     "original_size": len(image_data),
-                    "compressed_image_data": compression_result.get("compressed_data"),
+                    "renditions": renditions,
                     "created_at": datetime.now()
                 }
                 result = await photos_collection.insert_one(photo_doc)
                 photo["photo_id"] = str(result.inserted_id)
+                # 写入引用期间相同内容的其他照片可能被删除，确认数据仍然存在
+                await restore_missing(rendition_result["renditions"], renditions)
 
-                processed_photos.append(photo)
+                return photo
 
-            except Exception as e:
-                local_logger.error(f"处理图片失败: {e}")
-                # 失败时保留原始照片
-                processed_photos.append(photo)
+        except Exception as e:
+            logger.error(f"处理图片失败: {e}")
+            # 失败时保留原始照片
+            return photo
 
-        process_time = time.time() - start_time
-        local_logger.info(f"图片处理完成，共处理 {len(processed_photos)} 张照片, 耗时: {process_time:.2f} 秒")
-        return processed_photos, process_time
+    async def _run_cpu_bound(self, func, *args):
+        """
+        在线程池中运行CPU密集型的同步函数
+
+        特征提取、压缩是同步的PIL/OpenCV/CLIP计算，在事件循环中直接执行会阻塞
+        事件循环（SSE进度推送与其他请求随之停顿），这里提交到工作线程执行
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
 
     def _calculate_time_range(self, photos: List[Dict[str, Any]]) -> Tuple[str, str]:
         """计算时间范围"""
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Phase 1 结果缓存
+
+以批次内容摘要为键缓存Phase 1分析结果，跨记录、跨用户复用：
+摘要由batch_digest.phase1_digest按（排序后的图片哈希、提示词全文、主角特征、模型名称）计算，
+照片、提示词或模型任一变化都会得到新的摘要，不会误用旧结果。
+
+本地LRU作为一级缓存，MongoDB作为持久化二级缓存；MongoDB记录按
+最近使用时间由TTL索引过期（PHASE1_CACHE_TTL_DAYS，默认30天）。
+"""
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from app.config.database import phase1_cache_collection
+from app.services.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# 缓存结果中与具体批次相关、命中时需要替换的字段
+_BATCH_FIELDS = ("batch_id", "processed_at", "image_count", "time_range", "latency")
+
+
+class Phase1Cache:
+    """基于批次内容摘要的Phase 1结果缓存"""
+
+    def __init__(self, max_entries: int = 1024, collection=None):
+        """
+        初始化缓存
+
+        Args:
+            max_entries: 本地LRU最大条目数
+            collection: MongoDB集合，默认使用phase1_cache集合
+        """
+        self.local_cache = LRUCache(max_entries=max_entries)
+        self.collection = collection if collection is not None else phase1_cache_collection
+
+    async def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存的批次结果
+
+        Args:
+            digest: 批次内容摘要
+
+        Returns:
+            分析结果（不含批次相关字段），未命中时返回None
+        """
+        result = self.local_cache.get(digest)
+        if result is not None:
+            return dict(result)
+
+        try:
+            doc = await self.collection.find_one_and_update(
+                {"digest": digest},
+                {"$set": {"last_used_at": datetime.utcnow()}},
+            )
+        except Exception as e:
+            logger.warning(f"查询Phase 1缓存失败: {e}")
+            doc = None
+
+        if not doc:
+            return None
+
+        result = doc.get("result")
+        self.local_cache.set(digest, result)
+        return dict(result)
+
+    async def set(self, digest: str, result: Dict[str, Any], model_name: str = None) -> None:
+        """
+        写入缓存，失败的批次结果不缓存
+
+        Args:
+            digest: 批次内容摘要
+            result: Phase 1批次结果
+            model_name: 模型名称（仅用于排查）
+        """
+        if result.get("failed"):
+            return
+
+        stored = {key: value for key, value in result.items() if key not in _BATCH_FIELDS}
+        self.local_cache.set(digest, stored)
+        now = datetime.utcnow()
+        try:
+            await self.collection.update_one(
+                {"digest": digest},
+                {
+                    "$set": {"result": stored, "model": model_name, "last_used_at": now},
+                    "$setOnInsert": {"digest": digest, "created_at": now},
+                },
+                upsert=True,
+            )
+        except Exception as e:
+            logger.warning(f"写入Phase 1缓存失败: {e}")
+
+
+_shared_cache: Optional[Phase1Cache] = None
+
+
+def get_phase1_cache() -> Phase1Cache:
+    """获取进程内共享的Phase 1缓存实例"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = Phase1Cache()
+    return _shared_cache
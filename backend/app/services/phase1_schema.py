@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Phase 1 结构化输出
+
+Phase 1以response_schema约束Gemini输出JSON（逐张照片的场景、人物、物品、
+活动、主角是否出现），取代长篇自由文本：
+- 输出token大幅减少（字段短、不重复铺陈）
+- 结果以structured字段保存，Phase 2与统计直接使用紧凑结构，
+  不再只截取自由文本的前几行
+"""
+
+import json
+import logging
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Gemini response_schema（OpenAPI子集）
+PHASE1_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "batch_summary": {
+            "type": "STRING",
+            "description": "本批次照片的一句话概括（不超过60字），以【主角】为中心",
+        },
+        "protagonist": {
+            "type": "STRING",
+            "description": "【主角】的外貌特征（性别、年龄段、发型、体型、服装风格），未出现时为空字符串",
+        },
+        "photos": {
+            "type": "ARRAY",
+            "description": "逐张照片的描述，顺序与批次照片信息一致",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "index": {"type": "INTEGER", "description": "照片序号，从1开始"},
+                    "scene": {"type": "STRING", "description": "场景，如咖啡厅、办公室、公园、家中"},
+                    "location": {"type": "STRING", "description": "城市或地点线索，无法判断时为空字符串"},
+                    "people": {
+                        "type": "ARRAY",
+                        "items": {"type": "STRING"},
+                        "description": "画面中的人物，主角记为【主角】，其他人记为女性A、男性B等",
+                    },
+                    "objects": {
+                        "type": "ARRAY",
+                        "items": {"type": "STRING"},
+                        "description": "重要物品、品牌、食物、宠物等，最多5项",
+                    },
+                    "activity": {"type": "STRING", "description": "【主角】或画面中人物正在进行的活动"},
+                    "mood": {"type": "STRING", "description": "人物情绪或画面氛围"},
+                    "protagonist_present": {"type": "BOOLEAN", "description": "【主角】是否出现在画面中"},
+                },
+                "required": ["index", "scene", "people", "objects", "activity", "protagonist_present"],
+            },
+        },
+    },
+    "required": ["batch_summary", "photos"],
+}
+
+PHASE1_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": PHASE1_RESPONSE_SCHEMA,
+}
+
+# 追加在Phase 1提示词之后，说明输出格式（提示词由用户配置，可能仍要求自由文本）
+PHASE1_JSON_INSTRUCTION = (
+    "\n\n**输出格式**: 只输出符合约定结构的JSON，不要输出其他文字。photos按批次照片信息的顺序"
+    "逐张描述，每个字段用简短词语；人物统一用【主角】、女性A、男性B等标记。"
+)
+
+# 紧凑摘要中每个维度保留的条目数
+TOP_ITEMS = 8
+
+
+def parse_phase1_output(text: str) -> Optional[Dict[str, Any]]:
+    """
+    解析Phase 1的JSON输出
+
+    Returns:
+        结构化结果；不是有效JSON（如输出被截断）时返回None
+    """
+    text = (text or "").strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("photos"), list):
+        return None
+    data["photos"] = [photo for photo in data["photos"] if isinstance(photo, dict)]
+    return data
+
+
+def _counter(values: Iterable[Any]) -> Counter:
+    return Counter(str(value).strip() for value in values if value and str(value).strip())
+
+
+def _format_counts(counter: Counter, limit: int = TOP_ITEMS) -> str:
+    return "、".join(name if count == 1 else f"{name}×{count}" for name, count in counter.most_common(limit))
+
+
+def summarize_structured(structured: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    统计一个或多个批次的结构化结果
+
+    Args:
+        structured: parse_phase1_output的结果
+
+    Returns:
+        {"photos", "protagonist_photos", "scenes", "locations", "people", "objects", "activities", "moods"}，
+        各维度为Counter
+    """
+    photos = structured.get("photos", [])
+    return {
+        "photos": len(photos),
+        "protagonist_photos": sum(1 for photo in photos if photo.get("protagonist_present")),
+        "scenes": _counter(photo.get("scene") for photo in photos),
+        "locations": _counter(photo.get("location") for photo in photos),
+        "people": _counter(person for photo in photos for person in photo.get("people") or []),
+        "objects": _counter(item for photo in photos for item in photo.get("objects") or []),
+        "activities": _counter(photo.get("activity") for photo in photos),
+        "moods": _counter(photo.get("mood") for photo in photos),
+    }
+
+
+def compact_phase1(structured: Dict[str, Any]) -> str:
+    """
+    批次结构化结果的紧凑文本（Phase 2输入）
+
+    逐张描述按维度计数合并，只保留出现最多的条目
+    """
+    counts = summarize_structured(structured)
+    lines = []
+    if structured.get("batch_summary"):
+        lines.append(f"- 概括: {structured['batch_summary']}")
+    if structured.get("protagonist"):
+        lines.append(f"- 主角: {structured['protagonist']}")
+    lines.append(f"- 主角出镜: {counts['protagonist_photos']}/{counts['photos']} 张")
+    for label, key in (
+        ("场景", "scenes"), ("地点", "locations"), ("活动", "activities"),
+        ("人物", "people"), ("物品", "objects"), ("情绪", "moods"),
+    ):
+        if counts[key]:
+            lines.append(f"- {label}: {_format_counts(counts[key])}")
+    return "\n".join(lines)
+
+
+def phase1_overview(structured_results: List[Dict[str, Any]], limit: int = 10) -> Dict[str, Any]:
+    """
+    全部批次的统计概览（保存在分析统计中）
+
+    Args:
+        structured_results: 各批次的结构化结果
+        limit: 各维度保留的条目数
+
+    Returns:
+        照片数、主角出镜比例与各维度出现最多的条目
+    """
+    total = {"photos": 0, "protagonist_photos": 0}
+    merged = {key: Counter() for key in ("scenes", "locations", "people", "objects", "activities", "moods")}
+    for structured in structured_results:
+        counts = summarize_structured(structured)
+        total["photos"] += counts["photos"]
+        total["protagonist_photos"] += counts["protagonist_photos"]
+        for key in merged:
+            merged[key].update(counts[key])
+    overview = {
+        "photos": total["photos"],
+        "protagonist_rate": round(total["protagonist_photos"] / total["photos"], 3) if total["photos"] else 0.0,
+    }
+    for key, counter in merged.items():
+        overview[f"top_{key}"] = [[name, count] for name, count in counter.most_common(limit)]
+    return overview
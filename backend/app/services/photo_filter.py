@@ -15,6 +15,8 @@ import os
 import hashlib
 import numpy as np
 from app.services.image_features import ImageFeaturesExtractor
+from app.services.feature_cache import get_feature_cache
+from app.services.decoded_image import DecodedImage, SUPPORTED_EXTENSIONS
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +27,7 @@ class PhotoFilter:
     def __init__(self):
         """初始化过滤器"""
         self.features_extractor = ImageFeaturesExtractor()
+        self.feature_cache = get_feature_cache()
 
     async def filter(
         self, photos: List[Dict[str, Any]], user_id: str, photo_map: dict = None
@@ -257,7 +260,10 @@ class PhotoFilter:
         self, photos: List[Dict[str, Any]]
     ) -> List[Dict[str, Any]]:
         """
-        过滤Gemini无法处理的图片
+        过滤无法处理的图片
+
+        HEIC/HEIF、MPO等Gemini不直接支持的格式在压缩阶段转码为WebP衍生图，
+        因此只过滤无法解码的格式。
 
         Args:
             photos: 照片列表
@@ -267,8 +273,8 @@ class PhotoFilter:
         """
         compatible_photos = []
 
-        # Gemini支持的图片格式
-        supported_formats = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
+        # 可解码并转码为Gemini兼容衍生图的格式
+        supported_formats = SUPPORTED_EXTENSIONS
 
         for photo in photos:
             try:
@@ -326,10 +332,15 @@ class PhotoFilter:
                             continue
                 
                 if photo_data:
-                    # 提取特征
-                    features = await self.features_extractor.extract_features(photo_data)
+                    # 创建共享解码句柄，后续下载、特征提取、压缩阶段复用
+                    handle = DecodedImage(photo_data, filename=photo.get("filename", ""))
+                    # 提取特征（按内容哈希命中缓存时跳过计算）
+                    features = await self.feature_cache.get_or_extract(
+                        handle.md5, self.features_extractor, handle
+                    )
+                    photo["image_hash"] = handle.md5
                     photo["features"] = features
-                    photo["image_data"] = photo_data  # 临时存储图片数据
+                    photo["decoded_image"] = handle
                     photos_with_features.append(photo)
                 else:
                     # 没有图片数据，直接添加
@@ -340,7 +351,7 @@ class PhotoFilter:
 
         # 基于特征相似度分组
         for photo in photos_with_features:
-            if "features" not in photo or not photo["features"].get("visual_features"):
+            if "features" not in photo or photo["features"].get("visual_features") is None:
                 # 没有特征，单独一组
                 duplicate_groups.append([photo])
                 continue
@@ -350,7 +361,7 @@ class PhotoFilter:
             for group in duplicate_groups:
                 # 计算与组内第一张照片的相似度
                 group_photo = group[0]
-                if "features" in group_photo and group_photo["features"].get("visual_features"):
+                if "features" in group_photo and group_photo["features"].get("visual_features") is not None:
                     similarity = self._calculate_similarity(
                         photo["features"]["visual_features"],
                         group_photo["features"]["visual_features"]
@@ -375,16 +386,16 @@ class PhotoFilter:
                 best_photo = await self._select_best_photo(group)
                 best_photo["is_duplicate"] = False
                 unique_photos.append(best_photo)
-                # 标记其他照片为重复
+                # 标记其他照片为重复，释放其解码句柄
                 for photo in group:
-                    if photo != best_photo:
+                    if photo is not best_photo:
                         photo["is_duplicate"] = True
+                        handle = photo.pop("decoded_image", None)
+                        if handle:
+                            handle.release()
                         logger.debug(f"过滤掉重复照片: {photo.get('filename', '')}")
 
-        # 清理临时数据
-        for photo in unique_photos:
-            if "image_data" in photo:
-                del photo["image_data"]
+        # 保留的照片携带解码句柄进入后续阶段，由最后一个使用方释放
 
         return unique_photos
 
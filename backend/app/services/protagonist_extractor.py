@@ -13,6 +13,7 @@ import google.generativeai as genai
 from dotenv import load_dotenv
 from datetime import datetime
 from ..config.database import users_collection, prompts_collection
+from .gemini_client_pool import get_gemini_client_pool
 from bson import ObjectId
 
 load_dotenv()
@@ -134,8 +135,9 @@ async def extract_protagonist_features(
 
     try:
         # 生成内容
-        model = genai.GenerativeModel("models/gemini-2.5-flash")
-        response = model.generate_content([prompt, image])
+        response = await get_gemini_client_pool().generate(
+            "models/gemini-2.5-flash", [prompt, image]
+        )
         raw_output = response.text.strip()
 
         # 提取 JSON
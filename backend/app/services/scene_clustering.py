@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+场景聚类服务
+
+基于已存储的CLIP视觉嵌入对每个用户的照片进行场景聚类：
+- 以固定大小的分块从MongoDB流式读取嵌入，内存占用与照片总数无关
+- 全量训练使用MiniBatchKMeans.partial_fit分块训练，聚类中心与各聚类样本数持久化到scene_clusters集合
+- 已有聚类模型时只对新照片增量训练与分配，按各聚类的累计样本数加权更新中心，
+  少量新照片不会覆盖已有历史；中心相对上次全量分配的偏移或样本数增长超过阈值时
+  才重新分配全部照片
+- 训练与分配的numpy计算在线程中执行，不阻塞事件循环
+- 聚类结果写回photos集合的scene_cluster字段，供Phase 1批次划分使用
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+from bson.binary import Binary
+from pymongo import UpdateOne
+from sklearn.cluster import MiniBatchKMeans
+
+from app.config.database import photos_collection, scene_clusters_collection
+from app.services.embedding_store import decode_embedding
+
+logger = logging.getLogger(__name__)
+
+
+class SceneClusteringService:
+    """按用户增量维护的场景聚类"""
+
+    def __init__(
+        self,
+        n_clusters: int = None,
+        chunk_size: int = None,
+        features_version: Optional[str] = None,
+        collection=None,
+        clusters_collection=None,
+    ):
+        """
+        初始化聚类服务
+
+        Args:
+            n_clusters: 最大聚类数量
+            chunk_size: 每次从MongoDB读取并训练的嵌入数量（决定内存上限）
+            features_version: 嵌入对应的特征模型版本，版本变化时重新训练
+            collection: 照片集合
+            clusters_collection: 聚类模型集合
+        """
+        self.n_clusters = n_clusters or int(os.getenv("SCENE_CLUSTER_COUNT", "16"))
+        self.chunk_size = chunk_size or int(os.getenv("SCENE_CLUSTER_CHUNK_SIZE", "2048"))
+        self.features_version = features_version
+        self.collection = collection if collection is not None else photos_collection
+        self.clusters_collection = (
+            clusters_collection if clusters_collection is not None else scene_clusters_collection
+        )
+        self.centroids: Optional[np.ndarray] = None
+        self.counts: Optional[np.ndarray] = None
+        # 中心相对上次全量分配的最大L2偏移（CLIP嵌入已归一化）与样本数增长倍数，
+        # 超过任一阈值时重新分配全部照片
+        self.drift_threshold = float(os.getenv("SCENE_CLUSTER_DRIFT", "0.05"))
+        self.growth_threshold = float(os.getenv("SCENE_CLUSTER_GROWTH", "2.0"))
+        # 上次全量分配时的中心与样本数
+        self.reference_centroids: Optional[np.ndarray] = None
+        self.reference_count = 0
+
+    async def _iter_chunks(
+        self, query: Dict[str, Any]
+    ) -> AsyncIterator[Tuple[List[Any], np.ndarray]]:
+        """
+        分块流式读取嵌入
+
+        Args:
+            query: 照片查询条件
+
+        Yields:
+            (照片_id列表, float32嵌入矩阵)
+        """
+        cursor = (
+            self.collection.find(query, {"features.visual_features": 1})
+            .sort("_id", 1)
+            .batch_size(self.chunk_size)
+        )
+        ids, vectors = [], []
+        async for doc in cursor:
+            try:
+                vector = decode_embedding(doc["features"]["visual_features"])
+            except Exception:
+                continue
+            if vector is None:
+                continue
+            ids.append(doc["_id"])
+            vectors.append(vector)
+            if len(ids) >= self.chunk_size:
+                yield ids, np.asarray(vectors, dtype=np.float32)
+                ids, vectors = [], []
+        if ids:
+            yield ids, np.asarray(vectors, dtype=np.float32)
+
+    def predict(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        将嵌入分配到最近的聚类中心
+
+        Args:
+            vectors: 嵌入矩阵 (n, dim)
+
+        Returns:
+            聚类标签数组
+        """
+        if self.centroids is None or len(vectors) == 0:
+            return np.full(len(vectors), -1, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        # ||x - c||² = ||x||² - 2x·c + ||c||²，||x||²对argmin无影响
+        distances = (self.centroids ** 2).sum(axis=1) - 2.0 * vectors @ self.centroids.T
+        return distances.argmin(axis=1)
+
+    def partial_update(self, vectors: np.ndarray) -> None:
+        """
+        用新样本增量更新聚类中心
+
+        每个中心是其全部已分配样本的均值：新样本按累计样本数加权并入，
+        与MiniBatchKMeans的逐样本学习率1/count等价，但计数跨运行保留。
+
+        Args:
+            vectors: 嵌入矩阵 (n, dim)
+        """
+        if self.centroids is None or len(vectors) == 0:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        labels = self.predict(vectors)
+        n_clusters, dim = self.centroids.shape
+        batch_counts = np.bincount(labels, minlength=n_clusters).astype(np.float64)
+        batch_sums = np.zeros((n_clusters, dim), dtype=np.float64)
+        np.add.at(batch_sums, labels, vectors)
+
+        counts = self.counts + batch_counts
+        touched = batch_counts > 0
+        centroids = self.centroids.astype(np.float64)
+        centroids[touched] = (
+            centroids[touched] * self.counts[touched, None] + batch_sums[touched]
+        ) / counts[touched, None]
+        self.centroids = centroids.astype(np.float32)
+        self.counts = counts
+
+    def _drifted(self, sample_count: int) -> bool:
+        """中心偏移或样本数增长是否超过阈值（需要重新分配全部照片）"""
+        shift = float(np.linalg.norm(self.centroids - self.reference_centroids, axis=1).max())
+        grown = sample_count >= self.growth_threshold * max(self.reference_count, 1)
+        return shift > self.drift_threshold or grown
+
+    async def _load_model(self, user_id: str) -> Optional[Dict[str, Any]]:
+        doc = await self.clusters_collection.find_one({"user_id": user_id})
+        if not doc or doc.get("features_version") != self.features_version:
+            return None
+        dim = doc["dim"]
+        doc["centroids"] = np.frombuffer(doc["centroids"], dtype=np.float32).reshape(-1, dim)
+        if doc.get("counts") is not None:
+            doc["counts"] = np.frombuffer(doc["counts"], dtype=np.float64).copy()
+        else:
+            # 早期模型未保存各聚类样本数，按总样本数平均分配
+            n_clusters = doc["centroids"].shape[0]
+            doc["counts"] = np.full(n_clusters, max(doc.get("sample_count", 0), 1) / n_clusters)
+        if doc.get("reference_centroids") is not None:
+            doc["reference_centroids"] = np.frombuffer(
+                doc["reference_centroids"], dtype=np.float32
+            ).reshape(-1, dim)
+        else:
+            # 早期模型以当前中心作为上次全量分配的参照
+            doc["reference_centroids"] = doc["centroids"]
+            doc["reference_count"] = doc.get("sample_count", 0)
+        return doc
+
+    async def _save_model(self, user_id: str, sample_count: int) -> None:
+        await self.clusters_collection.update_one(
+            {"user_id": user_id},
+            {"$set": {
+                "user_id": user_id,
+                "n_clusters": int(self.centroids.shape[0]),
+                "dim": int(self.centroids.shape[1]),
+                "centroids": Binary(np.ascontiguousarray(self.centroids, dtype=np.float32).tobytes()),
+                "counts": Binary(np.ascontiguousarray(self.counts, dtype=np.float64).tobytes()),
+                "reference_centroids": Binary(
+                    np.ascontiguousarray(self.reference_centroids, dtype=np.float32).tobytes()
+                ),
+                "reference_count": self.reference_count,
+                "sample_count": sample_count,
+                "features_version": self.features_version,
+                "updated_at": datetime.now(),
+            }},
+            upsert=True,
+        )
+
+    async def _assign(self, query: Dict[str, Any]) -> np.ndarray:
+        """
+        为符合条件的照片分配聚类并批量写回
+
+        Returns:
+            各聚类分配到的照片数
+        """
+        assigned = np.zeros(self.centroids.shape[0], dtype=np.float64)
+        async for ids, vectors in self._iter_chunks(query):
+            labels = await asyncio.to_thread(self.predict, vectors)
+            operations = [
+                UpdateOne({"_id": _id}, {"$set": {"scene_cluster": int(label)}})
+                for _id, label in zip(ids, labels)
+            ]
+            await self.collection.bulk_write(operations, ordered=False)
+            assigned += np.bincount(labels, minlength=len(assigned))
+        return assigned
+
+    async def update_user_clusters(self, user_id: str) -> Dict[str, Any]:
+        """
+        增量更新用户的场景聚类
+
+        已有模型且聚类数一致时，只用未分配的新照片按累计样本数加权更新中心并只分配新照片；
+        中心相对上次全量分配的偏移超过drift_threshold、或样本数增长到上次的growth_threshold倍时，
+        重新分配全部照片。没有可用模型时流式遍历全部嵌入重新训练，再分配全部照片。
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            聚类统计信息
+        """
+        base_query = {"user_id": user_id, "features.visual_features": {"$ne": None}}
+        total = await self.collection.count_documents(base_query)
+        n_clusters = min(self.n_clusters, total)
+        if n_clusters < 2:
+            self.centroids = None
+            return {"scene_clusters": 0, "scene_cluster_assigned": 0}
+
+        model = await self._load_model(user_id)
+        incremental = model is not None and model["n_clusters"] == n_clusters
+
+        trained = 0
+        if incremental:
+            query = {**base_query, "scene_cluster": {"$exists": False}}
+            self.centroids = model["centroids"]
+            self.counts = model["counts"]
+            self.reference_centroids = model["reference_centroids"]
+            self.reference_count = model.get("reference_count", 0)
+            async for _, vectors in self._iter_chunks(query):
+                await asyncio.to_thread(self.partial_update, vectors)
+                trained += len(vectors)
+            sample_count = model.get("sample_count", 0) + trained
+            if self._drifted(sample_count):
+                logger.info(f"用户 {user_id} 场景聚类中心偏移超过阈值，重新分配全部照片")
+                assigned = await self._assign(base_query)
+                self.reference_centroids = self.centroids
+                self.reference_count = sample_count
+            else:
+                assigned = await self._assign(query)
+        else:
+            query = base_query
+            kmeans = MiniBatchKMeans(n_clusters=n_clusters, n_init=3, random_state=42)
+            async for _, vectors in self._iter_chunks(query):
+                # 首次partial_fit要求样本数不少于聚类数，不足时不训练
+                if not hasattr(kmeans, "cluster_centers_") and len(vectors) < n_clusters:
+                    continue
+                await asyncio.to_thread(kmeans.partial_fit, vectors)
+                trained += len(vectors)
+            if not hasattr(kmeans, "cluster_centers_"):
+                self.centroids = None
+                return {"scene_clusters": 0, "scene_cluster_assigned": 0}
+            self.centroids = kmeans.cluster_centers_.astype(np.float32)
+            sample_count = trained
+            assigned = await self._assign(base_query)
+            # 全量重新分配后，各聚类的样本数即为其分配到的照片数
+            self.counts = assigned
+            self.reference_centroids = self.centroids
+            self.reference_count = sample_count
+
+        await self._save_model(user_id, sample_count)
+        assigned = int(assigned.sum())
+
+        logger.info(
+            f"用户 {user_id} 场景聚类完成: {n_clusters} 类, "
+            f"{'增量' if incremental else '全量'}训练 {trained} 条, 分配 {assigned} 张"
+        )
+        return {
+            "scene_clusters": n_clusters,
+            "scene_cluster_trained": trained,
+            "scene_cluster_assigned": assigned,
+            "scene_cluster_incremental": incremental,
+        }
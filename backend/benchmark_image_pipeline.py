@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+图片处理流水线基准测试
+
+使用合成照片语料测量各处理阶段的耗时与结果差异
+
+用法:
+    python benchmark_image_pipeline.py scoring --count 20
+    python benchmark_image_pipeline.py decodes --count 20
+    python benchmark_image_pipeline.py compress --count 40 --workers 1 2 4
+    python benchmark_image_pipeline.py encode --count 20
+    python benchmark_image_pipeline.py resize --count 20
+    python benchmark_image_pipeline.py renditions --count 20
+    python benchmark_image_pipeline.py autocrop --count 20
+    python benchmark_image_pipeline.py exif --count 20 --files 10000
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import sys
+import time
+from typing import List
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath('.'))
+
+
+def make_synthetic_corpus(count: int, width: int = 4032, height: int = 3024, seed: int = 0) -> List[bytes]:
+    """
+    生成合成照片语料（渐变背景 + 随机色块 + 噪声 + 轻微模糊），以JPEG编码
+
+    Args:
+        count: 图片数量
+        width: 宽度（默认12MP）
+        height: 高度
+        seed: 随机种子
+
+    Returns:
+        JPEG字节列表
+    """
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for _ in range(count):
+        x = np.linspace(0, 1, width, dtype=np.float32)
+        y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+        base = rng.uniform(0, 255, 3)
+        tilt = rng.uniform(-120, 120, 3)
+        pixels = np.empty((height, width, 3), dtype=np.float32)
+        for c in range(3):
+            pixels[:, :, c] = base[c] + tilt[c] * (x * rng.uniform(0, 1) + y * rng.uniform(0, 1))
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+        draw = ImageDraw.Draw(image)
+        for _ in range(int(rng.integers(20, 80))):
+            x0, y0 = rng.integers(0, width), rng.integers(0, height)
+            x1, y1 = x0 + rng.integers(50, width // 3), y0 + rng.integers(50, height // 3)
+            color = tuple(int(v) for v in rng.integers(0, 255, 3))
+            if rng.random() < 0.5:
+                draw.ellipse((x0, y0, x1, y1), fill=color)
+            else:
+                draw.rectangle((x0, y0, x1, y1), fill=color)
+
+        image = image.filter(ImageFilter.GaussianBlur(radius=float(rng.uniform(0.5, 3.0))))
+        noise = rng.normal(0, rng.uniform(2, 10), (height, width, 3))
+        image = Image.fromarray(np.clip(np.asarray(image) + noise, 0, 255).astype(np.uint8))
+
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        corpus.append(buffer.getvalue())
+    return corpus
+
+
+async def _legacy_scores(extractor, image_data: bytes):
+    """原实现：全分辨率解码后分别计算灰度图"""
+    import cv2
+    from skimage.feature import graycomatrix, graycoprops
+
+    image = Image.open(io.BytesIO(image_data))
+    cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+
+    gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
+    contrast = gray.std() / 255.0 if gray.std() > 0 else 0
+    sharpness = min(cv2.Laplacian(gray, cv2.CV_64F).var() / 1000.0, 1.0)
+    saturation = cv2.cvtColor(cv_image, cv2.COLOR_BGR2HSV)[:, :, 1].mean() / 255.0
+    aesthetic = float(max(0, min(1, contrast * 0.3 + sharpness * 0.4 + saturation * 0.3)))
+
+    gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, 100, 200)
+    edge_density = edges.sum() / (cv_image.shape[0] * cv_image.shape[1]) / 255.0
+    small_gray = cv2.resize(gray, (100, 100))
+    glcm = graycomatrix(small_gray, distances=[1], angles=[0], levels=256, symmetric=True, normed=True)
+    texture = min(graycoprops(glcm, 'contrast')[0, 0] / 1000.0, 1.0) * 0.5 + graycoprops(glcm, 'homogeneity')[0, 0] * 0.5
+    information = float(max(0, min(1, edge_density * 0.5 + texture * 0.5)))
+    return aesthetic, information
+
+
+async def _reduced_scores(extractor, image_data: bytes):
+    """新实现：缩小解码 + 共享灰度图 + 向量化GLCM"""
+    import cv2
+
+    from app.services.decoded_image import DecodedImage
+
+    image = DecodedImage(image_data).scaled(extractor.SCORING_MAX_SIZE)
+    cv_image = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2BGR)
+    gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
+    aesthetic = extractor._calculate_aesthetic_score(cv_image, gray)
+    information = extractor._calculate_information_score(cv_image, gray)
+    return aesthetic, information
+
+
+async def bench_scoring(corpus: List[bytes]):
+    """对比全分辨率与缩小解码两种质量评分路径的耗时与分数偏差"""
+    from app.services.image_features import ImageFeaturesExtractor
+
+    # 质量评分不依赖CLIP，跳过模型加载
+    extractor = ImageFeaturesExtractor.__new__(ImageFeaturesExtractor)
+
+    results = {}
+    for name, fn in (("legacy", _legacy_scores), ("reduced", _reduced_scores)):
+        start = time.perf_counter()
+        results[name] = [await fn(extractor, data) for data in corpus]
+        elapsed = time.perf_counter() - start
+        print(f"{name:8s}: {elapsed / len(corpus) * 1000:8.1f} ms/张")
+
+    legacy = np.array(results["legacy"])
+    reduced = np.array(results["reduced"])
+    drift = reduced - legacy
+    for i, label in enumerate(("aesthetic", "information")):
+        print(
+            f"{label:12s} 偏差: 均值 {drift[:, i].mean():+.4f}, "
+            f"最大绝对值 {np.abs(drift[:, i]).max():.4f}"
+        )
+
+
+async def bench_decodes(corpus: List[bytes]):
+    """统计特征提取 + 压缩共享解码句柄时每张照片的解码次数"""
+    from app.services.decoded_image import DecodedImage, decode_stats
+    from app.services.image_compressor import ImageCompressor
+    from app.services.image_features import ImageFeaturesExtractor
+
+    # 跳过CLIP模型加载，只运行解码与质量评分
+    extractor = ImageFeaturesExtractor.__new__(ImageFeaturesExtractor)
+    extractor.clip_model = None
+    extractor._text_features = None
+    compressor = ImageCompressor()
+
+    before = decode_stats["decodes"]
+    start = time.perf_counter()
+    for data in corpus:
+        handle = DecodedImage(data)
+        await extractor.extract_features(handle)
+        handle.thumbnail()
+        await compressor.compress(handle)
+        handle.release()
+    elapsed = time.perf_counter() - start
+    decodes = decode_stats["decodes"] - before
+    print(f"解码次数: {decodes / len(corpus):.2f} 次/张, 耗时 {elapsed / len(corpus) * 1000:.1f} ms/张")
+
+
+async def bench_compress(corpus: List[bytes], worker_counts: List[int]):
+    """批量压缩吞吐量随工作进程数的变化"""
+    from app.services.image_compressor import ImageCompressor
+
+    compressor = ImageCompressor()
+    baseline = None
+    for workers in worker_counts:
+        start = time.perf_counter()
+        results = await compressor.batch_compress(corpus, max_workers=workers)
+        elapsed = time.perf_counter() - start
+        failed = sum(1 for r in results if r.get("error"))
+        throughput = len(corpus) / elapsed
+        baseline = baseline or throughput
+        print(
+            f"{workers:2d} 进程: {throughput:6.2f} 张/秒, "
+            f"加速比 {throughput / baseline:4.2f}x, 失败 {failed} 张"
+        )
+
+
+async def bench_encode(corpus: List[bytes]):
+    """固定质量与目标大小/目标SSIM模式的平均字节数、编码耗时与SSIM"""
+    from app.services.decoded_image import DecodedImage
+    from app.services.image_compressor import ImageCompressor, _ssim
+
+    async def run(options):
+        compressor = ImageCompressor()
+        ssims, qualities = [], []
+        for data in corpus:
+            handle = DecodedImage(data)
+            result = await compressor.compress(handle, {"target_bytes": None, "target_ssim": None, **options})
+            reference = handle.base().convert("L").resize((result["width"], result["height"]))
+            decoded = Image.open(io.BytesIO(result["compressed_data"])).convert("L")
+            ssims.append(_ssim(np.asarray(reference), np.asarray(decoded)))
+            qualities.append(result["quality"])
+            handle.release()
+        return compressor.stats, qualities, ssims
+
+    fixed = await run({})
+    # 字节目标取固定质量平均大小的60%，与语料无关地体现目标模式的效果
+    target_bytes = int(fixed[0]["compressed_bytes"] / fixed[0]["encodes"] * 0.6)
+    modes = (
+        ("fixed q85", fixed),
+        (f"{target_bytes // 1024}KB", await run({"target_bytes": target_bytes})),
+        ("SSIM 0.95", await run({"target_ssim": 0.95})),
+    )
+    for name, (stats, qualities, ssims) in modes:
+        print(
+            f"{name:10s}: 平均 {stats['compressed_bytes'] / stats['encodes'] / 1024:7.1f} KB/张, "
+            f"编码 {stats['encode_time'] / stats['encodes'] * 1000:6.1f} ms/张, "
+            f"平均质量 {np.mean(qualities):5.1f}, SSIM {np.mean(ssims):.4f}"
+        )
+
+
+def _legacy_resize(image: Image.Image, max_width: int = 1920, max_height: int = 1080,
+                   min_width: int = 320, min_height: int = 240) -> Image.Image:
+    """原实现：总是LANCZOS缩放，小图会被放大"""
+    ratio = min(max_width / image.width, max_height / image.height)
+    new_width = max(int(image.width * ratio), min_width)
+    new_height = max(int(image.height * ratio), min_height)
+    return image.resize((new_width, new_height), Image.LANCZOS)
+
+
+async def bench_resize(corpus: List[bytes]):
+    """缩放阶段：原实现（全分辨率解码 + 总是缩放）与只缩小实现的CPU时间和输出质量"""
+    from app.services.decoded_image import DecodedImage
+    from app.services.image_compressor import ImageCompressor, _ssim
+
+    compressor = ImageCompressor()
+    small = make_synthetic_corpus(max(1, len(corpus) // 2), 800, 600, seed=1)
+    boxes = [(1920, 1080), (1280, 720), (320, 320)]
+
+    for label, images in (("12MP", corpus), ("800x600", small)):
+        legacy_time = new_time = 0.0
+        ssims, upscaled, legacy_sizes, new_sizes = [], 0, set(), set()
+        for data in images:
+            start = time.process_time()
+            legacy = _legacy_resize(Image.open(io.BytesIO(data)).convert("RGB"))
+            legacy_time += time.process_time() - start
+
+            start = time.process_time()
+            handle = DecodedImage(data)
+            resized = compressor._intelligent_resize(handle.base(), 1920, 1080, 320, 240, True)
+            new_time += time.process_time() - start
+
+            legacy_sizes.add(legacy.size)
+            new_sizes.add(resized.size)
+            upscaled += legacy.width > handle.original_size[0]
+            # 参考图：全分辨率解码后直接LANCZOS缩放到相同尺寸
+            reference = Image.open(io.BytesIO(data)).convert("RGB")
+            if reference.size != resized.size:
+                reference = reference.resize(resized.size, Image.LANCZOS)
+            ssims.append(_ssim(np.asarray(reference.convert("L")), np.asarray(resized.convert("L"))))
+            handle.release()
+
+        count = len(images)
+        print(
+            f"{label:8s}: 原实现 {legacy_time / count * 1000:7.1f} ms/张 {sorted(legacy_sizes)} (放大 {upscaled} 张), "
+            f"只缩小 {new_time / count * 1000:7.1f} ms/张 {sorted(new_sizes)}, 与参考SSIM {np.mean(ssims):.4f}"
+        )
+
+    # 多尺寸：分别从基础图缩放 vs 级联一次生成
+    bases = [DecodedImage(data).base() for data in corpus]
+    start = time.process_time()
+    for base in bases:
+        for box in boxes:
+            compressor._intelligent_resize(base, box[0], box[1], 1, 1, True)
+    separate = time.process_time() - start
+    start = time.process_time()
+    for base in bases:
+        compressor.resize_to_boxes(base, boxes)
+    cascaded = time.process_time() - start
+    print(
+        f"多尺寸 {boxes}: 分别缩放 {separate / len(bases) * 1000:.1f} ms/张, "
+        f"级联 {cascaded / len(bases) * 1000:.1f} ms/张"
+    )
+
+
+async def bench_renditions(corpus: List[bytes]):
+    """一次解码生成全部衍生图：每张照片的解码次数、耗时与各尺寸平均字节数"""
+    from app.services.decoded_image import DecodedImage, decode_stats
+    from app.services.image_compressor import ImageCompressor
+
+    compressor = ImageCompressor()
+    sizes = {}
+    before = decode_stats["decodes"]
+    start = time.perf_counter()
+    for data in corpus:
+        handle = DecodedImage(data)
+        result = await compressor.compress_renditions(handle)
+        for name, rendition in result["renditions"].items():
+            sizes.setdefault(name, []).append(rendition["size"])
+        handle.release()
+    elapsed = time.perf_counter() - start
+    decodes = decode_stats["decodes"] - before
+    print(f"解码次数: {decodes / len(corpus):.2f} 次/张, 耗时 {elapsed / len(corpus) * 1000:.1f} ms/张")
+    for name, values in sizes.items():
+        print(f"{name:8s}: 平均 {np.mean(values) / 1024:7.1f} KB/张")
+
+
+def _legacy_crop_box(image: Image.Image):
+    """原实现：全图阈值化 + 轮廓搜索"""
+    import cv2
+
+    gray = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2GRAY)
+    _, thresh = cv2.threshold(gray, 240, 255, cv2.THRESH_BINARY_INV)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if contours:
+        x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+        if w > image.width * 0.1 and h > image.height * 0.1:
+            return (x, y, x + w, y + h)
+    return None
+
+
+async def bench_autocrop(corpus: List[bytes]):
+    """自动裁剪：原轮廓搜索与投影检测的耗时（相对编码耗时）和裁剪框误差"""
+    from app.services.decoded_image import DecodedImage
+    from app.services.image_compressor import ImageCompressor
+
+    compressor = ImageCompressor()
+    rng = np.random.default_rng(2)
+    samples = []
+    for i, data in enumerate(corpus):
+        image = DecodedImage(data).base().convert("RGB")
+        truth = (0, 0, image.width, image.height)
+        # 一半照片加白色或黑色边框
+        if i % 2 == 0:
+            pad = [int(v) for v in rng.integers(20, 120, 4)]
+            color = (255, 255, 255) if i % 4 == 0 else (0, 0, 0)
+            framed = Image.new("RGB", (image.width + pad[0] + pad[2], image.height + pad[1] + pad[3]), color)
+            framed.paste(image, (pad[0], pad[1]))
+            truth = (pad[0], pad[1], pad[0] + image.width, pad[1] + image.height)
+            image = framed
+        samples.append((image, truth))
+
+    def box_error(box, truth, size):
+        box = box or (0, 0, size[0], size[1])
+        return max(abs(a - b) for a, b in zip(box, truth))
+
+    for name, detect in (("contours", _legacy_crop_box), ("profiles", compressor._detect_borders)):
+        start = time.perf_counter()
+        boxes = [detect(image) for image, _ in samples]
+        elapsed = time.perf_counter() - start
+        errors = [box_error(box, truth, image.size) for box, (image, truth) in zip(boxes, samples)]
+        misses = sum(1 for e in errors if e > 10)
+        print(
+            f"{name:9s}: {elapsed / len(samples) * 1000:6.2f} ms/张, "
+            f"最大边误差 {max(errors)} px, 误差>10px {misses} 张"
+        )
+
+    start = time.perf_counter()
+    for image, _ in samples:
+        compressor._convert_format(image, "webp", 85)
+    print(f"WebP编码 : {(time.perf_counter() - start) / len(samples) * 1000:6.2f} ms/张")
+
+
+def _legacy_exif(path: str):
+    """原实现：时间与GPS各打开一次文件，并通过_getexif()解析完整EXIF"""
+    with Image.open(path) as img:
+        exif = img._getexif() or {}
+        date_str = exif.get(36867) or exif.get(306)
+    with Image.open(path) as img:
+        exif = img._getexif() or {}
+        gps = exif.get(34853)
+    return date_str, gps
+
+
+async def bench_exif(corpus: List[bytes], file_count: int):
+    """对比原实现（两次打开 + _getexif）与头部解析的EXIF提取吞吐量"""
+    import shutil
+    import tempfile
+    from fractions import Fraction
+
+    from app.services.exif_extractor import read_exif_header
+
+    exif = Image.Exif()
+    exif[0x010F] = "Apple"
+    exif[0x0110] = "iPhone 15 Pro"
+    exif[0x0112] = 6
+    exif.get_ifd(0x8769)[36867] = "2023:12:25 14:30:00"
+    gps = exif.get_ifd(0x8825)
+    gps[1], gps[2] = "N", (31.0, 14.0, Fraction(3051, 100))
+    gps[3], gps[4] = "E", (121.0, 28.0, Fraction(1234, 100))
+    payload = exif.tobytes()
+    app1 = b"\xff\xe1" + (len(payload) + 2).to_bytes(2, "big") + payload
+
+    # 少量真实大小的源文件，通过硬链接扩展到目标文件数（只测量解析开销，不含冷缓存磁盘读取）
+    work_dir = tempfile.mkdtemp(prefix="exif_bench_")
+    try:
+        sources = []
+        for i, data in enumerate(corpus):
+            path = os.path.join(work_dir, f"src_{i}.jpg")
+            with open(path, "wb") as f:
+                f.write(data[:2] + app1 + data[2:])
+            sources.append(path)
+        paths = []
+        for i in range(file_count):
+            path = os.path.join(work_dir, f"IMG_{i:05d}.jpg")
+            os.link(sources[i % len(sources)], path)
+            paths.append(path)
+
+        start = time.perf_counter()
+        for path in paths:
+            _legacy_exif(path)
+        legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for path in paths:
+            read_exif_header(path)
+        header = time.perf_counter() - start
+
+        print(f"文件数: {file_count}")
+        print(f"原实现  : {legacy:6.2f} 秒, {file_count / legacy:8.0f} 张/秒")
+        print(f"头部解析: {header:6.2f} 秒, {file_count / header:8.0f} 张/秒 (x{legacy / header:.1f})")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='图片处理流水线基准测试')
+    parser.add_argument('stage', choices=['scoring', 'decodes', 'compress', 'encode', 'resize', 'renditions', 'autocrop', 'exif'], help='测试阶段')
+    parser.add_argument('--count', type=int, default=20, help='合成图片数量')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1], help='压缩进程数')
+    parser.add_argument('--files', type=int, default=10000, help='EXIF测试文件数')
+    args = parser.parse_args()
+
+    print(f"生成 {args.count} 张合成照片...")
+    corpus = make_synthetic_corpus(args.count)
+
+    if args.stage == 'scoring':
+        asyncio.run(bench_scoring(corpus))
+    elif args.stage == 'decodes':
+        asyncio.run(bench_decodes(corpus))
+    elif args.stage == 'compress':
+        asyncio.run(bench_compress(corpus, args.workers))
+    elif args.stage == 'encode':
+        asyncio.run(bench_encode(corpus))
+    elif args.stage == 'resize':
+        asyncio.run(bench_resize(corpus))
+    elif args.stage == 'renditions':
+        asyncio.run(bench_renditions(corpus))
+    elif args.stage == 'autocrop':
+        asyncio.run(bench_autocrop(corpus))
+    elif args.stage == 'exif':
+        asyncio.run(bench_exif(corpus, args.files))
+
+
+if __name__ == "__main__":
+    main()
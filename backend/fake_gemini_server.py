@@ -0,0 +1,740 @@
+#!/usr/bin/env python3
+"""
+本地模拟Gemini服务，用于测试调度器在限流下的表现
+
+模拟 POST /v1beta/models/<模型>:generateContent：
+- 超过每分钟请求数（滑动窗口）返回429 RESOURCE_EXHAUSTED
+- 同时处理的请求超过并发容量返回503 UNAVAILABLE
+- 正常请求按设定延迟（带抖动）返回固定文本与usageMetadata
+
+流式接口 :streamGenerateContent 按SSE分段返回（STREAM_CHUNKS段，均分延迟），
+最后一段带usageMetadata。
+
+同时模拟上下文缓存 POST /v1beta/cachedContents：内容低于最小token数返回400，
+generateContent引用cachedContent时，缓存内容计入promptTokenCount并在
+cachedContentTokenCount中单独返回（与真实API一致）。
+
+批处理（Batch API）：Files API可续传上传JSONL、:batchGenerateContent创建任务、
+GET batches/<ID>查询状态（创建后batch_delay秒内为RUNNING，之后SUCCEEDED并
+生成结果文件）、下载结果文件；前batch_errors行返回错误，用于测试回退。
+
+上传的图片可在请求中以fileData引用（引用不存在的文件返回403）；
+request_bytes统计生成请求的请求体字节数。
+
+generationConfig要求JSON输出（responseMimeType为application/json）时，
+按请求中的图片数返回符合Phase 1结构的JSON（实时、流式与批处理均如此）。
+
+用法:
+    python fake_gemini_server.py serve --rpm 120 --capacity 4 --latency 0.5
+    python fake_gemini_server.py bench --requests 200 --concurrency 32
+    python fake_gemini_server.py cache --requests 20 --prefix-chars 4000
+    python fake_gemini_server.py batch --requests 20 --batch-delay 2
+    python fake_gemini_server.py files --requests 10 --images 40
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath('.'))
+
+
+# 流式返回的分段数
+STREAM_CHUNKS = 5
+
+
+class FakeGeminiState:
+    """服务端限流状态（线程共享）"""
+
+    def __init__(self, rpm: int, capacity: int, latency: float, min_cache_tokens: int = 1024):
+        self.rpm = rpm
+        self.capacity = capacity
+        self.latency = latency
+        self.min_cache_tokens = min_cache_tokens
+        self.window = deque()
+        self.active = 0
+        self.counts = {"ok": 0, "429": 0, "503": 0}
+        # 缓存名称 -> (token数, 过期时间)
+        self.caches = {}
+        # 批处理：上传ID -> 显示名称，文件名 -> 内容，任务名 -> 任务
+        self.uploads = {}
+        self.files = {}
+        self.batches = {}
+        self.batch_delay = 2.0
+        self.batch_errors = 0
+        self.request_bytes = 0
+        self.lock = threading.Lock()
+
+    def admit(self) -> int:
+        """判断是否接受请求，返回HTTP状态码"""
+        now = time.monotonic()
+        with self.lock:
+            while self.window and now - self.window[0] > 60:
+                self.window.popleft()
+            if len(self.window) >= self.rpm:
+                self.counts["429"] += 1
+                return 429
+            self.window.append(now)
+            if self.active >= self.capacity:
+                self.counts["503"] += 1
+                return 503
+            self.active += 1
+            return 200
+
+    def finish(self) -> None:
+        with self.lock:
+            self.active -= 1
+            self.counts["ok"] += 1
+
+    def create_cache(self, tokens: int, ttl: float) -> str:
+        with self.lock:
+            name = f"cachedContents/fake-{len(self.caches) + 1}"
+            self.caches[name] = (tokens, time.time() + ttl)
+            return name
+
+    def cached_tokens(self, name: str):
+        """缓存的token数，不存在或已过期时返回None"""
+        with self.lock:
+            entry = self.caches.get(name)
+            if entry is None or entry[1] < time.time():
+                return None
+            return entry[0]
+
+    def start_upload(self, display_name: str) -> str:
+        with self.lock:
+            upload_id = str(len(self.uploads) + 1)
+            self.uploads[upload_id] = display_name
+            return upload_id
+
+    def store_file(self, data: bytes) -> str:
+        with self.lock:
+            name = f"files/fake-{len(self.files) + 1}"
+            self.files[name] = data
+            return name
+
+    def has_files(self, contents) -> bool:
+        """请求引用的文件是否都存在"""
+        for item in contents:
+            for part in item.get("parts", []):
+                file_data = part.get("fileData") or part.get("file_data")
+                if file_data and file_data.get("fileUri", file_data.get("file_uri", "")).split("/v1beta/")[-1] not in self.files:
+                    return False
+        return True
+
+    def create_batch(self, model: str, file_name: str) -> str:
+        with self.lock:
+            name = f"batches/fake-{len(self.batches) + 1}"
+            self.batches[name] = {"model": model, "file": file_name, "created": time.monotonic(), "output": None}
+            return name
+
+    def batch_operation(self, name: str):
+        """任务状态（Operation格式），到期后生成结果文件；任务不存在时返回None"""
+        with self.lock:
+            batch = self.batches.get(name)
+        if batch is None:
+            return None
+        metadata = {"@type": "type.googleapis.com/google.ai.generativelanguage.v1main.GenerateContentBatch",
+                    "name": name, "model": batch["model"], "state": "BATCH_STATE_RUNNING"}
+        if time.monotonic() - batch["created"] < self.batch_delay:
+            return {"name": name, "metadata": metadata}
+        if batch["output"] is None:
+            batch["output"] = self.store_file(self._batch_output(self.files[batch["file"]]))
+        metadata.update(state="BATCH_STATE_SUCCEEDED", output={"responsesFile": batch["output"]})
+        return {"name": name, "metadata": metadata, "done": True,
+                "response": {"@type": metadata["@type"], "responsesFile": batch["output"]}}
+
+    def _batch_output(self, data: bytes) -> bytes:
+        lines = []
+        for index, raw in enumerate(data.decode("utf-8").splitlines()):
+            line = json.loads(raw)
+            if index < self.batch_errors:
+                lines.append({"key": line["key"], "error": {"code": 500, "message": "Internal error"}})
+                continue
+            contents = line["request"].get("contents", [])
+            prompt_tokens = _text_tokens(contents)
+            text = _fake_structured(contents) if _json_requested(line["request"]) else "模拟批处理分析结果"
+            lines.append({"key": line["key"], "response": {
+                "candidates": [{"content": {"parts": [{"text": text}], "role": "model"},
+                                "finishReason": "STOP"}],
+                "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": 200,
+                                  "totalTokenCount": prompt_tokens + 200},
+            }})
+        return "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode("utf-8")
+
+
+def _json_requested(request: dict) -> bool:
+    config = request.get("generationConfig") or request.get("generation_config") or {}
+    return (config.get("responseMimeType") or config.get("response_mime_type")) == "application/json"
+
+
+def _fake_structured(contents) -> str:
+    """按图片数构造Phase 1结构的JSON输出"""
+    images = sum(1 for item in contents for part in item.get("parts", []) if "text" not in part)
+    photos = [{
+        "index": index + 1,
+        "scene": random.choice(["咖啡厅", "家中", "公园", "餐厅"]),
+        "location": "",
+        "people": ["【主角】"] + (["女性A"] if index % 3 == 0 else []),
+        "objects": ["手机", "咖啡"][: 1 + index % 2],
+        "activity": random.choice(["聚餐", "散步", "工作"]),
+        "mood": "轻松",
+        "protagonist_present": index % 4 != 3,
+    } for index in range(images)]
+    return json.dumps({"batch_summary": "【主角】的日常生活", "protagonist": "", "photos": photos}, ensure_ascii=False)
+
+
+def _text_tokens(contents) -> int:
+    """文本按字符数、其他部分按1290计token"""
+    return sum(len(part.get("text", "")) or 1290 for item in contents for part in item.get("parts", []))
+
+
+def make_handler(state: FakeGeminiState):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: dict) -> None:
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _create_cache(self, request: dict) -> None:
+            tokens = _text_tokens(request.get("contents", []))
+            if tokens < state.min_cache_tokens:
+                self._send(400, {"error": {
+                    "code": 400, "status": "INVALID_ARGUMENT",
+                    "message": f"Cached content is too small. total_token_count={tokens}, "
+                               f"min_total_token_count={state.min_cache_tokens}",
+                }})
+                return
+            ttl = float(request.get("ttl", "3600s").rstrip("s"))
+            name = state.create_cache(tokens, ttl)
+            expire_time = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+            self._send(200, {
+                "name": name,
+                "model": request.get("model"),
+                "expireTime": expire_time.isoformat(),
+                "usageMetadata": {"totalTokenCount": tokens},
+            })
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path.startswith("/v1beta/batches/"):
+                operation = state.batch_operation(path[len("/v1beta/"):])
+                if operation is not None:
+                    self._send(200, operation)
+                    return
+            elif path.startswith("/v1beta/files/"):
+                name = path[len("/v1beta/"):]
+                if name in state.files:
+                    self._send(200, self._file_resource(name, state.files[name]))
+                    return
+            elif path.startswith("/download/v1beta/") and path.endswith(":download"):
+                data = state.files.get(path[len("/download/v1beta/"):-len(":download")])
+                if data is not None:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/jsonl")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+            self._send(404, {"error": {"code": 404, "status": "NOT_FOUND"}})
+
+        def _upload(self, body: bytes) -> None:
+            """Files API可续传上传：start返回上传地址，upload, finalize接收内容"""
+            command = self.headers.get("X-Goog-Upload-Command", "")
+            if command == "start":
+                display_name = json.loads(body or b"{}").get("file", {}).get("display_name", "")
+                upload_id = state.start_upload(display_name)
+                self.send_response(200)
+                self.send_header(
+                    "X-Goog-Upload-URL", f"http://{self.headers['Host']}/upload/v1beta/files?upload_id={upload_id}"
+                )
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            name = state.store_file(body)
+            self._send(200, {"file": self._file_resource(name, body)})
+
+        def _file_resource(self, name: str, data: bytes) -> dict:
+            expiration = datetime.now(timezone.utc) + timedelta(hours=48)
+            return {
+                "name": name,
+                "uri": f"http://{self.headers['Host']}/v1beta/{name}",
+                "sizeBytes": str(len(data)),
+                "expirationTime": expiration.isoformat().replace("+00:00", "Z"),
+                "state": "ACTIVE",
+            }
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            if self.path.startswith("/upload/v1beta/files"):
+                self._upload(body)
+                return
+            request = json.loads(body or b"{}")
+            if self.path.endswith("/cachedContents"):
+                self._create_cache(request)
+                return
+            path = self.path.split("?")[0]
+            if path.endswith(":batchGenerateContent"):
+                file_name = request.get("batch", {}).get("input_config", {}).get("file_name")
+                if file_name not in state.files:
+                    self._send(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT"}})
+                    return
+                name = state.create_batch(path[len("/v1beta/"):-len(":batchGenerateContent")], file_name)
+                self._send(200, state.batch_operation(name))
+                return
+            stream = path.endswith(":streamGenerateContent")
+            if not stream and not path.endswith(":generateContent"):
+                self._send(404, {"error": {"code": 404, "status": "NOT_FOUND"}})
+                return
+
+            with state.lock:
+                state.request_bytes += len(body)
+            if not state.has_files(request.get("contents", [])):
+                self._send(403, {"error": {"code": 403, "status": "PERMISSION_DENIED",
+                                           "message": "You do not have permission to access the File"}})
+                return
+
+            cached_tokens = 0
+            if request.get("cachedContent"):
+                cached_tokens = state.cached_tokens(request["cachedContent"])
+                if cached_tokens is None:
+                    self._send(403, {"error": {"code": 403, "status": "PERMISSION_DENIED"}})
+                    return
+
+            status = state.admit()
+            if status != 200:
+                name = "RESOURCE_EXHAUSTED" if status == 429 else "UNAVAILABLE"
+                self._send(status, {"error": {"code": status, "status": name}})
+                return
+
+            prompt_tokens = _text_tokens(request.get("contents", [])) + cached_tokens
+            usage = {
+                "promptTokenCount": prompt_tokens,
+                "cachedContentTokenCount": cached_tokens,
+                "candidatesTokenCount": 200,
+                "totalTokenCount": prompt_tokens + 200,
+            }
+            structured = _fake_structured(request.get("contents", [])) if _json_requested(request) else None
+            if stream:
+                self._stream(usage, structured)
+                return
+            try:
+                time.sleep(state.latency * random.uniform(0.8, 1.2))
+            finally:
+                state.finish()
+            self._send(200, {
+                "candidates": [{"content": {"parts": [{"text": structured or "模拟分析结果"}], "role": "model"}}],
+                "usageMetadata": usage,
+            })
+
+        def _stream(self, usage: dict, structured: str = None) -> None:
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                delay = state.latency * random.uniform(0.8, 1.2) / STREAM_CHUNKS
+                size = -(-len(structured) // STREAM_CHUNKS) if structured else 0
+                for index in range(STREAM_CHUNKS):
+                    time.sleep(delay)
+                    text = structured[index * size:(index + 1) * size] if structured else f"模拟分析结果第{index + 1}段。"
+                    chunk = {"candidates": [{"content": {
+                        "parts": [{"text": text}], "role": "model",
+                    }}]}
+                    if index == STREAM_CHUNKS - 1:
+                        chunk["usageMetadata"] = usage
+                    self.wfile.write(f"data: {json.dumps(chunk)}\r\n\r\n".encode("utf-8"))
+                    self.wfile.flush()
+            finally:
+                state.finish()
+
+    return Handler
+
+
+def start_server(rpm: int, capacity: int, latency: float, port: int = 0):
+    """在后台线程启动模拟服务，返回(server, state)"""
+    state = FakeGeminiState(rpm, capacity, latency)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+class FakeGeminiError(Exception):
+    """模拟服务返回的错误，code为HTTP状态码（与SDK异常一致）"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+def _open(url: str, body: dict, timeout: float = 60):
+    request = urllib.request.Request(
+        url, data=json.dumps(body).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    try:
+        return urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        raise FakeGeminiError(e.code, e.read().decode("utf-8", "ignore"))
+    except TimeoutError:
+        raise FakeGeminiError(504, "DEADLINE_EXCEEDED")
+
+
+def _post(url: str, body: dict, timeout: float = 60) -> dict:
+    with _open(url, body, timeout) as response:
+        try:
+            return json.loads(response.read())
+        except TimeoutError:
+            raise FakeGeminiError(504, "DEADLINE_EXCEEDED")
+
+
+def _to_response(text: str, usage: dict) -> SimpleNamespace:
+    """构造与SDK响应结构一致的对象"""
+    return SimpleNamespace(
+        text=text,
+        candidates=[SimpleNamespace(content=SimpleNamespace(parts=[SimpleNamespace(text=text)]))],
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=usage.get("promptTokenCount", 0),
+            cached_content_token_count=usage.get("cachedContentTokenCount", 0),
+            candidates_token_count=usage.get("candidatesTokenCount", 0),
+            total_token_count=usage.get("totalTokenCount", 0),
+        ),
+    )
+
+
+class FakeStreamResponse:
+    """流式响应：迭代得到各分段，迭代完毕后text与usage_metadata为汇总结果"""
+
+    def __init__(self, response):
+        self.response = response
+        self.text = ""
+        self.candidates = []
+        self.usage_metadata = None
+
+    def __iter__(self):
+        usage = {}
+        try:
+            with self.response:
+                for line in self.response:
+                    line = line.decode("utf-8").strip()
+                    if not line.startswith("data: "):
+                        continue
+                    data = json.loads(line[len("data: "):])
+                    piece = data["candidates"][0]["content"]["parts"][0]["text"]
+                    usage = data.get("usageMetadata", usage)
+                    self.text += piece
+                    yield _to_response(piece, usage)
+        except TimeoutError:
+            raise FakeGeminiError(504, "DEADLINE_EXCEEDED")
+        summary = _to_response(self.text, usage)
+        self.candidates = summary.candidates
+        self.usage_metadata = summary.usage_metadata
+
+
+def _to_parts(parts) -> list:
+    """文本与文件引用保持原样，内联数据按base64发送"""
+    from app.services.gemini_batch import to_request_part
+    return [to_request_part(part) for part in parts]
+
+
+class FakeCachedContent:
+    """与genai.caching.CachedContent接口一致的最小实现"""
+
+    def __init__(self, name: str, model: str, token_count: int):
+        self.name = name
+        self.model = model
+        self.usage_metadata = SimpleNamespace(total_token_count=token_count)
+
+    @classmethod
+    def create(cls, base_url: str, model: str, contents=None, system_instruction=None, ttl=None):
+        contents = [
+            {"role": item.get("role", "user"), "parts": _to_parts(item["parts"])}
+            if isinstance(item, dict) else {"role": "user", "parts": _to_parts([item])}
+            for item in contents or []
+        ]
+        if system_instruction:
+            contents.append({"role": "user", "parts": _to_parts([system_instruction])})
+        seconds = ttl.total_seconds() if ttl is not None else 3600
+        data = _post(f"{base_url}/v1beta/cachedContents", {
+            "model": model, "contents": contents, "ttl": f"{seconds:.0f}s",
+        })
+        return cls(data["name"], model, data["usageMetadata"]["totalTokenCount"])
+
+    def update(self, ttl=None):
+        """模拟服务不校验续期"""
+
+
+class FakeGeminiModel:
+    """与genai.GenerativeModel接口一致的最小客户端（图片按占位部分发送）"""
+
+    def __init__(self, base_url: str, model_name: str = "models/gemini-2.5-flash", cached_content: str = None):
+        self.url = f"{base_url}/v1beta/{model_name}:generateContent"
+        self.cached_content = cached_content
+
+    @classmethod
+    def from_cached_content(cls, base_url: str, cached_content: FakeCachedContent):
+        return cls(base_url, cached_content.model, cached_content.name)
+
+    def generate_content(self, content, stream=False, request_options=None, generation_config=None):
+        parts = content if isinstance(content, list) else [content]
+        body = {"contents": [{"parts": _to_parts(parts)}]}
+        if generation_config:
+            body["generationConfig"] = generation_config
+        if self.cached_content:
+            body["cachedContent"] = self.cached_content
+        timeout = (request_options or {}).get("timeout", 60)
+        if stream:
+            url = self.url.replace(":generateContent", ":streamGenerateContent?alt=sse")
+            return FakeStreamResponse(_open(url, body, timeout))
+        data = _post(self.url, body, timeout)
+        return _to_response(data["candidates"][0]["content"]["parts"][0]["text"], data["usageMetadata"])
+
+
+async def _run_naive(model: FakeGeminiModel, requests: int, concurrency: int):
+    """对照组：只有信号量，不限流、不重试（原实现）"""
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def one(i):
+        nonlocal failures
+        async with semaphore:
+            try:
+                await asyncio.to_thread(model.generate_content, f"批次 {i}")
+            except FakeGeminiError:
+                failures += 1
+
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    return failures
+
+
+async def _run_scheduled(model: FakeGeminiModel, requests: int, concurrency: int, rpm: int):
+    from app.services.gemini_scheduler import GeminiScheduler
+
+    scheduler = GeminiScheduler(
+        "models/gemini-2.5-flash", rpm=rpm, max_concurrency=concurrency, base_delay=0.2, max_delay=5.0
+    )
+    failures = 0
+
+    async def one(i):
+        nonlocal failures
+        try:
+            await scheduler.call(model.generate_content, f"批次 {i}")
+        except FakeGeminiError:
+            failures += 1
+
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    return failures, scheduler.snapshot()
+
+
+def bench(args):
+    for name in ("naive", "scheduled"):
+        server, state = start_server(args.rpm, args.capacity, args.latency)
+        model = FakeGeminiModel(f"http://127.0.0.1:{server.server_address[1]}")
+        start = time.perf_counter()
+        if name == "naive":
+            failures = asyncio.run(_run_naive(model, args.requests, args.concurrency))
+            metrics = None
+        else:
+            failures, metrics = asyncio.run(
+                _run_scheduled(model, args.requests, args.concurrency, args.client_rpm or args.rpm)
+            )
+        elapsed = time.perf_counter() - start
+        server.shutdown()
+
+        print(
+            f"{name:9s}: {elapsed:6.2f} 秒, 成功 {args.requests - failures}/{args.requests}, "
+            f"服务端 429={state.counts['429']} 503={state.counts['503']}"
+        )
+        if metrics:
+            print(
+                f"           调用 {metrics['calls']} 次, 重试 {metrics['retries']} 次, "
+                f"平均排队 {metrics['avg_queued_time']:.2f} 秒 (最长 {metrics['max_queued_time']:.2f}), "
+                f"平均调用 {metrics['avg_call_time']:.2f} 秒, 最终并发上限 {metrics['concurrency_limit']}"
+            )
+
+
+async def _run_context_cache(base_url: str, requests: int, concurrency: int, prefix: str, use_cache: bool):
+    """模拟Phase 1：各批次共用提示词前缀，返回(输入token, 上下文缓存token, 缓存统计)"""
+    from functools import partial
+    from app.services.gemini_context_cache import ContextCacheManager
+
+    manager = ContextCacheManager(
+        create_cache=partial(FakeCachedContent.create, base_url),
+        model_from_cache=partial(FakeGeminiModel.from_cached_content, base_url),
+    )
+    plain_model = FakeGeminiModel(base_url)
+    semaphore = asyncio.Semaphore(concurrency)
+    prompt_tokens = cached_tokens = 0
+
+    async def one(i):
+        nonlocal prompt_tokens, cached_tokens
+        async with semaphore:
+            model = await manager.get_model("models/gemini-2.5-flash", prefix) if use_cache else None
+            content = [f"批次 {i} 照片信息", {"mime_type": "image/webp", "data": b""}]
+            if model is None:
+                model, content = plain_model, [prefix] + content
+            response = await asyncio.to_thread(model.generate_content, content)
+        usage = response.usage_metadata
+        prompt_tokens += usage.prompt_token_count - usage.cached_content_token_count
+        cached_tokens += usage.cached_content_token_count
+
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    return prompt_tokens, cached_tokens, manager.stats
+
+
+def bench_context_cache(args):
+    prefix = "分析指令" * (args.prefix_chars // 4)
+    server, _ = start_server(args.rpm, args.capacity, args.latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    for use_cache in (False, True):
+        prompt_tokens, cached_tokens, stats = asyncio.run(
+            _run_context_cache(base_url, args.requests, args.capacity, prefix, use_cache)
+        )
+        name = "cached" if use_cache else "uncached"
+        print(
+            f"{name:9s}: 输入token {prompt_tokens}, 上下文缓存token {cached_tokens}, "
+            f"缓存创建 {stats['created']} 次, 复用 {stats['reused']} 次"
+        )
+    server.shutdown()
+
+
+def bench_batch(args):
+    """提交批处理任务；第一次轮询后模拟进程退出，再用保存的状态继续同一任务"""
+    from app.services.gemini_batch import GeminiBatchClient, GeminiBatchError, build_request, run_batch_job
+
+    server, state = start_server(args.rpm, args.capacity, args.latency)
+    state.batch_delay = args.batch_delay
+    state.batch_errors = args.batch_errors
+    client = GeminiBatchClient(api_key="fake", base_url=f"http://127.0.0.1:{server.server_address[1]}")
+    requests = {
+        f"batch-{i}": build_request([f"批次 {i} 照片信息", {"mime_type": "image/webp", "data": b"\x00" * 64}])
+        for i in range(args.requests)
+    }
+    saved = {}
+
+    async def save_state(job_state):
+        saved["state"] = job_state
+
+    try:
+        # 轮询超时即视为进程中途退出
+        asyncio.run(run_batch_job(
+            client, "models/gemini-2.5-flash", requests, None, save_state,
+            poll_interval=0.2, timeout=args.batch_delay / 4,
+        ))
+    except GeminiBatchError as e:
+        print(f"第一次运行中断: {e}")
+    print(f"已保存状态: {saved['state']['batch_name']} {saved['state']['state']}")
+
+    start = time.monotonic()
+    results = asyncio.run(run_batch_job(
+        client, "models/gemini-2.5-flash", requests, saved["state"], save_state, poll_interval=0.2,
+    ))
+    errors = sum(1 for result in results.values() if result["error"])
+    prompt_tokens = sum(result["usage"]["prompt"] for result in results.values() if result["usage"])
+    print(
+        f"继续后 {time.monotonic() - start:.1f} 秒取回 {len(results)}/{len(requests)} 个结果"
+        f"（错误 {errors}），输入token {prompt_tokens}，提交任务 {len(state.batches)} 次"
+    )
+    server.shutdown()
+
+
+def bench_files(args):
+    """对比内联图片与Files API引用的请求体大小（每个批次发送两次，模拟重试）"""
+    from app.services.gemini_batch import GeminiBatchClient
+    from app.services.gemini_files import GeminiFileStore
+
+    server, state = start_server(args.rpm, args.capacity, args.latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    model = FakeGeminiModel(base_url)
+    # 每张图约150KB（WebP文件头 + 随机内容）
+    batches = [
+        [b"RIFF\x00\x00\x00\x00WEBPVP8 " + os.urandom(150 * 1024) for _ in range(args.images)]
+        for _ in range(args.requests)
+    ]
+
+    async def run(store):
+        semaphore = asyncio.Semaphore(args.capacity)
+
+        async def one(i, images):
+            parts = await store.image_parts(images) if store else [
+                {"mime_type": "image/webp", "data": data} for data in images
+            ]
+            for _ in range(2):
+                async with semaphore:
+                    await asyncio.to_thread(model.generate_content, [f"批次 {i} 照片信息"] + parts)
+
+        await asyncio.gather(*[one(i, images) for i, images in enumerate(batches)])
+
+    for name, store in (
+        ("inline", None),
+        ("files", GeminiFileStore(GeminiBatchClient(api_key="fake", base_url=base_url), inline_max_bytes=0)),
+    ):
+        state.request_bytes = 0
+        start = time.monotonic()
+        asyncio.run(run(store))
+        stats = f"，上传 {store.stats['uploaded']} 张（{store.stats['uploaded_bytes'] / 1e6:.1f} MB）" if store else ""
+        print(
+            f"{name:6s}: {args.requests * 2} 次请求，请求体共 {state.request_bytes / 1e6:.1f} MB，"
+            f"平均 {state.request_bytes / (args.requests * 2) / 1e3:.1f} KB{stats}，"
+            f"耗时 {time.monotonic() - start:.1f} 秒"
+        )
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟Gemini服务')
+    parser.add_argument('mode', choices=['serve', 'bench', 'cache', 'batch', 'files'],
+                        help='serve: 启动服务；bench: 对比限流前后的饱和表现；cache: 对比上下文缓存前后的输入token；'
+                             'batch: 提交批处理任务并模拟重启后继续；files: 对比内联图片与文件引用的请求体大小')
+    parser.add_argument('--port', type=int, default=8765, help='serve模式端口')
+    parser.add_argument('--rpm', type=int, default=120, help='服务端每分钟请求上限')
+    parser.add_argument('--capacity', type=int, default=4, help='服务端并发容量，超出返回503')
+    parser.add_argument('--latency', type=float, default=0.3, help='单次请求延迟（秒）')
+    parser.add_argument('--requests', type=int, default=100, help='bench模式请求数')
+    parser.add_argument('--concurrency', type=int, default=16, help='bench模式客户端并发')
+    parser.add_argument('--client-rpm', type=int, default=None, help='调度器RPM（默认与服务端一致）')
+    parser.add_argument('--prefix-chars', type=int, default=4000, help='cache模式共用提示词前缀的字符数')
+    parser.add_argument('--images', type=int, default=40, help='files模式每个批次的图片数')
+    parser.add_argument('--batch-delay', type=float, default=2.0, help='批处理任务完成所需时间（秒）')
+    parser.add_argument('--batch-errors', type=int, default=0, help='批处理结果中返回错误的行数')
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        server, state = start_server(args.rpm, args.capacity, args.latency, args.port)
+        state.batch_delay = args.batch_delay
+        state.batch_errors = args.batch_errors
+        print(f"模拟Gemini服务已启动: http://127.0.0.1:{args.port}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+    elif args.mode == 'cache':
+        bench_context_cache(args)
+    elif args.mode == 'batch':
+        bench_batch(args)
+    elif args.mode == 'files':
+        bench_files(args)
+    else:
+        bench(args)
+
+
+if __name__ == "__main__":
+    main()
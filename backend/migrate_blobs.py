@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+将photos文档中内嵌的图片数据迁移到图片存储
+
+处理两类旧记录：
+- compressed_image_data：单一压缩图，迁移为默认衍生图
+- renditions.<名称>.data：内嵌的衍生图数据
+
+用法:
+    python migrate_blobs.py            # 使用环境变量BLOB_STORE指定的后端
+    python migrate_blobs.py --dry-run  # 只统计需要迁移的记录
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath('.'))
+
+from app.config.database import photos_collection
+from app.services.blob_store import get_blob_store, store_renditions
+from app.services.image_compressor import DEFAULT_RENDITION, RENDITIONS
+
+
+async def migrate(dry_run: bool = False, batch_size: int = 50):
+    store = get_blob_store()
+    query = {"$or": [
+        {"compressed_image_data": {"$exists": True}},
+        *({f"renditions.{name}.data": {"$exists": True}} for name in RENDITIONS),
+    ]}
+    total = await photos_collection.count_documents(query)
+    print(f"需要迁移的照片: {total} 张 (存储后端: {store.name})")
+    if dry_run or total == 0:
+        return
+
+    migrated = 0
+    moved_bytes = 0
+    cursor = photos_collection.find(
+        query, {"renditions": 1, "compressed_image_data": 1, "compressed_info": 1}
+    ).batch_size(batch_size)
+    async for doc in cursor:
+        renditions = doc.get("renditions") or {}
+        legacy = doc.get("compressed_image_data")
+        if legacy and DEFAULT_RENDITION not in renditions:
+            info = doc.get("compressed_info") or {}
+            renditions[DEFAULT_RENDITION] = {
+                "data": legacy,
+                "size": len(legacy),
+                "width": info.get("width", 0),
+                "height": info.get("height", 0),
+                "format": info.get("format", "webp"),
+            }
+        moved_bytes += sum(len(r.get("data") or b"") for r in renditions.values())
+
+        stored = await store_renditions(renditions, store)
+        await photos_collection.update_one(
+            {"_id": doc["_id"]},
+            {
+                "$set": {"renditions": stored},
+                "$unset": {"compressed_image_data": "", "compressed_info.compressed_data": ""},
+            }
+        )
+        migrated += 1
+        if migrated % 100 == 0:
+            print(f"已迁移 {migrated}/{total} 张")
+
+    print(f"迁移完成: {migrated} 张, {moved_bytes / 1024 / 1024:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='迁移内嵌图片数据到图片存储')
+    parser.add_argument('--dry-run', action='store_true', help='只统计不迁移')
+    args = parser.parse_args()
+    asyncio.run(migrate(dry_run=args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
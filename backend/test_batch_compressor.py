@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+测试批量压缩引擎在工作进程崩溃、卡住时的处理（batch_compressor）
+"""
+
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath('.'))
+
+from app.services import batch_compressor
+from app.services.batch_compressor import BatchCompressionEngine
+
+
+def _fake_compress(image_data: bytes, options):
+    """替代真实压缩：crash使工作进程直接退出，hang卡住，其余立即返回"""
+    if image_data == b"crash":
+        os._exit(1)
+    if image_data == b"hang":
+        time.sleep(60)
+    time.sleep(0.05)
+    return {"compressed_data": image_data, "error": None}
+
+
+async def _stream(images, **kwargs):
+    engine = BatchCompressionEngine(mp_context=multiprocessing.get_context("fork"), **kwargs)
+    try:
+        results = {index: result async for index, result in engine.stream(images)}
+    finally:
+        engine.shutdown()
+    return results, engine.stats
+
+
+def _run(images, **kwargs):
+    # 工作进程以fork启动才能继承替换后的压缩函数
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("需要fork启动方式")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(batch_compressor, "_compress_in_worker", _fake_compress)
+        return asyncio.run(_stream(images, **kwargs))
+
+
+def test_worker_crash():
+    """工作进程崩溃时只有导致崩溃的图片失败，其余图片正常完成"""
+    images = [b"a", b"b", b"crash", b"c", b"d", b"e", b"f"]
+    results, stats = _run(images, max_workers=3, timeout=10)
+    failed = sorted(index for index, result in results.items() if result["error"])
+    assert len(results) == len(images)
+    assert failed == [2], failed
+    assert stats["crashes"] == 1
+    print(f"✅ 正确: 工作进程崩溃只影响导致崩溃的图片（重建进程池 {stats['pool_restarts']} 次）")
+
+
+def test_worker_timeout():
+    """单张图片卡住时超时失败，其余图片正常完成"""
+    images = [b"a", b"hang", b"b", b"c"]
+    results, stats = _run(images, max_workers=2, timeout=1)
+    failed = sorted(index for index, result in results.items() if result["error"])
+    assert failed == [1], failed
+    assert stats["timeouts"] == 1
+    print("✅ 正确: 卡住的图片超时失败，其余正常完成")
+
+
+if __name__ == "__main__":
+    test_worker_crash()
+    test_worker_timeout()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+测试Phase 1批次打包（batch_packer.pack_batches）
+"""
+
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath('.'))
+
+from app.services.batch_packer import pack_batches
+
+START = datetime(2024, 1, 1)
+
+
+def _greedy_batch_count(costs, budget, overhead):
+    """贪心装箱（连续切分时批次数最少）"""
+    count, total = 0, None
+    for cost in costs:
+        if total is None or total + cost > budget:
+            count += 1
+            total = overhead + cost
+        else:
+            total += cost
+    return count
+
+
+def test_minimum_batches_within_budget():
+    """批次数最少，且每个批次不超过预算"""
+    rng = random.Random(42)
+    for _ in range(200):
+        n = rng.randint(1, 40)
+        budget = rng.randint(20, 60)
+        overhead = rng.randint(0, 5)
+        photos = [
+            (START + timedelta(minutes=rng.randint(0, 100000)), rng.randint(1, 15)) for _ in range(n)
+        ]
+        batches = pack_batches(photos, cost=lambda p: p[1], timestamp=lambda p: p[0],
+                               budget=budget, overhead=overhead)
+
+        ordered = sorted(photos, key=lambda p: p[0])
+        assert [p for batch in batches for p in batch] == ordered
+        assert len(batches) == _greedy_batch_count([p[1] for p in ordered], budget, overhead)
+        for batch in batches:
+            assert overhead + sum(p[1] for p in batch) <= budget
+    print("✅ 正确: 批次数最少且不超过预算")
+
+
+def test_oversized_photo_gets_own_batch():
+    """单张超出预算的照片单独成批"""
+    photos = [(START + timedelta(hours=i), cost) for i, cost in enumerate([3, 3, 100, 3, 3])]
+    batches = pack_batches(photos, cost=lambda p: p[1], timestamp=lambda p: p[0], budget=10)
+    assert [[p[1] for p in batch] for batch in batches] == [[3, 3], [100], [3, 3]]
+    print("✅ 正确: 超出预算的照片单独成批")
+
+
+def test_cut_at_largest_gap_and_scene_change():
+    """批次数相同时，切分点落在时间间隔最大处；场景聚类变化时优先在变化处切分"""
+    hours = [0, 1, 2, 5, 6, 7, 8, 9]
+    photos = [(START + timedelta(hours=h), 0 if i < 5 else 1) for i, h in enumerate(hours)]
+    batches = pack_batches(photos, cost=lambda p: 1, timestamp=lambda p: p[0], budget=5)
+    assert [len(batch) for batch in batches] == [3, 5]
+
+    batches = pack_batches(photos, cost=lambda p: 1, timestamp=lambda p: p[0], budget=5,
+                           scene=lambda p: p[1])
+    assert [len(batch) for batch in batches] == [5, 3]
+    print("✅ 正确: 切分点优先落在时间间隔大、场景变化处")
+
+
+if __name__ == "__main__":
+    test_minimum_batches_within_budget()
+    test_oversized_photo_gets_own_batch()
+    test_cut_at_largest_gap_and_scene_change()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+测试图片数据存储（blob_store）：GridFS重复写入相同内容、后端方法完整性
+"""
+
+import asyncio
+import os
+import sys
+
+from gridfs.errors import FileExists
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath('.'))
+
+from app.services.blob_store import BlobStore, GridFSBlobStore
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.iterator = iter(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _RacingBucket:
+    """
+    模拟并发写入：find始终看不到已写入的文件（两方都在对方写入前完成检查），
+    重复_id写入与真实GridFS一样抛出FileExists
+    """
+
+    def __init__(self):
+        self.files = {}
+
+    def find(self, query, limit=0):
+        return _Cursor([])
+
+    async def upload_from_stream_with_id(self, file_id, filename, source, **kwargs):
+        if file_id in self.files:
+            raise FileExists(f"file with _id {file_id!r} already exists")
+        self.files[file_id] = bytes(source)
+
+
+def test_put_same_key_twice():
+    """相同内容写入两次都成功，返回相同引用且只存储一份"""
+    store = GridFSBlobStore.__new__(GridFSBlobStore)
+    store.bucket = _RacingBucket()
+
+    async def _put_twice():
+        return await store.put(b"same", "image/webp"), await store.put(b"same", "image/webp")
+
+    first, second = asyncio.run(_put_twice())
+    assert first == second
+    assert list(store.bucket.files) == [first["key"]]
+    print("✅ 正确: 重复写入相同内容视为已存储")
+
+
+def test_incomplete_backend():
+    """缺少方法的存储后端在构造时报错"""
+
+    class _NoExists(BlobStore):
+        async def put(self, data, content_type=None):
+            return self._ref("k", len(data))
+
+        async def stream(self, ref):
+            yield b""
+
+        async def delete(self, ref):
+            pass
+
+    try:
+        _NoExists()
+    except TypeError:
+        print("✅ 正确: 未实现exists的后端无法构造")
+        return
+    raise AssertionError("缺少方法的后端构造成功")
+
+
+if __name__ == "__main__":
+    test_put_same_key_twice()
+    test_incomplete_backend()
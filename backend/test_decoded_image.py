@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+测试解码句柄按EXIF方向旋转像素（decoded_image.DecodedImage.base）
+"""
+
+import io
+import os
+import sys
+
+from PIL import Image
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath('.'))
+
+from app.services.decoded_image import DecodedImage
+from app.services.image_compressor import ImageCompressor
+
+
+def _oriented_jpeg(orientation: int) -> bytes:
+    """横向存储的200x100 JPEG：左半红、右半蓝，方向只记录在EXIF中"""
+    image = Image.new("RGB", (200, 100), (0, 0, 255))
+    image.paste((255, 0, 0), (0, 0, 100, 100))
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=95, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def test_orientation_applied():
+    """Orientation=6的照片解码为竖向，所有衍生图继承，衍生图EXIF不再要求旋转"""
+    handle = DecodedImage(_oriented_jpeg(6), base_box=(120, 120))
+    base = handle.base()
+    # 顺时针旋转90°：存储的左半（红）位于上方，base_box按旋转后的宽高计算
+    assert base.size == (60, 120), base.size
+    assert base.getpixel((30, 10))[0] > 200 and base.getpixel((30, 110))[2] > 200
+    assert handle.metadata["orientation"] == 6
+    assert handle.thumbnail().height > handle.thumbnail().width
+
+    result = ImageCompressor().compress_renditions_sync(
+        handle,
+        renditions={"small": {"max_width": 40, "max_height": 40, "keep_exif": True}},
+        options={"auto_crop": False},
+    )
+    small = Image.open(io.BytesIO(result["renditions"]["small"]["data"]))
+    assert small.size == (20, 40), small.size
+    assert small.getexif().get(0x0112, 1) == 1
+    print("✅ 正确: 按EXIF方向旋转后生成衍生图")
+
+
+def test_upright_unchanged():
+    """没有方向标签的照片保持原样"""
+    handle = DecodedImage(_oriented_jpeg(1))
+    assert handle.base().size == (200, 100)
+    print("✅ 正确: 正向照片不旋转")
+
+
+if __name__ == "__main__":
+    test_orientation_applied()
+    test_upright_unchanged()
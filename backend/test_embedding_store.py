@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+测试嵌入向量的二进制编码（embedding_store）
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath('.'))
+
+from app.services.embedding_store import (
+    decode_embedding, encode_embedding, export_user_embeddings, load_user_embeddings
+)
+
+
+def test_round_trip():
+    """float16与float32编码后解码，数值与维度不变"""
+    vector = np.random.default_rng(0).standard_normal(512).astype(np.float32)
+    for dtype, tolerance in (("float32", 0.0), ("float16", 1e-2)):
+        decoded = decode_embedding(encode_embedding(vector, dtype))
+        assert decoded.dtype == np.dtype(dtype)
+        assert decoded.shape == vector.shape
+        assert np.allclose(decoded, vector, atol=tolerance)
+        print(f"✅ 正确: {dtype} 编码解码一致")
+
+
+def test_legacy_and_empty():
+    """兼容旧版浮点数列表，空向量返回None"""
+    assert encode_embedding(None) is None
+    assert decode_embedding(None) is None
+    assert np.array_equal(decode_embedding([0.5, 1.0]), np.array([0.5, 1.0], dtype=np.float32))
+    print("✅ 正确: 兼容旧版列表数据与空向量")
+
+
+def test_invalid_data():
+    """长度不足或魔数错误时抛出ValueError"""
+    for data in (b"EM", b"XX\x01\x02\x04\x00\x00\x00" + bytes(16)):
+        try:
+            decode_embedding(data)
+        except ValueError:
+            continue
+        raise AssertionError(f"未拒绝无效数据: {data!r}")
+    print("✅ 正确: 无效数据被拒绝")
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    def batch_size(self, *args):
+        return self
+
+    def __aiter__(self):
+        self.iterator = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _Collection:
+    """只实现导出用到的查询方法"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def count_documents(self, query):
+        return len(self.docs)
+
+    async def find_one(self, query, projection=None):
+        return self.docs[0] if self.docs else None
+
+    def find(self, query, projection=None):
+        return _Cursor(self.docs)
+
+
+def test_export():
+    """导出只含有效行，矩阵以内存映射加载，重复导出原子切换版本"""
+    rng = np.random.default_rng(1)
+    vectors = [rng.standard_normal(8).astype(np.float32) for _ in range(4)]
+    docs = [
+        {"_id": "p0", "features": {"visual_features": encode_embedding(vectors[0])}},
+        {"_id": "p1", "features": {"visual_features": encode_embedding(vectors[1][:4])}},  # 维度不一致
+        {"_id": "p2", "features": {"visual_features": encode_embedding(vectors[2])}},
+        {"_id": "p3", "features": {"visual_features": encode_embedding(vectors[3])}},
+    ]
+    with tempfile.TemporaryDirectory() as output_dir:
+        path, count = asyncio.run(export_user_embeddings(_Collection(docs), "u1", output_dir))
+        matrix, photo_ids = load_user_embeddings(path)
+        assert count == 3 and photo_ids == ["p0", "p2", "p3"]
+        assert isinstance(matrix, np.memmap) and matrix.shape == (3, 8)
+        assert np.allclose(matrix, np.stack([vectors[0], vectors[2], vectors[3]]), atol=1e-2)
+        assert sorted(os.listdir(path)) == ["embeddings.npy", "photo_ids.json"], "临时文件未清理"
+
+        # 当前版本链接与版本目录内容一致；再导出两次后只保留当前与上一个版本
+        link = os.path.join(output_dir, "u1_visual_features")
+        assert os.path.realpath(link) == os.path.realpath(path)
+        for _ in range(2):
+            latest, _ = asyncio.run(export_user_embeddings(_Collection(docs[:1]), "u1", output_dir))
+        matrix, photo_ids = load_user_embeddings(link)
+        assert photo_ids == ["p0"] and matrix.shape == (1, 8)
+        assert len(os.listdir(output_dir)) == 3
+
+        path, count = asyncio.run(export_user_embeddings(_Collection([]), "u1", output_dir))
+        matrix, photo_ids = load_user_embeddings(path)
+        assert count == 0 and photo_ids == [] and matrix.shape[0] == 0
+    print("✅ 正确: 导出只含有效行，行ID与矩阵一致")
+
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_legacy_and_empty()
+    test_invalid_data()
+    test_export()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+测试JPEG头部EXIF解析（exif_extractor.read_exif_header / parse_tiff_exif）
+
+EXIF数据按TIFF格式手工构造，覆盖小端（II）与大端（MM）、内联与偏移存储的值、
+有理数、ASCII参考标签、SOF尺寸，以及截断或损坏的数据段
+"""
+
+import os
+import struct
+import sys
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath('.'))
+
+from app.services.exif_extractor import (
+    EXIF_HEADER,
+    TAG_DATETIME,
+    TAG_DATETIME_ORIGINAL,
+    TAG_EXIF_IFD,
+    TAG_GPS_IFD,
+    TAG_MAKE,
+    TAG_MODEL,
+    TAG_ORIENTATION,
+    TAG_PIXEL_X,
+    TAG_PIXEL_Y,
+    EXIFExtractor,
+    _empty_metadata,
+    parse_tiff_exif,
+    read_exif_header,
+)
+
+
+def _ascii(tag, text):
+    data = text.encode("ascii") + b"\x00"
+    return tag, 2, len(data), lambda e: data
+
+
+def _short(tag, value):
+    return tag, 3, 1, lambda e: struct.pack(e + "H", value)
+
+
+def _long(tag, value):
+    return tag, 4, 1, lambda e: struct.pack(e + "L", value)
+
+
+def _rational(tag, *pairs):
+    return tag, 5, len(pairs), lambda e: b"".join(struct.pack(e + "LL", num, den) for num, den in pairs)
+
+
+def _tiff(order, ifd0, exif, gps):
+    """
+    构造TIFF数据：头部、IFD0、EXIF IFD、GPS IFD依次排列，超过4字节的值放在末尾数据区
+
+    Args:
+        order: b"II"（小端）或 b"MM"（大端）
+        ifd0/exif/gps: 标签列表，元素为 (tag, 类型, 数量, 按字节序编码值的函数)
+    """
+    e = "<" if order == b"II" else ">"
+    ifds = [ifd0 + [_long(TAG_EXIF_IFD, 0), _long(TAG_GPS_IFD, 0)], exif, gps]
+    offsets, pos = [], 8
+    for entries in ifds:
+        offsets.append(pos)
+        pos += 2 + 12 * len(entries) + 4
+    pointers = {TAG_EXIF_IFD: offsets[1], TAG_GPS_IFD: offsets[2]}
+
+    body, data = b"", b""
+    for entries in ifds:
+        body += struct.pack(e + "H", len(entries))
+        for tag, type_id, count, encode in entries:
+            value = struct.pack(e + "L", pointers[tag]) if tag in pointers else encode(e)
+            if len(value) <= 4:
+                field = value.ljust(4, b"\x00")
+            else:
+                field = struct.pack(e + "L", pos + len(data))
+                data += value
+            body += struct.pack(e + "HHL", tag, type_id, count) + field
+        body += struct.pack(e + "L", 0)
+    return order + struct.pack(e + "HL", 42, 8) + body + data
+
+
+def _segment(marker, payload):
+    return b"\xff" + bytes([marker]) + struct.pack(">H", len(payload) + 2) + payload
+
+
+def _jpeg(tiff=None, size=(640, 480)):
+    """构造JPEG头部：SOI、APP0、APP1(Exif)、SOF0，SOS之后是不会被读取的像素数据"""
+    parts = [b"\xff\xd8", _segment(0xE0, b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00")]
+    if tiff is not None:
+        parts.append(_segment(0xE1, EXIF_HEADER + tiff))
+    if size is not None:
+        width, height = size
+        parts.append(_segment(0xC0, struct.pack(">BHHB", 8, height, width, 3) + b"\x01\x22\x00\x02\x11\x01\x03\x11\x01"))
+    parts.append(_segment(0xDA, b"\x03\x01\x00\x02\x11\x03\x11\x00\x3f\x00"))
+    parts.append(b"\x00" * 64 + b"\xff\xd9")
+    return b"".join(parts)
+
+
+def _sample_tiff(order):
+    return _tiff(
+        order,
+        ifd0=[
+            _ascii(TAG_MAKE, "Canon"),           # 6字节，偏移存储
+            _ascii(TAG_MODEL, "X1"),             # 3字节，内联
+            _short(TAG_ORIENTATION, 6),
+            _ascii(TAG_DATETIME, "2020:01:01 00:00:00"),
+        ],
+        exif=[
+            _ascii(TAG_DATETIME_ORIGINAL, "2023:12:25 14:30:00"),
+            _long(TAG_PIXEL_X, 4000),
+            _short(TAG_PIXEL_Y, 3000),
+        ],
+        gps=[
+            _ascii(1, "S"),
+            _rational(2, (35, 1), (30, 1), (1800, 100)),
+            _ascii(3, "W"),
+            _rational(4, (139, 1), (45, 1), (0, 1)),
+        ],
+    )
+
+
+def _assert_sample(metadata):
+    assert metadata["make"] == "Canon", metadata
+    assert metadata["model"] == "X1", metadata
+    assert metadata["orientation"] == 6, metadata
+    assert metadata["datetime"] == datetime(2023, 12, 25, 14, 30), metadata
+    assert abs(metadata["gps_lat"] - -35.505) < 1e-9, metadata
+    assert abs(metadata["gps_lon"] - -139.75) < 1e-9, metadata
+
+
+def test_little_and_big_endian():
+    """小端与大端EXIF解析结果一致：内联/偏移的值、有理数、S/W参考标签"""
+    for order in (b"II", b"MM"):
+        metadata = parse_tiff_exif(_sample_tiff(order))
+        _assert_sample(metadata)
+        assert (metadata["width"], metadata["height"]) == (4000, 3000), metadata
+
+        # EXIF头部前缀可有可无
+        assert parse_tiff_exif(EXIF_HEADER + _sample_tiff(order)) == metadata
+    print("✅ 正确: 小端（II）与大端（MM）EXIF解析一致")
+
+
+def test_jpeg_header():
+    """JPEG头部解析：EXIF字段取自APP1段，尺寸取自SOF段"""
+    for order in (b"II", b"MM"):
+        metadata = read_exif_header(_jpeg(_sample_tiff(order), size=(640, 480)))
+        _assert_sample(metadata)
+        assert (metadata["width"], metadata["height"]) == (640, 480), metadata
+    print("✅ 正确: JPEG头部逐段解析EXIF与SOF尺寸")
+
+
+def test_datetime_fallback():
+    """没有DateTimeOriginal时使用IFD0的DateTime"""
+    tiff = _tiff(b"MM", ifd0=[_ascii(TAG_DATETIME, "2020:01:02 03:04:05")], exif=[], gps=[])
+    assert parse_tiff_exif(tiff)["datetime"] == datetime(2020, 1, 2, 3, 4, 5)
+    print("✅ 正确: 缺少DateTimeOriginal时使用DateTime")
+
+
+def test_sof_dimension_fallback():
+    """没有EXIF时尺寸取自SOF段，其余字段为空"""
+    metadata = read_exif_header(_jpeg(None, size=(1920, 1080)))
+    assert (metadata["width"], metadata["height"]) == (1920, 1080), metadata
+    assert {k: v for k, v in metadata.items() if k not in ("width", "height")} == {
+        k: v for k, v in _empty_metadata().items() if k not in ("width", "height")
+    }
+    print("✅ 正确: 无EXIF时从SOF段取得尺寸")
+
+
+def test_truncated_jpeg():
+    """任意位置截断的JPEG不抛出异常，已解析出的字段与完整数据一致"""
+    tiff = _sample_tiff(b"II")
+    data = _jpeg(tiff)
+    # 在SOF段之前截断时尺寸取自EXIF，DateTimeOriginal缺失时取IFD0的DateTime
+    allowed = {key: {value} for key, value in read_exif_header(data).items()}
+    allowed["width"].add(4000)
+    allowed["height"].add(3000)
+    allowed["datetime"].add(datetime(2020, 1, 1))
+    for end in range(2, len(data)):
+        metadata = read_exif_header(data[:end])
+        for key, value in metadata.items():
+            assert value is None or value in allowed[key], (end, key, value)
+
+    # APP1段在TIFF头部之前被截断时全部字段为空
+    app1 = data.index(b"\xff\xe1")
+    assert read_exif_header(data[:app1 + 10]) == _empty_metadata()
+    print("✅ 正确: 截断的JPEG返回空字段，不抛出异常")
+
+
+def test_corrupt_segments():
+    """损坏的EXIF数据返回空字段，不抛出异常"""
+    tiff = _sample_tiff(b"II")
+    corrupt = {
+        "字节序标记错误": b"XX" + tiff[2:],
+        "IFD0偏移越界": tiff[:4] + struct.pack("<L", len(tiff) + 100) + tiff[8:],
+        "过短": tiff[:6],
+    }
+    for name, bad in corrupt.items():
+        metadata = parse_tiff_exif(bad)
+        assert all(metadata[key] is None for key in ("make", "model", "gps_lat", "gps_lon")), (name, metadata)
+        read_exif_header(_jpeg(bad))
+
+    # IFD条目数超出数据长度：读到数据末尾为止
+    too_many = tiff[:8] + struct.pack("<H", 0xFFFF) + tiff[10:]
+    _assert_sample(parse_tiff_exif(too_many))
+
+    # 值的偏移越界：只丢弃该标签
+    bad_offset = _tiff(b"II", ifd0=[(TAG_MAKE, 2, 6, lambda e: b"Canon\x00")], exif=[], gps=[])
+    make_entry = bad_offset.index(struct.pack("<HHL", TAG_MAKE, 2, 6))
+    bad_offset = bad_offset[:make_entry + 8] + struct.pack("<L", 0xFFFFFF00) + bad_offset[make_entry + 12:]
+    assert parse_tiff_exif(bad_offset)["make"] is None
+
+    # 段长度字段小于2、不是图片的数据
+    for marker in (b"\xe1", b"\xe0", b"\xc0"):
+        assert read_exif_header(b"\xff\xd8\xff" + marker + b"\x00\x01" + b"\x00" * 16) == _empty_metadata()
+    assert EXIFExtractor.read_metadata(b"not an image") == _empty_metadata()
+    print("✅ 正确: 损坏的EXIF数据返回空字段，不抛出异常")
+
+
+if __name__ == "__main__":
+    test_little_and_big_endian()
+    test_jpeg_header()
+    test_datetime_fallback()
+    test_sof_dimension_fallback()
+    test_truncated_jpeg()
+    test_corrupt_segments()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+测试Gemini调用失败时的状态码识别（gemini_scheduler.error_status）
+"""
+
+import os
+import sys
+
+from google.api_core import exceptions as api_exceptions
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath('.'))
+
+from app.services.gemini_batch import GeminiBatchError
+from app.services.gemini_scheduler import RETRYABLE_CODES, error_status
+
+
+class _Response:
+    status_code = 503
+
+
+class _HTTPStatusError(Exception):
+    """与httpx.HTTPStatusError一样把状态码放在response上"""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.response = _Response()
+
+
+def test_error_status():
+    """按异常类型和状态码属性识别，消息中的数字不影响结果"""
+    assert error_status(api_exceptions.ResourceExhausted("quota")) == 429
+    assert error_status(api_exceptions.ServiceUnavailable("overloaded")) == 503
+    assert error_status(api_exceptions.DeadlineExceeded("deadline")) == 504
+    assert error_status(GeminiBatchError("POST 失败", 500)) == 500
+    assert error_status(_HTTPStatusError("Server error")) == 503
+
+    # 消息中的数字不是状态码，按不可重试处理
+    assert error_status(ValueError("图片尺寸 4032x3024，已上传 503 张")) is None
+    assert error_status(api_exceptions.InvalidArgument("request has 429 parts")) not in RETRYABLE_CODES
+    assert error_status(GeminiBatchError("网络错误 timeout after 504s")) is None
+    print("✅ 正确: 只按异常类型和状态码属性识别可重试错误")
+
+
+if __name__ == "__main__":
+    test_error_status()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+测试删除图片接口（api/image.delete_image）
+
+照片集合与图片存储用内存实现替代；集合的find_one按MongoDB规则校验投影，
+包含与排除字段混用或路径冲突时与服务端一样拒绝查询
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath('.'))
+
+from app.api import image as image_api
+from app.models.user import User
+
+
+def _validate_projection(projection):
+    values = {bool(value) for key, value in projection.items() if key != "_id"}
+    if len(values) > 1:
+        raise ValueError("Cannot do exclusion on field in inclusion projection")
+    paths = sorted(key for key in projection if key != "_id")
+    for shorter, longer in zip(paths, paths[1:]):
+        if longer.startswith(shorter + "."):
+            raise ValueError(f"Path collision at {longer}")
+
+
+def _get_path(doc, path):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return None
+        doc = doc[part]
+    return doc
+
+
+class _Photos:
+    def __init__(self, docs):
+        self.docs = docs
+
+    @staticmethod
+    def _matches(doc, query):
+        if "$or" in query:
+            return any(_Photos._matches(doc, q) for q in query["$or"])
+        return all(_get_path(doc, key) == value for key, value in query.items())
+
+    def _match(self, query):
+        return [doc for doc in self.docs if self._matches(doc, query)]
+
+    async def find_one(self, query, projection=None):
+        _validate_projection(projection or {})
+        matches = self._match(query)
+        return dict(matches[0]) if matches else None
+
+    async def delete_one(self, query):
+        for doc in self._match(query):
+            self.docs.remove(doc)
+
+    async def count_documents(self, query, limit=0):
+        return len(self._match(query))
+
+
+class _Store:
+    def __init__(self, keys):
+        self.keys = set(keys)
+
+    async def get(self, ref):
+        return b"data"
+
+    async def delete(self, ref):
+        self.keys.discard(ref["key"])
+
+    async def put(self, data, content_type=None):
+        raise AssertionError("不应重新写入")
+
+
+def _photo(user_id, key):
+    return {
+        "_id": ObjectId(),
+        "user_id": user_id,
+        "renditions": {"thumb": {"blob": {"backend": "gridfs", "key": key}, "data": b"legacy"}},
+    }
+
+
+def _delete(photos, store, image_id, user_id):
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(image_api, "photos_collection", photos)
+        patch.setattr(image_api, "blob_store_for", lambda ref: store)
+        now = datetime.now()
+        user = User(
+            id=user_id, icloud_email=f"{user_id}@example.com", nickname=user_id, created_at=now, updated_at=now
+        )
+        return asyncio.run(image_api.delete_image(str(image_id), user))
+
+
+def test_delete_image():
+    """删除照片时释放不再被引用的数据，仍被其他照片引用的数据保留，他人照片拒绝删除"""
+    own, shared, other = _photo("u1", "k1"), _photo("u1", "k2"), _photo("u2", "k2")
+    photos, store = _Photos([own, shared, other]), _Store({"k1", "k2"})
+
+    _delete(photos, store, own["_id"], "u1")
+    _delete(photos, store, shared["_id"], "u1")
+    assert photos.docs == [other]
+    assert store.keys == {"k2"}, "仍被引用的数据被删除"
+
+    try:
+        _delete(photos, store, other["_id"], "u1")
+    except HTTPException as e:
+        assert e.status_code == 403
+    else:
+        raise AssertionError("未拒绝删除其他用户的照片")
+    print("✅ 正确: 删除照片只释放不再被引用的数据")
+
+
+if __name__ == "__main__":
+    test_delete_image()
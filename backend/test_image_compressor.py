@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+测试一次生成多个衍生尺寸（image_compressor.ImageCompressor.resize_to_boxes）
+"""
+
+import os
+import sys
+
+from PIL import Image
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath('.'))
+
+from app.services.image_compressor import ImageCompressor
+
+
+def test_boxes_keep_resolution():
+    """面积较小但比例较大的尺寸框不会从分辨率不足的中间结果得到"""
+    image = Image.new("RGB", (2000, 1000))
+    # (800, 800) 面积更大，缩放到800x400；(1000, 600) 需要1000x500
+    boxes = [(800, 800), (1000, 600), (320, 320), (4000, 4000)]
+    results = ImageCompressor().resize_to_boxes(image, boxes)
+    assert [r.size for r in results] == [(800, 400), (1000, 500), (320, 160), (2000, 1000)]
+    assert results[3] is image
+    print("✅ 正确: 每个尺寸都达到目标分辨率")
+
+
+if __name__ == "__main__":
+    test_boxes_keep_resolution()
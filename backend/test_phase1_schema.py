@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+测试Phase 1结构化输出的解析与汇总（phase1_schema）
+"""
+
+import json
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath('.'))
+
+from app.services.phase1_schema import compact_phase1, parse_phase1_output, phase1_overview
+
+OUTPUT = {
+    "batch_summary": "【主角】周末在咖啡厅和公园",
+    "protagonist": "短发女性",
+    "photos": [
+        {"index": 1, "scene": "咖啡厅", "people": ["【主角】", "女性A"], "objects": ["拿铁"],
+         "activity": "聊天", "mood": "轻松", "protagonist_present": True},
+        {"index": 2, "scene": "公园", "people": [], "objects": ["狗"],
+         "activity": "散步", "mood": "愉快", "protagonist_present": False},
+    ],
+}
+
+
+def test_parse_valid_output():
+    """有效JSON（含代码块标记）解析为结构化结果"""
+    text = json.dumps(OUTPUT, ensure_ascii=False)
+    assert parse_phase1_output(text) == OUTPUT
+    assert parse_phase1_output(f"```json\n{text}\n```") == OUTPUT
+    print("✅ 正确: 有效输出被解析")
+
+
+def test_parse_truncated_and_malformed():
+    """截断、格式错误或结构不符的输出返回None"""
+    text = json.dumps(OUTPUT, ensure_ascii=False)
+    for bad in (text[: len(text) // 2], "", None, "本批次照片主要是咖啡厅", "[1, 2]", '{"photos": "无"}'):
+        assert parse_phase1_output(bad) is None, bad
+    print("✅ 正确: 截断或格式错误的输出返回None")
+
+
+def test_parse_drops_invalid_photos():
+    """photos中不是对象的条目被丢弃"""
+    parsed = parse_phase1_output('{"batch_summary": "", "photos": [{"index": 1}, "坏条目", 3]}')
+    assert parsed["photos"] == [{"index": 1}]
+    print("✅ 正确: 无效的照片条目被丢弃")
+
+
+def test_compact_and_overview():
+    """紧凑摘要与统计概览"""
+    compact = compact_phase1(OUTPUT)
+    assert "- 主角出镜: 1/2 张" in compact
+    assert "咖啡厅" in compact and "散步" in compact
+
+    overview = phase1_overview([OUTPUT, OUTPUT])
+    assert overview["photos"] == 4
+    assert overview["protagonist_rate"] == 0.5
+    assert ["咖啡厅", 2] in overview["top_scenes"]
+    print("✅ 正确: 紧凑摘要与统计概览")
+
+
+if __name__ == "__main__":
+    test_parse_valid_output()
+    test_parse_truncated_and_malformed()
+    test_parse_drops_invalid_photos()
+    test_compact_and_overview()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+测试场景聚类的增量更新（scene_clustering.SceneClusteringService）
+"""
+
+import asyncio
+import os
+import sys
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath('.'))
+
+from app.services.embedding_store import encode_embedding
+from app.services.scene_clustering import SceneClusteringService
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    def batch_size(self, *args):
+        return self
+
+    def __aiter__(self):
+        self.iterator = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _Photos:
+    """只实现聚类用到的查询与批量写入"""
+
+    def __init__(self):
+        self.docs = []
+
+    def _match(self, query):
+        if "scene_cluster" in query:
+            return [doc for doc in self.docs if "scene_cluster" not in doc]
+        return list(self.docs)
+
+    async def count_documents(self, query):
+        return len(self._match(query))
+
+    def find(self, query, projection=None):
+        return _Cursor(self._match(query))
+
+    async def bulk_write(self, operations, ordered=True):
+        by_id = {doc["_id"]: doc for doc in self.docs}
+        for operation in operations:
+            by_id[operation._filter["_id"]].update(operation._doc["$set"])
+
+
+class _Clusters:
+    def __init__(self):
+        self.doc = None
+
+    async def find_one(self, query):
+        return dict(self.doc) if self.doc else None
+
+    async def update_one(self, query, update, upsert=False):
+        self.doc = {**(self.doc or {}), **update["$set"]}
+
+
+def _service():
+    photos, clusters = _Photos(), _Clusters()
+    service = SceneClusteringService(
+        n_clusters=2, chunk_size=64, collection=photos, clusters_collection=clusters
+    )
+    rng = np.random.default_rng(0)
+
+    def add(center, count):
+        start = len(photos.docs)
+        for i in range(count):
+            vector = np.asarray(center, dtype=np.float32) + rng.normal(0, 0.05, 2).astype(np.float32)
+            photos.docs.append({
+                "_id": f"p{start + i}",
+                "features": {"visual_features": encode_embedding(vector, "float32")},
+            })
+
+    return service, add
+
+
+def test_small_batch_keeps_history():
+    """少量新照片按累计样本数加权并入，已建立的聚类中心不会跳到新照片上"""
+    service, add = _service()
+    add([0.0, 0.0], 200)
+    add([10.0, 10.0], 200)
+    asyncio.run(service.update_user_clusters("u1"))
+    established = service.centroids[service.predict(np.array([[0.0, 0.0]], dtype=np.float32))[0]].copy()
+    assert np.allclose(established, [0.0, 0.0], atol=0.1)
+
+    # 第二批只有少量偏离的新照片，全部归入原点附近的聚类
+    add([2.0, 2.0], 5)
+    stats = asyncio.run(service.update_user_clusters("u1"))
+    assert stats["scene_cluster_incremental"] and stats["scene_cluster_trained"] == 5
+    label = service.predict(np.array([[0.0, 0.0]], dtype=np.float32))[0]
+    moved = service.centroids[label]
+    # 按计数加权：中心只移动约 5/205 的距离，而不是跳到新照片的均值
+    assert np.allclose(moved, established + (np.array([2.0, 2.0]) - established) * 5 / 205, atol=0.05)
+    assert service.counts.sum() == 405
+    print("✅ 正确: 增量更新保留已有样本的权重")
+
+
+def test_assign_only_new_until_drift():
+    """新照片未使中心明显偏移时只分配新照片；偏移或样本数增长超过阈值时重新分配全部照片"""
+    service, add = _service()
+    add([0.0, 0.0], 200)
+    add([10.0, 10.0], 200)
+    asyncio.run(service.update_user_clusters("u1"))
+
+    add([0.0, 0.0], 3)
+    stats = asyncio.run(service.update_user_clusters("u1"))
+    assert stats["scene_cluster_assigned"] == 3
+
+    add([3.0, 3.0], 10)
+    stats = asyncio.run(service.update_user_clusters("u1"))
+    assert stats["scene_cluster_assigned"] == 413
+
+    add([10.0, 10.0], 420)
+    stats = asyncio.run(service.update_user_clusters("u1"))
+    assert stats["scene_cluster_assigned"] == 833
+    print("✅ 正确: 只在超过偏移阈值时重新分配全部照片")
+
+
+if __name__ == "__main__":
+    test_small_batch_keeps_history()
+    test_assign_only_new_until_drift()
@@ -2,124 +2,299 @@
 """
 MPO 转 JPEG 转换工具
 MPO (Multi-Picture Object) 格式无法被 Gemini API 处理，需要转换为标准 JPEG
+
+- 逐段读取文件头部（到 SOS 为止）识别 MPO（APP2 段中的 MPF 标识），不解码图像
+- 多进程并行转换
+- 转换日志（journal）记录每个文件的处理结果，中断后重新运行会跳过已处理的文件
+- 默认无损模式：直接提取主图的 JPEG 码流并去除 MPF 段，不重新编码；
+  也可选择重新编码模式（quality 95）
+- 先写临时文件再原子替换，中断不会留下损坏的原文件
 """
 from pathlib import Path
 from PIL import Image
 import shutil
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, Optional, Tuple
+import json
 import logging
+import os
+import struct
+import time
 
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 logger = logging.getLogger(__name__)
 
+# 转换日志文件名（位于照片目录下）
+JOURNAL_NAME = ".mpo_convert_journal.jsonl"
+
+SCAN_EXTENSIONS = {'.jpg', '.jpeg', '.mpo'}
+
+
+def _iter_segments(data: bytes):
+    """
+    遍历 JPEG 头部段（SOI 之后、SOS 之前）
+
+    Yields:
+        (marker, 段起始偏移, 段结束偏移)，遇到 SOS 时以 marker=0xDA 结束
+    """
+    if data[:2] != b'\xff\xd8':
+        return
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return
+        marker = data[pos + 1]
+        if marker == 0xFF:  # 填充字节
+            pos += 1
+            continue
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        yield marker, pos, pos + 2 + length
+        if marker == 0xDA:
+            return
+        pos += 2 + length
+
+
+def is_mpo_stream(f: BinaryIO) -> bool:
+    """
+    逐段读取 JPEG 头部判断是否为 MPO（存在 MPF 标识的 APP2 段）
+
+    每个段只读取标记和长度，APP2 段再读取 4 字节标识，其余内容直接跳过；
+    读到 SOS 为止，APP 段再大（如大尺寸 EXIF 缩略图）也不会漏判
+    """
+    if f.read(2) != b'\xff\xd8':
+        return False
+    while True:
+        if f.read(1) != b'\xff':
+            return False
+        marker = f.read(1)
+        while marker == b'\xff':  # 填充字节
+            marker = f.read(1)
+        if not marker or marker == b'\xda':  # SOS：头部结束
+            return False
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return False
+        length = struct.unpack('>H', length_bytes)[0] - 2
+        if length < 0:
+            return False
+        if marker == b'\xe2' and length >= 4:
+            if f.read(4) == b'MPF\x00':
+                return True
+            length -= 4
+        f.seek(length, os.SEEK_CUR)
+
+
+def is_mpo(path: Path) -> bool:
+    """只读取文件头部判断是否为 MPO"""
+    with open(path, 'rb') as f:
+        return is_mpo_stream(f)
+
+
+def extract_primary_jpeg(data: bytes) -> bytes:
+    """
+    无损提取 MPO 主图的 JPEG 码流
+
+    复制 SOS 之前除 MPF APP2 以外的所有段（保留 EXIF 等），
+    然后从 SOS 开始复制熵编码数据直到主图的 EOI。熵编码数据中 0xFF
+    之后只会出现 0x00 或 RSTn，因此 SOS 之后第一个 FFD9 即主图结束。
+
+    Args:
+        data: MPO 文件内容
+
+    Returns:
+        标准 JPEG 文件内容
+    """
+    output = bytearray(b'\xff\xd8')
+    sos_start = None
+    for marker, start, end in _iter_segments(data):
+        if marker == 0xDA:
+            sos_start = start
+            break
+        if marker == 0xE2 and data[start + 4:start + 8] == b'MPF\x00':
+            continue
+        output += data[start:end]
+
+    if sos_start is None:
+        raise ValueError("未找到图像数据 (SOS)")
+
+    eoi = data.find(b'\xff\xd9', sos_start)
+    if eoi < 0:
+        raise ValueError("未找到主图结束标记 (EOI)")
+    output += data[sos_start:eoi + 2]
+    return bytes(output)
+
+
+def _reencode(path: Path) -> bytes:
+    """重新编码主图为 JPEG（quality 95，保留 EXIF）"""
+    import io
+
+    with Image.open(path) as img:
+        img.seek(0)
+        exif_data = img.info.get('exif')
+        buffer = io.BytesIO()
+        save_kwargs = {'quality': 95, 'optimize': True}
+        if exif_data:
+            save_kwargs['exif'] = exif_data
+        img.convert('RGB').save(buffer, 'JPEG', **save_kwargs)
+        return buffer.getvalue()
+
+
+def _atomic_write(path: Path, data: bytes, stat: os.stat_result):
+    """写入临时文件后原子替换，并保留原文件的修改时间"""
+    temp_path = path.with_name(f".{path.name}.mpo-tmp")
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.utime(temp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(temp_path, path)
+
+
+def convert_file(args: Tuple[str, str, Optional[str], str]) -> Dict:
+    """
+    转换单个文件（工作进程入口）
+
+    Args:
+        args: (文件路径, 照片目录, 备份目录, 模式)
 
-def convert_mpo_to_jpeg(photo_dir: str, backup: bool = True):
+    Returns:
+        日志记录
+    """
+    path_str, photo_dir, backup_dir, mode = args
+    path = Path(path_str)
+    rel_path = str(path.relative_to(photo_dir))
+    record = {"path": rel_path, "status": "skipped"}
+    try:
+        stat = path.stat()
+        if not is_mpo(path):
+            record.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            return record
+
+        data = path.read_bytes()
+        jpeg = extract_primary_jpeg(data) if mode == 'lossless' else _reencode(path)
+
+        if backup_dir:
+            backup_path = Path(backup_dir) / rel_path
+            backup_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(path, backup_path)
+
+        # .mpo 扩展名的文件转换后改为 .jpg
+        target = path.with_suffix('.jpg') if path.suffix.lower() == '.mpo' else path
+        if target != path and target.exists():
+            raise FileExistsError(f"目标文件已存在: {target.name}")
+        _atomic_write(target, jpeg, stat)
+        if target != path:
+            path.unlink()
+
+        new_stat = target.stat()
+        record.update(
+            status="converted",
+            path=str(target.relative_to(photo_dir)),
+            original_size=len(data),
+            size=new_stat.st_size,
+            mtime_ns=new_stat.st_mtime_ns,
+        )
+    except Exception as e:
+        record.update(status="failed", error=str(e))
+    return record
+
+
+def _load_journal(journal_path: Path) -> Dict[str, Dict]:
+    """读取转换日志，同一文件以最后一条记录为准"""
+    entries = {}
+    if not journal_path.exists():
+        return entries
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                entries[entry["path"]] = entry
+            except (json.JSONDecodeError, KeyError):
+                continue  # 中断时可能写入了不完整的最后一行
+    return entries
+
+
+def _already_done(entry: Optional[Dict], path: Path) -> bool:
+    """日志中已成功处理且文件未再变化"""
+    if not entry or entry.get("status") not in ("converted", "skipped"):
+        return False
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return False
+    return entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns
+
+
+def convert_mpo_to_jpeg(photo_dir: str, backup: bool = True, workers: int = None, mode: str = 'lossless'):
     """
     将 MPO 格式图片转换为标准 JPEG
 
     Args:
         photo_dir: 照片目录路径
         backup: 是否备份原文件
+        workers: 并行进程数，默认 CPU 核数
+        mode: 'lossless' 无损提取主图码流，'reencode' 重新编码
+
+    Returns:
+        本次转换的文件数
     """
-    photo_dir = Path(photo_dir)
+    photo_dir = Path(photo_dir).resolve()
+    journal_path = photo_dir / JOURNAL_NAME
 
     # 创建备份目录
+    backup_dir = None
     if backup:
         backup_dir = photo_dir.parent / f"{photo_dir.name}_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         logger.info(f"📦 备份目录: {backup_dir}")
 
-    # 扫描所有 .jpg 和 .jpeg 文件
-    image_files = list(photo_dir.glob("**/*.jpg")) + list(photo_dir.glob("**/*.jpeg"))
-
-    mpo_count = 0
-    converted_count = 0
-    skipped_count = 0
-
-    logger.info(f"🔍 扫描 {len(image_files)} 个图片文件...")
-
-    for img_path in image_files:
-        try:
-            with Image.open(img_path) as img:
-                # 检查是否是 MPO 格式
-                if img.format != 'MPO':
-                    skipped_count += 1
-                    continue
-
-                mpo_count += 1
-
-                # 如果需要备份
-                if backup and not backup_dir.exists():
-                    backup_dir.mkdir(parents=True)
-
-                if backup:
-                    # 保持相对路径结构
-                    rel_path = img_path.relative_to(photo_dir)
-                    backup_path = backup_dir / rel_path
-                    backup_path.parent.mkdir(parents=True, exist_ok=True)
-                    shutil.copy2(img_path, backup_path)
-
-                # MPO 文件可能包含多张图片，我们取第一张
-                # PIL 会将 MPO 的第一张图片作为主要图像
-                # 我们需要将其保存为标准 JPEG，并保留 EXIF 信息
-
-                # 创建临时文件
-                temp_path = img_path.with_suffix('.temp.jpg')
-
-                # ⚠️ 重要：保留 EXIF 信息
-                # EXIF 包含拍摄时间（DateTimeOriginal）和 GPS 坐标
-                # 这些是系统分析的核心数据
-                exif_data = None
-                try:
-                    # 尝试获取 EXIF 数据
-                    exif_data = img.info.get('exif')
-                    if exif_data is None:
-                        # 如果没有 exif 键，尝试 _getexif() 方法
-                        if hasattr(img, '_getexif'):
-                            raw_exif = img._getexif()
-                            if raw_exif:
-                                # 将 EXIF 字典转为 bytes
-                                from PIL.Image import Exif
-                                exif_data = Exif()
-                                for tag, value in raw_exif.items():
-                                    try:
-                                        exif_data[tag] = value
-                                    except:
-                                        pass
-                except Exception as exif_err:
-                    logger.warning(f"⚠️  无法提取 EXIF: {img_path.name}: {exif_err}")
-
-                # 保存为标准 JPEG，包含 EXIF 数据
-                save_kwargs = {'quality': 95, 'optimize': True}
-                if exif_data:
-                    save_kwargs['exif'] = exif_data
-                    logger.debug(f"💾 保留 EXIF: {img_path.name}")
-
-                img.save(temp_path, 'JPEG', **save_kwargs)
-
-                # 替换原文件
-                img_path.unlink()
-                temp_path.rename(img_path)
-
-                converted_count += 1
-
-                if converted_count % 50 == 0:
-                    logger.info(f"  进度: 已转换 {converted_count} 个 MPO 文件...")
-
-        except Exception as e:
-            logger.error(f"❌ 转换失败 {img_path}: {e}")
-
+    # 扫描所有 .jpg / .jpeg / .mpo 文件（不区分大小写）
+    image_files = [
+        p for p in photo_dir.rglob("*")
+        if p.suffix.lower() in SCAN_EXTENSIONS and p.is_file() and not p.name.startswith('.')
+    ]
+
+    # 根据日志跳过已处理的文件
+    journal = _load_journal(journal_path)
+    pending = [p for p in image_files if not _already_done(journal.get(str(p.relative_to(photo_dir))), p)]
+    resumed = len(image_files) - len(pending)
+
+    logger.info(f"🔍 扫描 {len(image_files)} 个图片文件，日志中已处理 {resumed} 个，待处理 {len(pending)} 个...")
+
+    counts = {"converted": 0, "skipped": 0, "failed": 0}
+    saved_bytes = 0
+    start = time.time()
+
+    tasks = [(str(p), str(photo_dir), str(backup_dir) if backup_dir else None, mode) for p in pending]
+    with open(journal_path, 'a', encoding='utf-8') as journal_file, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        for record in executor.map(convert_file, tasks, chunksize=16):
+            counts[record["status"]] += 1
+            journal_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            journal_file.flush()
+
+            if record["status"] == "converted":
+                saved_bytes += record["original_size"] - record["size"]
+                if counts["converted"] % 50 == 0:
+                    logger.info(f"  进度: 已转换 {counts['converted']} 个 MPO 文件...")
+            elif record["status"] == "failed":
+                logger.error(f"❌ 转换失败 {record['path']}: {record['error']}")
+
+    elapsed = time.time() - start
     logger.info("\n" + "="*70)
     logger.info("✅ 转换完成！")
     logger.info("="*70)
-    logger.info(f"📊 扫描文件: {len(image_files)}")
-    logger.info(f"🔍 发现 MPO: {mpo_count}")
-    logger.info(f"✅ 成功转换: {converted_count}")
-    logger.info(f"⏭️  跳过(JPEG): {skipped_count}")
-
-    if backup:
+    logger.info(f"📊 扫描文件: {len(image_files)} (日志跳过 {resumed})")
+    logger.info(f"✅ 成功转换: {counts['converted']} ({'无损提取' if mode == 'lossless' else '重新编码'})")
+    logger.info(f"⏭️  跳过(JPEG): {counts['skipped']}")
+    logger.info(f"❌ 失败: {counts['failed']}")
+    logger.info(f"💾 节省空间: {saved_bytes / 1024 / 1024:.1f} MB")
+    logger.info(f"⏱️  耗时: {elapsed:.1f} 秒 ({len(pending) / elapsed if elapsed > 0 else 0:.0f} 文件/秒)")
+
+    if backup and counts["converted"]:
         logger.info(f"\n💾 原文件已备份到: {backup_dir}")
 
-    return converted_count
+    return counts["converted"]
 
 
 def main():
@@ -129,6 +304,12 @@ def main():
     parser.add_argument('photo_dir', help='照片目录路径')
     parser.add_argument('--no-backup', action='store_true',
                        help='不备份原文件（谨慎使用）')
+    parser.add_argument('--mode', choices=['lossless', 'reencode'], default='lossless',
+                       help='lossless: 无损提取主图码流（默认）；reencode: 重新编码为 JPEG')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='并行进程数（默认 CPU 核数）')
+    parser.add_argument('-y', '--yes', action='store_true',
+                       help='跳过确认')
 
     args = parser.parse_args()
 
@@ -138,15 +319,16 @@ def main():
     print()
     print(f"📁 照片目录: {args.photo_dir}")
     print(f"💾 备份: {'否' if args.no_backup else '是'}")
+    print(f"🛠️  模式: {args.mode}")
     print()
 
-    if not args.no_backup:
+    if not args.no_backup and not args.yes:
         confirm = input("⚠️  将会备份所有 MPO 文件，是否继续？(y/N): ")
         if confirm.lower() != 'y':
             print("❌ 已取消")
             return
 
-    convert_mpo_to_jpeg(args.photo_dir, backup=not args.no_backup)
+    convert_mpo_to_jpeg(args.photo_dir, backup=not args.no_backup, workers=args.workers, mode=args.mode)
 
 
 if __name__ == "__main__":
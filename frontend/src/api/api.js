@@ -124,7 +124,37 @@ export const memoryAPI = {
   // 删除记忆记录
   deleteMemoryRecord: (recordId) => api.delete(`/memory/records/${recordId}`),
   // 重新生成Phase 2结果
-  regeneratePhase2Result: (recordId, promptGroupId) => api.put(`/memory/records/${recordId}/regenerate-phase2`, { prompt_group_id: promptGroupId })
+  regeneratePhase2Result: (recordId, promptGroupId) => api.put(`/memory/records/${recordId}/regenerate-phase2`, { prompt_group_id: promptGroupId }),
+  // 订阅分析进度（server-sent events）；EventSource无法携带Authorization头，使用fetch读取流
+  streamMemoryRecordEvents: async (recordId, onEvent, signal) => {
+    const token = localStorage.getItem('token')
+    const response = await fetch(`${api.defaults.baseURL}/memory/records/${recordId}/events`, {
+      headers: token ? { Authorization: `Bearer ${token}` } : {},
+      signal
+    })
+    if (!response.ok) {
+      throw new Error(`订阅分析进度失败: ${response.status}`)
+    }
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+      const messages = buffer.split('\n\n')
+      buffer = messages.pop()
+      for (const message of messages) {
+        let event = 'message'
+        let data = ''
+        for (const line of message.split('\n')) {
+          if (line.startsWith('event: ')) event = line.slice(7)
+          else if (line.startsWith('data: ')) data += line.slice(6)
+        }
+        if (data) onEvent(event, JSON.parse(data))
+      }
+    }
+  }
 }
 
 // 图片相关API
@@ -247,7 +247,7 @@ const ImagesModal = ({
                   <div key={image.id} className="card overflow-hidden group">
                     <div className="aspect-square overflow-hidden bg-gray-100 relative">
                       <img
-                        src={`/api/images/data/${image.id}`}
+                        src={`/api/images/data/${image.id}?size=thumb`}
                         alt={image.filename}
                         className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-300"
                         loading="lazy"
@@ -1239,6 +1239,22 @@ function MemoryRecordsPage () {
                             <div><span className="font-medium">Phase 2 输出Token消耗：</span>{modalState.recordDetail.data.stats.phase2_candidates_tokens || 0}</div>
                           </div>
                         </div>
+                        {modalState.recordDetail.data.stats.phase1_overview?.photos > 0 && (
+                          <div className="border rounded-lg p-4 md:col-span-2">
+                            <h5 className="font-medium mb-2">照片内容概览</h5>
+                            <div className="space-y-2 text-sm text-gray-600">
+                              <div><span className="font-medium">主角出镜比例：</span>{Math.round(modalState.recordDetail.data.stats.phase1_overview.protagonist_rate * 100)}%</div>
+                              {[['常见场景', 'top_scenes'], ['常见活动', 'top_activities'], ['常见地点', 'top_locations']].map(([label, key]) => (
+                                modalState.recordDetail.data.stats.phase1_overview[key]?.length > 0 && (
+                                  <div key={key}>
+                                    <span className="font-medium">{label}：</span>
+                                    {modalState.recordDetail.data.stats.phase1_overview[key].map(([name, count]) => `${name}（${count}）`).join('、')}
+                                  </div>
+                                )
+                              ))}
+                            </div>
+                          </div>
+                        )}
                       </div>
                     </div>
                   )}
@@ -5,6 +5,30 @@ import BasicInfo from './components/BasicInfo.jsx'
 import Phase2Result from './components/Phase2Result.jsx'
 import Phase1Results from './components/Phase1Results.jsx'
 
+// 分析进行中的状态
+const ACTIVE_STATUSES = ['pending', 'processing']
+
+const STAGE_LABELS = {
+  download: '下载照片',
+  process: '处理图片',
+  phase1: 'Phase 1 批次分析',
+  phase1_batch_job: 'Phase 1 批处理任务（等待完成）',
+  phase2: 'Phase 2 人格画像'
+}
+
+// 按 offset 截断后追加流式文本，key 形如 phase1.<批次ID> 或 phase2
+const applyPartial = (partialResults, { key, offset, text }) => {
+  const [parent, child] = key.split('.')
+  if (!child) {
+    return { ...partialResults, [parent]: (partialResults[parent] || '').slice(0, offset) + text }
+  }
+  const group = partialResults[parent] || {}
+  return {
+    ...partialResults,
+    [parent]: { ...group, [child]: (group[child] || '').slice(0, offset) + text }
+  }
+}
+
 function ResultDetailPage () {
   const navigate = useNavigate()
   const { recordId } = useParams()
@@ -12,6 +36,7 @@ function ResultDetailPage () {
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState('')
   const [showBackToTop, setShowBackToTop] = useState(false)
+  const [liveProgress, setLiveProgress] = useState(null)
   const mainContentRef = useRef(null)
   
   // 监听滚动，显示/隐藏回到顶部按钮
@@ -62,6 +87,31 @@ function ResultDetailPage () {
     loadRecord()
   }, [loadRecord])
   
+  // 分析进行中时订阅进度，流式显示部分结果
+  const recordStatus = record?.status
+  useEffect(() => {
+    if (!recordId || !ACTIVE_STATUSES.includes(recordStatus)) return
+    const controller = new AbortController()
+    memoryAPI.streamMemoryRecordEvents(recordId, (event, data) => {
+      if (event === 'snapshot') {
+        setLiveProgress({ stage: data.stage || {}, partialResults: data.partial_results || {} })
+      } else if (event === 'stage') {
+        setLiveProgress(prev => ({ ...(prev || { partialResults: {} }), stage: data }))
+      } else if (event === 'partial') {
+        setLiveProgress(prev => {
+          const current = prev || { stage: {}, partialResults: {} }
+          return { ...current, partialResults: applyPartial(current.partialResults, data) }
+        })
+      } else if (event === 'status') {
+        setLiveProgress(null)
+        loadRecord(false)
+      }
+    }, controller.signal).catch(err => {
+      if (err.name !== 'AbortError') console.error('订阅分析进度失败:', err)
+    })
+    return () => controller.abort()
+  }, [recordId, recordStatus])
+
   // 重新分析
   const handleReanalyze = async () => {
     setLoading(true)
@@ -187,6 +237,27 @@ function ResultDetailPage () {
           {/* 内容区域 */}
           {record ? (
             <div className="space-y-6">
+              {liveProgress && ACTIVE_STATUSES.includes(record.status) && (
+                <div className="p-4 bg-indigo-50 border border-indigo-200 rounded-xl">
+                  <div className="flex items-center gap-2 mb-2">
+                    <span className="spinner"></span>
+                    <h3 className="font-semibold text-indigo-900">
+                      {STAGE_LABELS[liveProgress.stage.stage] || '分析中'}
+                      {liveProgress.stage.batches ? `（共 ${liveProgress.stage.batches} 个批次）` : ''}
+                    </h3>
+                  </div>
+                  {liveProgress.partialResults.phase1 && (
+                    <p className="text-sm text-indigo-700 mb-2">
+                      已收到 {Object.keys(liveProgress.partialResults.phase1).length} 个批次的分析结果
+                    </p>
+                  )}
+                  {liveProgress.partialResults.phase2 && (
+                    <pre className="text-sm text-gray-700 whitespace-pre-wrap max-h-96 overflow-y-auto">
+                      {liveProgress.partialResults.phase2}
+                    </pre>
+                  )}
+                </div>
+              )}
               <BasicInfo record={record} />
               <Phase2Result data={record.phase2_result} />
               <Phase1Results data={record.phase1_results} />
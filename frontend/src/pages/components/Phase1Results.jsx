@@ -140,8 +140,34 @@ const Phase1Item = ({ item, index }) => {
         </div>
       )}
 
-      {/* 原始输出 */}
-      {item.raw_vlm_output && (
+      {/* 逐张照片的结构化结果 */}
+      {item.structured?.photos?.length > 0 && (
+        <details className="mt-4">
+          <summary className="text-sm font-medium text-blue-600 cursor-pointer hover:text-blue-800">
+            查看逐张照片分析（{item.structured.photos.length} 张）
+          </summary>
+          <div className="mt-3 space-y-2">
+            {item.structured.protagonist && (
+              <p className="text-sm text-gray-600"><strong className="text-gray-700">主角：</strong>{item.structured.protagonist}</p>
+            )}
+            {item.structured.photos.map((photo, photoIndex) => (
+              <div key={photoIndex} className="p-3 bg-gray-50 rounded-lg text-sm text-gray-600">
+                <div className="font-medium text-gray-700 mb-1">
+                  #{photo.index ?? photoIndex + 1} {photo.scene}{photo.location ? ` · ${photo.location}` : ''}
+                  {photo.protagonist_present && <span className="ml-2 text-xs text-blue-600">主角出镜</span>}
+                </div>
+                {photo.activity && <div><strong className="text-gray-700">活动：</strong>{photo.activity}</div>}
+                {photo.people?.length > 0 && <div><strong className="text-gray-700">人物：</strong>{photo.people.join('、')}</div>}
+                {photo.objects?.length > 0 && <div><strong className="text-gray-700">物品：</strong>{photo.objects.join('、')}</div>}
+                {photo.mood && <div><strong className="text-gray-700">情绪：</strong>{photo.mood}</div>}
+              </div>
+            ))}
+          </div>
+        </details>
+      )}
+
+      {/* 原始输出（旧记录或无法解析为结构化结果时） */}
+      {item.raw_vlm_output && !item.structured && (
         <details className="mt-4">
           <summary className="text-sm font-medium text-blue-600 cursor-pointer hover:text-blue-800">
             查看详细分析结果
@@ -11,12 +11,15 @@ Phase 2 (Reduce): Gemini Pro 深度分析生成完整人格画像
 """
 
 import asyncio
+import io
 import json
 import os
 import re
+import sys
+import time
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional
 from dataclasses import dataclass, asdict
 from PIL import Image
 import google.generativeai as genai
@@ -41,6 +44,43 @@ logger = logging.getLogger(__name__)
 # Gemini API 配置
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
+# Gemini 调用调度器（限流、自适应并发与重试，与后端共用同一实现）
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+from app.services.gemini_scheduler import get_gemini_scheduler
+from app.services.gemini_client_pool import get_gemini_client_pool
+from app.services.batch_digest import phase1_digest
+from app.services.batch_packer import image_tokens, pack_batches
+from app.services.gemini_batch import (
+    GeminiBatchClient,
+    GeminiBatchError,
+    GeminiBatchTimeout,
+    build_request,
+    can_resume,
+    run_batch_job,
+)
+from app.services.gemini_files import BATCH_MIN_TTL, GeminiFileStore
+from app.services.decoded_image import DecodedImage
+from app.services.exif_extractor import read_exif_header
+from app.services.phase1_schema import (
+    PHASE1_GENERATION_CONFIG, PHASE1_JSON_INSTRUCTION, compact_phase1, parse_phase1_output
+)
+
+# HEIC/HEIF 支持（可选依赖 pillow-heif）
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_AVAILABLE = True
+except ImportError:
+    HEIF_AVAILABLE = False
+    logger.warning("⚠️ 未安装 pillow-heif，将跳过 HEIC/HEIF 照片")
+
+# Gemini 可直接接收的图片格式，其他格式（MPO、HEIC）在内存中转码为 JPEG
+GEMINI_NATIVE_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+
+# Phase 1 缓存：按最近使用时间过期，超出条目上限时淘汰最久未用的
+PHASE1_CACHE_TTL_DAYS = int(os.getenv("PHASE1_CACHE_TTL_DAYS", "30"))
+PHASE1_CACHE_MAX_ENTRIES = int(os.getenv("PHASE1_CACHE_MAX_ENTRIES", "2000"))
+
 # ==================== 数据模型 ====================
 
 @dataclass
@@ -52,11 +92,16 @@ class PhotoMetadata:
     gps_lat: float = None
     gps_lon: float = None
     has_gps: bool = False
+    orientation: int = None
+    make: str = None
+    model: str = None
+    width: int = None
+    height: int = None
 
 @dataclass
 class Batch:
     """批次信息"""
-    batch_id: str  # 格式: YYYY-MM_Wxx
+    batch_id: str  # 格式: YYYY-MM-DD_Bxxx（批次首张照片日期 + 序号）
     photos: List[PhotoMetadata]
     time_range: Tuple[datetime, datetime]
     image_count: int
@@ -68,146 +113,80 @@ class Phase1Result:
     processed_at: str
     image_count: int
     time_range: Tuple[str, str]
-    raw_vlm_output: str  # Gemini Flash 的全量客观描述
+    raw_vlm_output: str  # Gemini Flash 的原始输出（JSON）
+    failed: bool = False  # 重试后仍失败（不缓存，不进入 Phase 2）
+    structured: Optional[Dict[str, Any]] = None  # 逐张照片的场景、人物、物品、活动（无法解析时为 None）
 
 # ==================== Phase 0: EXIF 提取器 ====================
 
 class EXIFExtractor:
-    """从照片中提取 EXIF 元数据"""
-
-    @staticmethod
-    def get_decimal_from_dms(dms, ref):
-        """将 GPS DMS 格式转为 Decimal"""
-        degrees = dms[0]
-        minutes = dms[1]
-        seconds = dms[2]
-
-        decimal = degrees + (minutes / 60.0) + (seconds / 3600.0)
-        if ref in ['S', 'W']:
-            decimal = -decimal
-        return decimal
-
-    @staticmethod
-    def extract_datetime(image_path: str) -> datetime:
-        """提取拍摄时间"""
-        try:
-            with Image.open(image_path) as img:
-                exif = img._getexif()
-                if exif:
-                    # DateTimeOriginal (36867)
-                    date_str = exif.get(36867) or exif.get(306)  # DateTime (306)
-                    if date_str:
-                        # 格式: "2023:12:25 14:30:00"
-                        return datetime.strptime(date_str, "%Y:%m:%d %H:%M:%S")
-        except Exception as e:
-            logger.warning(f"无法提取时间戳 {image_path}: {e}")
+    """
+    从照片中提取 EXIF 元数据
 
-        # 备用：使用文件修改时间
-        return datetime.fromtimestamp(os.path.getmtime(image_path))
-
-    @staticmethod
-    def extract_gps(image_path: str) -> Tuple[float, float]:
-        """提取 GPS 坐标"""
-        try:
-            with Image.open(image_path) as img:
-                exif = img._getexif()
-                if exif and 34853 in exif:  # GPSInfo
-                    gps_info = exif[34853]
-
-                    lat = None
-                    lon = None
-
-                    # 纬度
-                    if 2 in gps_info and 1 in gps_info:  # GPSLatitude, GPSLatitudeRef
-                        lat = EXIFExtractor.get_decimal_from_dms(
-                            gps_info[2], gps_info[1]
-                        )
-
-                    # 经度
-                    if 4 in gps_info and 3 in gps_info:  # GPSLongitude, GPSLongitudeRef
-                        lon = EXIFExtractor.get_decimal_from_dms(
-                            gps_info[4], gps_info[3]
-                        )
-
-                    return lat, lon
-        except Exception as e:
-            logger.warning(f"无法提取GPS {image_path}: {e}")
-
-        return None, None
+    与后端共用 exif_extractor 的头部解析：JPEG/MPO 只读取 APP1 与 SOF 段，
+    HEIC/PNG/WebP 通过 Pillow 惰性打开。每个文件只打开一次。
+    """
 
     @classmethod
     def process_photo(cls, photo_path: str) -> PhotoMetadata:
         """处理单张照片，提取所有元数据"""
         filename = os.path.basename(photo_path)
-        dt = cls.extract_datetime(photo_path)
-        lat, lon = cls.extract_gps(photo_path)
+        try:
+            metadata = read_exif_header(photo_path)
+        except Exception as e:
+            logger.warning(f"无法读取 EXIF {photo_path}: {e}")
+            metadata = {}
 
+        lat, lon = metadata.get("gps_lat"), metadata.get("gps_lon")
         return PhotoMetadata(
             path=photo_path,
             filename=filename,
-            datetime=dt,
+            # 备用：使用文件修改时间
+            datetime=metadata.get("datetime") or datetime.fromtimestamp(os.path.getmtime(photo_path)),
             gps_lat=lat,
             gps_lon=lon,
-            has_gps=(lat is not None and lon is not None)
+            has_gps=(lat is not None and lon is not None),
+            orientation=metadata.get("orientation"),
+            make=metadata.get("make"),
+            model=metadata.get("model"),
+            width=metadata.get("width"),
+            height=metadata.get("height"),
         )
 
 # ==================== Phase 0: 智能批次分组器 ====================
 
 class BatchProcessor:
-    """按时间智能分组照片"""
+    """按时间顺序、token 预算打包批次"""
+
+    # Phase 1 提示词（不含图片）的估算 token 数
+    PROMPT_TOKENS = 4000
 
     @staticmethod
-    def create_batches(photos: List[PhotoMetadata], max_batch_size: int = 50) -> List[Batch]:
+    def create_batches(photos: List[PhotoMetadata], token_budget: int = None) -> List[Batch]:
         """
-        智能分组策略：
-        1. 优先按月分组
-        2. 如果某月 > max_batch_size，按周拆分
+        打包策略：
+        1. 照片按拍摄时间排序，每个批次内时间连续
+        2. 每张照片按原图尺寸估算图片 token，批次总量不超过 token_budget
+           （默认环境变量 PHASE1_TOKEN_BUDGET）
+        3. 批次数最少，切分点优先选在时间间隔最大处
         """
-        # 按月分组
-        monthly_groups = {}
-        for photo in photos:
-            month_key = photo.datetime.strftime("%Y-%m")
-            if month_key not in monthly_groups:
-                monthly_groups[month_key] = []
-            monthly_groups[month_key].append(photo)
+        packed = pack_batches(
+            photos,
+            cost=lambda p: image_tokens(p.width, p.height),
+            timestamp=lambda p: p.datetime,
+            budget=token_budget,
+            overhead=BatchProcessor.PROMPT_TOKENS,
+        )
 
         batches = []
-        for month_key, month_photos in sorted(monthly_groups.items()):
-            if len(month_photos) <= max_batch_size:
-                # 整月作为一个批次
-                batch_id = month_key
-                time_range = (
-                    min(p.datetime for p in month_photos),
-                    max(p.datetime for p in month_photos)
-                )
-                batches.append(Batch(
-                    batch_id=batch_id,
-                    photos=sorted(month_photos, key=lambda x: x.datetime),
-                    time_range=time_range,
-                    image_count=len(month_photos)
-                ))
-            else:
-                # 按周拆分
-                week_groups = {}
-                for photo in month_photos:
-                    # 计算周数（一年中的第几周）
-                    week_num = photo.datetime.isocalendar()[1]
-                    week_key = f"{month_key}_W{week_num:02d}"
-                    if week_key not in week_groups:
-                        week_groups[week_key] = []
-                    week_groups[week_key].append(photo)
-
-                for week_key, week_photos in sorted(week_groups.items()):
-                    time_range = (
-                        min(p.datetime for p in week_photos),
-                        max(p.datetime for p in week_photos)
-                    )
-                    batches.append(Batch(
-                        batch_id=week_key,
-                        photos=sorted(week_photos, key=lambda x: x.datetime),
-                        time_range=time_range,
-                        image_count=len(week_photos)
-                    ))
+        for index, batch_photos in enumerate(packed, 1):
+            time_range = (batch_photos[0].datetime, batch_photos[-1].datetime)
+            batches.append(Batch(
+                batch_id=f"{time_range[0].strftime('%Y-%m-%d')}_B{index:03d}",
+                photos=batch_photos,
+                time_range=time_range,
+                image_count=len(batch_photos)
+            ))
 
         return batches
 
@@ -218,9 +197,16 @@ class Phase1Analyzer:
 
     def __init__(self):
         # 使用 Gemini 2.5 Flash 确保更准确的视觉识别
-        self.model = genai.GenerativeModel('models/gemini-2.5-flash')
+        self.model_name = 'models/gemini-2.5-flash'
+        self.gemini_pool = get_gemini_client_pool()
         self.cache_dir = Path("cache/phase1")
         self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # 批处理任务状态（不放在 cache/phase1 下，避免被当作缓存条目清理）
+        self.batch_job_path = Path("cache/phase1_batch_job.json")
+        # 图片经 Files API 上传一次，文件引用跨次运行复用直至过期
+        self.file_store = GeminiFileStore(path="cache/gemini_files.json")
+        self.cache_hits = 0
+        self.cache_misses = 0
 
         # 尝试加载主角特征
         self.protagonist_features = self._load_protagonist_features()
@@ -238,27 +224,89 @@ class Phase1Analyzer:
                 logger.warning(f"⚠️ 无法加载主角特征: {e}")
         return None
 
-    def _get_cache_path(self, batch_id: str) -> Path:
+    @staticmethod
+    def _open_batch(batch: Batch) -> List[DecodedImage]:
+        """
+        读取批次内的照片文件（每个文件只读取一次）
+
+        返回的解码句柄同时用于计算内容摘要（MD5）和生成发送给 Gemini 的图片，
+        无法读取的文件跳过
+        """
+        handles = []
+        for photo in batch.photos:
+            try:
+                with open(photo.path, 'rb') as f:
+                    handles.append(DecodedImage(f.read(), filename=photo.path))
+            except OSError as e:
+                logger.warning(f"无法读取图片 {photo.path}: {e}")
+        return handles
+
+    def _batch_digest(self, batch: Batch, prompt: str, handles: List[DecodedImage]) -> str:
+        """
+        计算批次内容摘要（与后端共用 batch_digest.phase1_digest）
+
+        由按发送顺序的照片文件MD5、提示词全文、主角特征和模型名称计算，
+        批次编号或切分方式变化时，只要内容与顺序相同仍能命中缓存
+        （结构化结果按照片序号引用照片）
+        """
+        image_hashes = [handle.md5 for handle in handles]
+        return phase1_digest(image_hashes, prompt, self.protagonist_features, self.model_name)
+
+    def _get_cache_path(self, digest: str) -> Path:
         """获取缓存文件路径"""
-        return self.cache_dir / f"batch_{batch_id}.json"
+        return self.cache_dir / f"{digest}.json"
 
-    def _load_from_cache(self, batch_id: str) -> Phase1Result:
-        """从缓存加载结果"""
-        cache_path = self._get_cache_path(batch_id)
-        if cache_path.exists():
-            logger.info(f"✅ 从缓存加载批次 {batch_id}")
+    def _load_from_cache(self, batch: Batch, digest: str) -> Phase1Result:
+        """从缓存加载结果（批次编号与时间范围使用当前批次的）"""
+        cache_path = self._get_cache_path(digest)
+        if not cache_path.exists():
+            return None
+        try:
             with open(cache_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                return Phase1Result(**data)
-        return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ 缓存文件损坏，重新分析: {e}")
+            return None
+
+        # 更新修改时间，作为最近使用时间
+        os.utime(cache_path)
+        logger.info(f"✅ 从缓存加载批次 {batch.batch_id}")
+        return Phase1Result(
+            batch_id=batch.batch_id,
+            processed_at=data['processed_at'],
+            image_count=batch.image_count,
+            time_range=(
+                batch.time_range[0].isoformat(),
+                batch.time_range[1].isoformat()
+            ),
+            raw_vlm_output=data['raw_vlm_output'],
+            structured=data.get('structured')
+        )
 
-    def _save_to_cache(self, result: Phase1Result):
+    def _save_to_cache(self, result: Phase1Result, digest: str):
         """保存结果到缓存"""
-        cache_path = self._get_cache_path(result.batch_id)
-        with open(cache_path, 'w', encoding='utf-8') as f:
+        cache_path = self._get_cache_path(digest)
+        tmp_path = cache_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(asdict(result), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, cache_path)
         logger.info(f"💾 已缓存批次 {result.batch_id}")
 
+    def _prune_cache(self):
+        """清理过期缓存，并将条目数控制在上限内（按最近使用时间淘汰）"""
+        entries = sorted(
+            ((path.stat().st_mtime, path) for path in self.cache_dir.glob('*.json')),
+            reverse=True
+        )
+        expire_before = time.time() - PHASE1_CACHE_TTL_DAYS * 86400
+        removed = 0
+        for index, (mtime, path) in enumerate(entries):
+            if index >= PHASE1_CACHE_MAX_ENTRIES or mtime < expire_before:
+                path.unlink(missing_ok=True)
+                removed += 1
+        if removed:
+            logger.info(f"🧹 清理 {removed} 个 Phase 1 缓存（过期或超出上限）")
+
     def _create_prompt(self, batch: Batch) -> str:
         """生成 Phase 1 提示词（客观事实提取）"""
         # 提取时间范围和 GPS 信息
@@ -343,92 +391,245 @@ class Phase1Analyzer:
 - 不要遗漏任何可见的重要细节
 - 你的描述将成为后续人格分析的基础素材，主角识别准确性至关重要"""
 
-        return prompt
+        return prompt + PHASE1_JSON_INSTRUCTION
+
+    @staticmethod
+    def _gemini_bytes(handle: DecodedImage) -> bytes:
+        """
+        发送给 Gemini 的图片数据；原生格式直接使用文件内容，MPO（取第一帧）和 HEIC
+        从句柄解码（按 EXIF 方向转正、不超过 1920x1080）后在内存中转码为 JPEG，保留 EXIF
+        """
+        if handle.format in GEMINI_NATIVE_FORMATS:
+            return handle.data
+        buffer = io.BytesIO()
+        handle.base().convert('RGB').save(buffer, format='JPEG', quality=92, exif=handle.exif or b'')
+        handle.release()
+        return buffer.getvalue()
+
+    def _load_images(self, batch: Batch, handles: List[DecodedImage]) -> List[bytes]:
+        """批次内发送给 Gemini 的图片（跳过无法解码的文件）"""
+        images = []
+        skipped = len(batch.photos) - len(handles)
+        for handle in handles:  # 批次大小已按 token 预算打包
+            try:
+                images.append(self._gemini_bytes(handle))
+            except Exception as e:
+                logger.warning(f"无法读取图片 {handle.filename}: {e}")
+                skipped += 1
+
+        if skipped > 0:
+            logger.info(f"ℹ️  批次 {batch.batch_id} 跳过 {skipped} 个无法读取的文件")
+        return images
+
+    def _build_result(self, batch: Batch, raw_output: str, failed: bool = False) -> Phase1Result:
+        structured = None if failed else parse_phase1_output(raw_output)
+        if not failed and structured is None:
+            logger.warning(f"⚠️  批次 {batch.batch_id} 输出不是有效的 JSON，保留原始文本")
+        return Phase1Result(
+            batch_id=batch.batch_id,
+            processed_at=datetime.now().isoformat(),
+            image_count=batch.image_count,
+            time_range=(
+                batch.time_range[0].isoformat(),
+                batch.time_range[1].isoformat()
+            ),
+            raw_vlm_output=raw_output,
+            failed=failed,
+            structured=structured
+        )
 
     async def analyze_batch(self, batch: Batch) -> Phase1Result:
         """分析单个批次"""
-        # 检查缓存
-        cached = self._load_from_cache(batch.batch_id)
+        # 生成提示词，按批次内容摘要检查缓存
+        prompt = self._create_prompt(batch)
+        handles = self._open_batch(batch)
+        digest = self._batch_digest(batch, prompt, handles)
+        cached = self._load_from_cache(batch, digest)
         if cached:
+            self.cache_hits += 1
             return cached
+        self.cache_misses += 1
+        return await self._analyze_uncached(batch, prompt, digest, handles)
 
+    async def _analyze_uncached(
+        self, batch: Batch, prompt: str, digest: str, handles: List[DecodedImage]
+    ) -> Phase1Result:
+        """实时调用 Gemini 分析批次，成功的结果写入缓存（handles 为计算摘要时读取的文件）"""
         logger.info(f"🔍 正在分析批次 {batch.batch_id} ({batch.image_count} 张照片)")
 
         # 准备图片（跳过不支持的格式）
-        images = []
-        skipped = 0
-        for photo in batch.photos[:50]:  # Flash 最多处理50张
-            try:
-                img = Image.open(photo.path)
-                # 检测并跳过 MPO 格式（Gemini API 不支持）
-                if img.format == 'MPO':
-                    logger.warning(f"⚠️ 跳过 MPO 格式: {photo.path}")
-                    img.close()
-                    skipped += 1
-                    continue
-                images.append(img)
-            except Exception as e:
-                logger.warning(f"无法读取图片 {photo.path}: {e}")
-
-        if skipped > 0:
-            logger.info(f"ℹ️  批次 {batch.batch_id} 跳过 {skipped} 个不支持的文件")
+        images = self._load_images(batch, handles)
 
+        failed = False
         if len(images) == 0:
             logger.warning(f"⚠️  批次 {batch.batch_id} 没有有效图片")
             raw_output = "该批次没有有效的图片可供分析"
         else:
-            # 生成提示词
-            prompt = self._create_prompt(batch)
-
-            # 调用 Gemini Flash
+            # 调用 Gemini Flash（经调度器限流与重试；图片上传一次，重试时只重发文件引用）
+            parts = await self.file_store.image_parts(images)
             try:
-                response = await asyncio.to_thread(
-                    self.model.generate_content,
-                    [prompt] + images
+                response = await self.gemini_pool.generate(
+                    self.model_name, [prompt] + parts, generation_config=PHASE1_GENERATION_CONFIG
                 )
                 raw_output = response.text
             except Exception as e:
                 logger.error(f"批次 {batch.batch_id} 分析失败: {e}")
+                self.file_store.forget(parts)
                 raw_output = f"分析失败: {str(e)}"
+                failed = True
 
-        # 构建结果
-        result = Phase1Result(
-            batch_id=batch.batch_id,
-            processed_at=datetime.now().isoformat(),
-            image_count=batch.image_count,
-            time_range=(
-                batch.time_range[0].isoformat(),
-                batch.time_range[1].isoformat()
-            ),
-            raw_vlm_output=raw_output
-        )
+        result = self._build_result(batch, raw_output, failed)
 
-        # 保存到缓存
-        self._save_to_cache(result)
+        # 保存到缓存（失败的批次下次运行时重新分析）
+        if not failed:
+            self._save_to_cache(result, digest)
 
         return result
 
-    async def analyze_all_batches(
+    def _load_batch_job_state(self) -> Optional[Dict[str, Any]]:
+        if not self.batch_job_path.exists():
+            return None
+        try:
+            with open(self.batch_job_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ 批处理任务状态文件损坏，重新提交: {e}")
+            return None
+
+    async def _save_batch_job_state(self, state: Dict[str, Any]):
+        tmp_path = self.batch_job_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.batch_job_path)
+
+    async def analyze_with_batch_api(
         self,
         batches: List[Batch],
         max_concurrency: int = 3
     ) -> List[Phase1Result]:
-        """并发分析所有批次"""
-        logger.info(f"🚀 开始 Phase 1 分析，共 {len(batches)} 个批次")
+        """
+        以 Batch API 任务分析所有批次（半价，非实时）
 
-        # 使用信号量控制并发数
-        semaphore = asyncio.Semaphore(max_concurrency)
+        未命中缓存的批次写成一个 JSONL 任务（key 为批次内容摘要）提交并轮询，
+        任务状态保存在 cache/phase1_batch_job.json，中断后重新运行会继续同一
+        任务（不再重新读取、上传图片）；任务失败或结果无效的批次改为实时分析，
+        等待超时时保留任务状态供下次继续。
+        """
+        results: List[Optional[Phase1Result]] = []
+        pending = []
+        for batch in batches:
+            prompt = self._create_prompt(batch)
+            handles = self._open_batch(batch)
+            digest = self._batch_digest(batch, prompt, handles)
+            cached = self._load_from_cache(batch, digest)
+            if cached:
+                self.cache_hits += 1
+                results.append(cached)
+                continue
+            self.cache_misses += 1
+            results.append(None)
+            pending.append((len(results) - 1, batch, prompt, digest, handles))
+
+        state = self._load_batch_job_state() if pending else None
+        if can_resume(state, self.model_name, [item[3] for item in pending]):
+            requests = {item[3]: None for item in pending}
+        else:
+            requests = {}
+            for item in list(pending):
+                index, batch, prompt, digest, handles = item
+                images = self._load_images(batch, handles)
+                if not images:
+                    logger.warning(f"⚠️  批次 {batch.batch_id} 没有有效图片")
+                    results[index] = self._build_result(batch, "该批次没有有效的图片可供分析")
+                    pending.remove(item)
+                    continue
+                requests[digest] = build_request(
+                    [prompt] + await self.file_store.image_parts(images, min_ttl=BATCH_MIN_TTL),
+                    PHASE1_GENERATION_CONFIG,
+                )
 
-        async def process_with_semaphore(batch):
-            async with semaphore:
-                return await self.analyze_batch(batch)
+        responses = {}
+        job_pending = False
+        if requests:
+            logger.info(f"📮 提交 Phase 1 批处理任务，共 {len(requests)} 个批次")
+            try:
+                responses = await run_batch_job(
+                    GeminiBatchClient(),
+                    self.model_name,
+                    requests,
+                    state,
+                    self._save_batch_job_state,
+                    display_name="memory-profiler-phase1",
+                )
+            except GeminiBatchTimeout as e:
+                # 任务可能仍在运行，保留任务状态，下次运行时继续该任务
+                job_pending = True
+                logger.error(f"❌ 批处理任务等待超时，本次改为实时分析: {e}")
+            except GeminiBatchError as e:
+                logger.error(f"❌ 批处理任务失败，改为实时分析: {e}")
+
+        fallback = []
+        for index, batch, prompt, digest, handles in pending:
+            response = responses.get(digest)
+            if response is None or response["error"]:
+                fallback.append((index, batch, prompt, digest, handles))
+                continue
+            result = self._build_result(batch, response["text"])
+            self._save_to_cache(result, digest)
+            results[index] = result
+
+        if fallback:
+            logger.info(f"🔁 {len(fallback)} 个批次改为实时分析")
+            semaphore = asyncio.Semaphore(max_concurrency)
+
+            async def analyze_realtime(index, batch, prompt, digest, handles):
+                async with semaphore:
+                    results[index] = await self._analyze_uncached(batch, prompt, digest, handles)
+
+            await asyncio.gather(*[analyze_realtime(*item) for item in fallback])
+
+        if not job_pending:
+            self.batch_job_path.unlink(missing_ok=True)
+        return results
 
-        # 并发处理
-        results = await asyncio.gather(
-            *[process_with_semaphore(batch) for batch in batches]
-        )
+    async def analyze_all_batches(
+        self,
+        batches: List[Batch],
+        max_concurrency: int = 3,
+        use_batch_api: bool = False
+    ) -> List[Phase1Result]:
+        """并发分析所有批次（use_batch_api 时以 Batch API 任务提交）"""
+        logger.info(f"🚀 开始 Phase 1 分析，共 {len(batches)} 个批次")
 
-        logger.info(f"✅ Phase 1 完成，分析 {len(results)} 个批次")
+        if use_batch_api:
+            results = await self.analyze_with_batch_api(batches, max_concurrency)
+        else:
+            # 使用信号量控制并发数
+            semaphore = asyncio.Semaphore(max_concurrency)
+
+            async def process_with_semaphore(batch):
+                async with semaphore:
+                    return await self.analyze_batch(batch)
+
+            # 并发处理
+            results = await asyncio.gather(
+                *[process_with_semaphore(batch) for batch in batches]
+            )
+
+        self._prune_cache()
+
+        metrics = get_gemini_scheduler(self.model_name).snapshot()
+        lookups = self.cache_hits + self.cache_misses
+        hit_rate = self.cache_hits / lookups if lookups else 0.0
+        logger.info(f"✅ Phase 1 完成，分析 {len(results)} 个批次，"
+                   f"失败 {sum(1 for r in results if r.failed)} 个")
+        logger.info(f"🗂️ 缓存命中 {self.cache_hits}/{lookups}（命中率 {hit_rate:.0%}）")
+        self.file_store.save()
+        file_stats = self.file_store.stats
+        logger.info(f"📤 图片上传 {file_stats['uploaded']} 张（{file_stats['uploaded_bytes'] / 1e6:.1f} MB），"
+                   f"复用已上传 {file_stats['reused']} 张，内联 {file_stats['inline']} 张")
+        logger.info(f"📈 Gemini 调用 {metrics['calls']} 次，重试 {metrics['retries']} 次，"
+                   f"平均排队 {metrics['avg_queued_time']:.1f} 秒，平均调用 {metrics['avg_call_time']:.1f} 秒")
         return results
 
 # ==================== Phase 2: Reduce - 深度人格画像 ====================
@@ -437,7 +638,8 @@ class Phase2Analyzer:
     """使用 Gemini Pro 深度分析生成六维人格画像"""
 
     def __init__(self):
-        self.model = genai.GenerativeModel('models/gemini-2.5-pro')
+        self.model_name = 'models/gemini-2.5-pro'
+        self.gemini_pool = get_gemini_client_pool()
 
     def _create_prompt(self, phase1_results: List[Phase1Result]) -> str:
         """生成 Phase 2 提示词（深度人格分析）"""
@@ -448,9 +650,9 @@ class Phase2Analyzer:
             for r in sorted(phase1_results, key=lambda x: x.batch_id)
         ])
 
-        # 汇总所有客观描述
+        # 汇总所有客观描述（结构化结果按维度合并为紧凑文本）
         all_observations = "\n\n".join([
-            f"## {r.batch_id}\n{r.raw_vlm_output}"
+            f"## {r.batch_id}\n{compact_phase1(r.structured) if r.structured else r.raw_vlm_output}"
             for r in sorted(phase1_results, key=lambda x: x.batch_id)
         ])
 
@@ -523,10 +725,17 @@ class Phase2Analyzer:
         """执行 Phase 2 深度分析"""
         logger.info("🧠 开始 Phase 2 深度人格分析...")
 
+        failed = [r.batch_id for r in phase1_results if r.failed]
+        if failed:
+            logger.warning(f"⚠️  跳过 {len(failed)} 个分析失败的批次: {failed}")
+        phase1_results = [r for r in phase1_results if not r.failed]
+        if not phase1_results:
+            return {"error": "没有可用的 Phase 1 结果"}
+
         prompt = self._create_prompt(phase1_results)
 
         try:
-            response = self.model.generate_content(prompt)
+            response = asyncio.run(self.gemini_pool.generate(self.model_name, prompt))
             raw_json = response.text.strip()
 
             # 提取 JSON（去除可能的 markdown 代码块标记）
@@ -565,27 +774,18 @@ class MemoryProfiler:
         """扫描所有照片"""
         logger.info(f"📁 扫描照片目录: {self.photo_dir}")
 
-        # 支持的图片格式（排除 .mpo 等 Gemini 不支持的格式）
-        extensions = {'.jpg', '.jpeg', '.png', '.heic', '.webp'}
+        # 支持的图片格式（MPO、HEIC 在分析时于内存中转码，无需预先转换）
+        extensions = {'.jpg', '.jpeg', '.png', '.webp', '.mpo'}
+        if HEIF_AVAILABLE:
+            extensions |= {'.heic', '.heif'}
 
-        # 排除的格式（Gemini API 不支持）
-        excluded_extensions = {'.mpo'}
-
-        photos = []
-        for ext in extensions:
-            for photo_path in self.photo_dir.glob(f"**/*{ext}"):
-                photos.append(str(photo_path))
-
-        # 排除不支持的格式
-        filtered_photos = []
-        for photo in photos:
-            ext = Path(photo).suffix.lower()
-            if ext not in excluded_extensions:
-                filtered_photos.append(photo)
-            else:
-                logger.warning(f"⚠️ 跳过不支持的格式: {photo}")
+        # 扩展名不区分大小写（iPhone 导出为 .HEIC / .JPG）
+        filtered_photos = [
+            str(photo_path) for photo_path in self.photo_dir.rglob("*")
+            if photo_path.suffix.lower() in extensions and photo_path.is_file()
+        ]
 
-        logger.info(f"📸 发现 {len(filtered_photos)} 张照片（已过滤不支持的格式）")
+        logger.info(f"📸 发现 {len(filtered_photos)} 张照片")
 
         # 并发提取 EXIF
         with ThreadPoolExecutor(max_workers=10) as executor:
@@ -600,12 +800,13 @@ class MemoryProfiler:
 
         return photos_metadata
 
-    def run(self, phase2_only: bool = False) -> Dict[str, Any]:
+    def run(self, phase2_only: bool = False, phase1_batch: bool = False) -> Dict[str, Any]:
         """
         运行完整分析流程
 
         Args:
             phase2_only: 如果为 True，跳过 Phase 1，直接从缓存加载并运行 Phase 2
+            phase1_batch: 如果为 True，Phase 1 以 Batch API 任务提交（半价，需等待任务完成）
         """
         # Phase 0: 扫描照片
         photos = self.scan_photos()
@@ -618,7 +819,9 @@ class MemoryProfiler:
         # Phase 1: Map - 客观事实提取
         if not phase2_only:
             phase1_analyzer = Phase1Analyzer()
-            phase1_results = asyncio.run(phase1_analyzer.analyze_all_batches(batches))
+            phase1_results = asyncio.run(
+                phase1_analyzer.analyze_all_batches(batches, use_batch_api=phase1_batch)
+            )
 
             # 保存 Phase 1 结果汇总
             summary_path = self.cache_dir / "phase1_summary.json"
@@ -659,11 +862,14 @@ def main():
     parser.add_argument('photo_dir', help='照片目录路径')
     parser.add_argument('--phase2-only', action='store_true',
                        help='仅运行 Phase 2（从缓存加载 Phase 1 结果）')
+    parser.add_argument('--phase1-batch', action='store_true',
+                       default=os.getenv("PHASE1_MODE") == "batch",
+                       help='Phase 1 以 Batch API 任务提交（半价，非实时；中断后重新运行会继续同一任务）')
 
     args = parser.parse_args()
 
     profiler = MemoryProfiler(args.photo_dir)
-    result = profiler.run(phase2_only=args.phase2_only)
+    result = profiler.run(phase2_only=args.phase2_only, phase1_batch=args.phase1_batch)
 
     # 打印摘要
     print("\n" + "="*70)
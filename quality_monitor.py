@@ -20,27 +20,35 @@ class QualityMonitor:
         self.report_dir = Path("cache/reports")
         self.report_dir.mkdir(parents=True, exist_ok=True)
 
-    def check_batch_quality(self, batch_id: str) -> dict:
-        """检查单个批次的质量"""
-        cache_path = self.cache_dir / f"batch_{batch_id}.json"
-
-        if not cache_path.exists():
-            return {"status": "pending", "reason": "批次尚未处理"}
-
-        with open(cache_path) as f:
+    def check_batch_quality(self, cache_path: Path) -> dict:
+        """检查单个批次的质量（缓存文件按批次内容摘要命名）"""
+        with open(cache_path, encoding='utf-8') as f:
             data = json.load(f)
 
         output = data['raw_vlm_output']
         output_len = len(output)
         photo_count = data['image_count']
+        structured = data.get('structured')
 
         # 质量标准
-        checks = {
-            "has_output": output_len > 200,
-            "not_failed": "分析失败" not in output and "不支持" not in output,
-            "has_protagonist_marker": "【主角】" in output or output_len > 500,
-            "meaningful_content": output_len > 1000  # 详细的描述应该有1000+字符
-        }
+        if structured:
+            # 结构化结果：逐张描述覆盖全部照片，并标注了主角
+            photos = structured.get('photos', [])
+            checks = {
+                "has_output": len(photos) > 0,
+                "not_failed": not data.get('failed'),
+                "has_protagonist_marker": any(
+                    p.get('protagonist_present') or '【主角】' in (p.get('people') or []) for p in photos
+                ),
+                "meaningful_content": len(photos) >= photo_count
+            }
+        else:
+            checks = {
+                "has_output": output_len > 200,
+                "not_failed": "分析失败" not in output and "不支持" not in output,
+                "has_protagonist_marker": "【主角】" in output or output_len > 500,
+                "meaningful_content": output_len > 1000  # 详细的描述应该有1000+字符
+            }
 
         # 判断总体质量
         if all(checks.values()):
@@ -50,13 +58,15 @@ class QualityMonitor:
         else:
             quality = "failed"  # 失败
 
+        preview = (structured or {}).get('batch_summary') or output[:200]
         return {
-            "batch_id": batch_id,
+            "batch_id": data.get('batch_id', cache_path.stem),
             "quality": quality,
             "photo_count": photo_count,
             "output_length": output_len,
+            "structured": bool(structured),
             "checks": checks,
-            "preview": output[:200] if output_len > 0 else ""
+            "preview": preview
         }
 
     def generate_report(self) -> dict:
@@ -74,8 +84,7 @@ class QualityMonitor:
         }
 
         for batch_file in batch_files:
-            batch_id = batch_file.stem.replace("batch_", "")
-            quality = self.check_batch_quality(batch_id)
+            quality = self.check_batch_quality(batch_file)
 
             results["batches"].append(quality)
             results[quality["quality"]] += 1